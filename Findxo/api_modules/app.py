@@ -5,6 +5,7 @@ from fastapi import FastAPI, Request, HTTPException, status
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
+from .common.compression import CompressionMiddleware
 import time
 
 # Setup Logging
@@ -43,6 +44,8 @@ app.add_middleware(
 )
 
 app.add_middleware(LoggingMiddleware)
+# Outermost, so X-Process-Time and CORS headers are set before the body is compressed
+app.add_middleware(CompressionMiddleware)
 
 # Global Exception Handler
 @app.exception_handler(Exception)
@@ -58,6 +61,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     return JSONResponse(
         status_code=exc.status_code,
         content={"detail": exc.detail},
+        headers=getattr(exc, "headers", None),
     )
 
 # Import and include routers
@@ -80,6 +84,14 @@ async def health():
         "version": "2.0.0"
     }
 
+@app.get("/ready")
+async def ready():
+    """
+    Readiness check: 503 until the scraper warm-up has finished
+    """
+    body = {"status": "ready" if warmup_state.ready else "not ready", "warmup": warmup_state.snapshot()}
+    return JSONResponse(status_code=200 if warmup_state.ready else 503, content=body)
+
 # Proxy to frontend for all other routes
 import httpx
 from fastapi.responses import StreamingResponse
@@ -87,7 +99,7 @@ from fastapi.responses import StreamingResponse
 @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "HEAD", "PATCH"])
 async def proxy_frontend(request: Request, path: str):
     # Skip proxying for API routes and docs
-    if path.startswith(("v1/", "docs", "redoc", "openapi.json", "health")):
+    if path.startswith(("v1/", "docs", "redoc", "openapi.json", "health", "ready")):
         raise HTTPException(status_code=404)
 
     frontend_url = os.getenv("FRONTEND_URL", "http://localhost:3000")
@@ -133,11 +145,31 @@ async def db_session_middleware(request: Request, call_next):
         close_old_connections()
     return response
 
+from .common.loop_monitor import loop_lag_monitor
+from .dark_api.extraction import get_extraction_executor, shutdown_extraction_executor
+from .dark_api.tor_pool import shutdown_tor_pool
+from .dark_api.browser import shutdown_browser_manager
+from .dark_api.warmup import start_warm_up, stop_warm_up, warmup_state
+from .dark_api.jobs import shutdown_job_manager
+from .dark_api.usage import usage_buffer
+
 @app.on_event("startup")
 async def startup_event():
     logger.info("Initializing Findxo Cyber Intelligence API...")
-    # Add any startup logic here (e.g. pre-warming Tor circuits)
+    loop_lag_monitor.start()
+    get_extraction_executor().start()
+    usage_buffer.start()
+    # Tor circuits, browser and engine connections warm up in the background; see /ready
+    start_warm_up()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down Findxo Cyber Intelligence API...")
+    await loop_lag_monitor.stop()
+    await stop_warm_up()
+    await shutdown_job_manager()
+    await shutdown_browser_manager()
+    shutdown_extraction_executor()
+    await shutdown_tor_pool()
+    # Last: cancelled jobs above may still have recorded usage
+    await usage_buffer.stop()
@@ -0,0 +1,123 @@
+"""
+Negotiated response compression.
+
+Bodies of at least COMPRESS_MIN_BYTES with a compressible content type are
+sent brotli- or gzip-encoded, whichever the client's Accept-Encoding prefers
+(brotli only when the `brotli` package is installed). Only responses with a
+content-length are compressed; their body is collected first, since it may
+arrive in several messages. Streaming responses (NDJSON/SSE, the frontend
+proxy) have none and pass through untouched, so they are never buffered.
+Large bodies are compressed in a worker thread to keep the event loop free.
+"""
+
+import os
+import gzip
+import asyncio
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "5"))
+# Bodies above this are compressed off the event loop
+COMPRESS_THREAD_BYTES = int(os.getenv("COMPRESS_THREAD_BYTES", "262144"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """Highest-q supported coding from an Accept-Encoding header; brotli wins ties."""
+    supported = ("br", "gzip") if BROTLI_AVAILABLE else ("gzip",)
+    best, best_q = None, 0.0
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        candidates = supported if name == "*" else (name,) if name in supported else ()
+        for coding in candidates:
+            if q > best_q or (q == best_q and best is not None and
+                              supported.index(coding) < supported.index(best)):
+                best, best_q = coding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None or scope.get("method") == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+        chunks = []
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                resp_headers = {k.lower(): v for k, v in message.get("headers", [])}
+                ctype = resp_headers.get(b"content-type", b"").decode("latin-1")
+                length = resp_headers.get(b"content-length")
+                # Only complete bodies of known size are buffered: streamed responses
+                # (NDJSON/SSE, the frontend proxy) carry no content-length. A body may
+                # still arrive in several messages, e.g. re-sent by BaseHTTPMiddleware.
+                if (length is None or not length.isdigit() or int(length) < self.minimum_size
+                        or b"content-encoding" in resp_headers
+                        or not ctype.startswith(COMPRESSIBLE_TYPES)
+                        or ctype.startswith("text/event-stream")):
+                    passthrough = True
+                    await send(message)
+                    return
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body"):
+                return
+            body = b"".join(chunks)
+            chunks.clear()
+            pending, start = start, None
+            if len(body) > COMPRESS_THREAD_BYTES:
+                body = await asyncio.to_thread(compress, body, encoding)
+            else:
+                body = compress(body, encoding)
+            resp_headers = {k.lower(): v for k, v in pending.get("headers", [])}
+            headers_out = [(k, v) for k, v in pending.get("headers", [])
+                           if k.lower() not in (b"content-length", b"vary")]
+            vary = resp_headers.get(b"vary")
+            headers_out += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(body)).encode()),
+                (b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"),
+            ]
+            await send(dict(pending, headers=headers_out))
+            await send({"type": "http.response.body", "body": body, "more_body": False})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,38 @@
+"""
+JSON encoding for API responses and stored reports.
+
+orjson serializes the large, deeply nested report dicts several times faster
+than the stdlib encoder and yields bytes directly; without it the stdlib
+encoder is used with the same output semantics (unknown types as str).
+"""
+
+import json
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def _default(obj):
+    return str(obj)
+
+
+def dumps(obj, indent: bool = False) -> bytes:
+    if ORJSON_AVAILABLE:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=option)
+    return json.dumps(obj, default=_default, ensure_ascii=False, indent=2 if indent else None,
+                      separators=None if indent else (",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with `dumps`; return it directly to skip response_model re-validation."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
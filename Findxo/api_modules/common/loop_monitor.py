@@ -0,0 +1,52 @@
+import asyncio
+import time
+from collections import deque
+from typing import Optional
+
+
+class LoopLagMonitor:
+    """
+    Measures event-loop lag: how late a periodic sleep wakes up compared with
+    when it was scheduled. Sustained lag means something is blocking the loop.
+    """
+
+    def __init__(self, interval: float = 0.1, samples: int = 600):
+        self.interval = interval
+        self._samples = deque(maxlen=samples)
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self._samples.append(max(0.0, time.perf_counter() - start - self.interval))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def reset(self):
+        self._samples.clear()
+
+    def snapshot(self) -> dict:
+        data = sorted(self._samples)
+        if not data:
+            return {"samples": 0, "mean_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+        return {
+            "samples": len(data),
+            "mean_ms": round(sum(data) / len(data) * 1000, 2),
+            "p95_ms": round(data[min(len(data) - 1, int(len(data) * 0.95))] * 1000, 2),
+            "max_ms": round(data[-1] * 1000, 2),
+        }
+
+
+loop_lag_monitor = LoopLagMonitor()
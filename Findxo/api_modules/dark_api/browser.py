@@ -0,0 +1,82 @@
+"""
+Shared headless Chromium for page scrapes.
+
+Launching a browser per page costs about a second before any Tor traffic
+starts. One browser is launched (at warm-up or on first use) and kept; each
+page gets its own context, which carries the page's SOCKS proxy, so pages
+stay isolated from each other. A crashed browser is relaunched on next use.
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger("dark_scraper")
+
+# Playwright (async)
+try:
+    from playwright.async_api import async_playwright
+except (ImportError, RuntimeError):
+    from .dummy_playwright import async_playwright
+
+BROWSER_ARGS = ["--no-sandbox", "--disable-dev-shm-usage"]
+
+
+class BrowserManager:
+    def __init__(self):
+        self.launches = 0
+        self._playwright = None
+        self._browser = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._browser is not None and self._browser.is_connected()
+
+    async def get(self):
+        if self.running:
+            return self._browser
+        async with self._lock:
+            if self.running:
+                return self._browser
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            # Every context sets its own proxy; this placeholder makes a context
+            # that forgot one fail instead of reaching the clearnet directly
+            self._browser = await self._playwright.chromium.launch(
+                headless=True, proxy={"server": "socks5://per-context"}, args=BROWSER_ARGS
+            )
+            self.launches += 1
+            logger.info("Shared Chromium launched")
+            return self._browser
+
+    async def close(self):
+        async with self._lock:
+            if self._browser is not None:
+                try:
+                    await self._browser.close()
+                except Exception:
+                    pass
+                self._browser = None
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+
+    def stats(self) -> dict:
+        return {"running": self.running, "launches": self.launches}
+
+
+_manager = None
+
+
+def get_browser_manager() -> BrowserManager:
+    global _manager
+    if _manager is None:
+        _manager = BrowserManager()
+    return _manager
+
+
+async def shutdown_browser_manager():
+    global _manager
+    if _manager is not None:
+        await _manager.close()
+        _manager = None
@@ -3,6 +3,10 @@ class AsyncPlaywright:
         return self
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         pass
+    async def start(self):
+        return self
+    async def stop(self):
+        pass
     @property
     def chromium(self):
         return self
@@ -0,0 +1,268 @@
+"""
+Off-loop page extraction.
+
+BeautifulSoup parsing, the entity regexes, keyword context search and language
+detection are CPU bound and would otherwise run on the event loop that also
+serves API traffic.
+`ExtractionExecutor` ships a page payload to a process pool and returns the
+structured fields that `scrape_onion_page` merges into its meta.
+"""
+
+import os
+import asyncio
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger("dark_scraper")
+
+# 0 runs extraction in a worker thread instead of a process pool
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Seconds one page may spend in extraction before its worker is killed
+EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", "60"))
+
+
+class ExtractionTimeout(Exception):
+    pass
+
+
+def _read_chunks(path: str, chunk_chars: int):
+    with open(path, encoding="utf-8", errors="replace") as fh:
+        while True:
+            chunk = fh.read(chunk_chars)
+            if not chunk:
+                return
+            yield chunk
+
+
+def process_page_streaming(payload: dict) -> dict:
+    """
+    Extraction for pages spooled to disk by `spool_page_source`. Entities, links
+    and keyword contexts are computed over overlapping chunks, so memory is
+    bounded by the chunk size. Title and meta tags are parsed from the <head>
+    within the first HTML chunk only.
+    """
+    from .language import StreamingLanguageSample, detect_language
+    from .ranking import StreamingTermStats, query_terms
+    from .scraper import (
+        STREAM_CHUNK_CHARS, StreamingEntityExtractor, StreamingKeywordContext,
+        StreamingLinkExtractor, extract_meta_from_html, html_head,
+    )
+
+    entities = StreamingEntityExtractor()
+    contexts = StreamingKeywordContext(payload.get("keyword") or "",
+                                       offsets=payload.get("context_offsets", False))
+    stats = StreamingTermStats(query_terms(contexts.keyword))
+    language = StreamingLanguageSample()
+    for chunk in _read_chunks(payload["text_path"], STREAM_CHUNK_CHARS):
+        language.feed(chunk)
+        entities.feed(chunk)
+        contexts.feed(chunk)
+        stats.feed(chunk)
+    contexts.feed("", final=True)
+    stats.feed("", final=True)
+    entities.feed("\n")
+    links = StreamingLinkExtractor(base_url=payload.get("url", ""))
+    head = None
+    for chunk in _read_chunks(payload["html_path"], STREAM_CHUNK_CHARS):
+        if head is None:
+            head = html_head(chunk)
+        entities.feed(chunk)
+        links.feed(chunk)
+    entities.feed("", final=True)
+    links.feed("", final=True)
+
+    result = extract_meta_from_html(head or "", base_url=payload.get("url", ""))
+    result["links"] = links.result()
+    result["entities"] = entities.result()
+    sample, key = language.result()
+    result["language"] = detect_language(sample, key=key)
+    if contexts.keyword:
+        result["keywords_found"] = contexts.result()
+        result["term_stats"] = stats.result()
+    return result
+
+
+def process_page(payload: dict) -> dict:
+    """
+    Run all CPU-heavy extraction for one page. Must stay a picklable top-level
+    function: it is executed inside the process pool.
+    """
+    if "html_path" in payload:
+        return process_page_streaming(payload)
+
+    from .language import detect_language
+    from .ranking import query_terms, term_stats
+    from .scraper import extract_meta_from_html, extract_entities, find_keyword_context
+
+    html = payload.get("html") or ""
+    text = payload.get("text") or ""
+    keyword = payload.get("keyword") or ""
+
+    result = extract_meta_from_html(html, base_url=payload.get("url", ""))
+    result["entities"] = extract_entities(text + "\n" + html)
+    result["language"] = detect_language(text)
+    if keyword:
+        result["keywords_found"] = find_keyword_context(
+            text, keyword, offsets=payload.get("context_offsets", False)
+        )
+        result["term_stats"] = term_stats(text, query_terms(keyword))
+    return result
+
+
+class _Worker:
+    """One extraction process. Each runs one page at a time, so a hung page can be killed alone."""
+
+    def __init__(self, mp_context):
+        self.pool = ProcessPoolExecutor(max_workers=1, mp_context=mp_context)
+
+    def kill(self):
+        # ProcessPoolExecutor has no public way to stop a running task
+        for proc in list((self.pool._processes or {}).values()):
+            proc.terminate()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ExtractionExecutor:
+    """
+    Pool of extraction processes, created lazily on first use. A page that
+    exceeds the timeout (or crashes its process) only costs the process it ran
+    in, which is replaced; pages of other searches keep running.
+    """
+
+    def __init__(self, workers: int = EXTRACTION_WORKERS, timeout: float = EXTRACTION_TIMEOUT):
+        self.workers = max(0, workers)
+        self.timeout = timeout
+        self.recycled = 0
+        self._idle = None
+        self._waiters = deque()
+        self._warming = set()
+        # spawn: forking a process that already runs an event loop and threads is unsafe
+        self._mp_context = multiprocessing.get_context("spawn")
+
+    def start(self):
+        if self.workers and self._idle is None:
+            self._idle = [_Worker(self._mp_context) for _ in range(self.workers)]
+            logger.info(f"Extraction pool started with {self.workers} workers")
+        return self
+
+    async def warm_up(self):
+        """Spawn every worker and import the extraction code before the first page arrives."""
+        if not self.workers:
+            return
+        self.start()
+        await asyncio.gather(*(self._warm(worker) for worker in list(self._idle)))
+
+    async def _warm(self, worker: _Worker):
+        await asyncio.get_running_loop().run_in_executor(
+            worker.pool, process_page, {"html": "<p></p>", "text": "x"}
+        )
+
+    def _wake(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    async def _checkout(self) -> _Worker:
+        while not self._idle:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Woken just as the caller went away: pass the turn on
+                    self._wake()
+                raise
+        return self._idle.pop()
+
+    def _checkin(self, worker: _Worker):
+        if self._idle is None:
+            # Shut down meanwhile
+            worker.pool.shutdown(wait=False, cancel_futures=True)
+            return
+        self._idle.append(worker)
+        self._wake()
+
+    async def extract(self, payload: dict) -> dict:
+        if not self.workers:
+            # A thread cannot be killed; the timeout only frees the caller
+            try:
+                return await asyncio.wait_for(asyncio.to_thread(process_page, payload), self.timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Extraction of {payload.get('url')} exceeded {self.timeout}s")
+                raise ExtractionTimeout(f"Extraction exceeded {self.timeout}s")
+
+        self.start()
+        # Waiting for a free worker does not count towards the page's timeout
+        worker = await self._checkout()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(worker.pool, process_page, payload)
+            try:
+                return await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Extraction of {payload.get('url')} exceeded {self.timeout}s")
+                self._replace(worker)
+                worker = None
+                raise ExtractionTimeout(f"Extraction exceeded {self.timeout}s")
+            except BrokenProcessPool:
+                logger.error(f"Extraction worker died on {payload.get('url')}")
+                self._replace(worker)
+                worker = None
+                raise
+        finally:
+            if worker is not None:
+                self._checkin(worker)
+
+    def _replace(self, worker: _Worker):
+        """
+        Kill the worker so a pathological page cannot keep pinning it. A fresh
+        one joins the pool once it has started and imported the extraction code.
+        """
+        worker.kill()
+        self.recycled += 1
+        task = asyncio.get_running_loop().create_task(self._warm_and_checkin(_Worker(self._mp_context)))
+        self._warming.add(task)
+        task.add_done_callback(self._warming.discard)
+
+    async def _warm_and_checkin(self, worker: _Worker):
+        try:
+            await self._warm(worker)
+        except Exception as e:
+            logger.error(f"Replacement extraction worker failed to start: {e}")
+        finally:
+            self._checkin(worker)
+
+    def shutdown(self):
+        if self._idle is not None:
+            # Busy workers are shut down when their page is checked back in
+            for worker in self._idle:
+                worker.pool.shutdown(wait=False, cancel_futures=True)
+            self._idle = None
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "mode": "process" if self.workers else "thread",
+                "running": self._idle is not None,
+                "busy": self.workers - len(self._idle) if self._idle is not None else 0,
+                "timeout": self.timeout, "recycled": self.recycled}
+
+
+_executor = None
+
+
+def get_extraction_executor() -> ExtractionExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ExtractionExecutor()
+    return _executor
+
+
+def shutdown_extraction_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
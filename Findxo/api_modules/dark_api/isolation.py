@@ -0,0 +1,156 @@
+"""
+Tor stream isolation through SOCKS credentials.
+
+Tor's SocksPort has IsolateSOCKSAuth on by default: streams opened with
+different SOCKS username/password pairs never share a circuit. Giving each
+scrape session (or each page, when rotation is requested) its own credentials
+therefore replaces the process-wide NEWNYM and is safe with concurrent scrapes.
+
+requests can send SOCKS5 credentials itself. Chromium cannot (Playwright
+rejects a socks5 proxy with a username), so browsers are pointed at a local
+no-auth relay that performs the authenticated handshake with Tor for them.
+"""
+
+import time
+import asyncio
+import logging
+import secrets
+from urllib.parse import quote
+
+logger = logging.getLogger("dark_scraper")
+
+
+def new_isolation_tag(prefix: str = "findxo") -> str:
+    return f"{prefix}-{secrets.token_hex(8)}"
+
+
+def socks_credentials(tag: str):
+    # Tor keys isolation on the (username, password) pair; the password carries no secret
+    return tag, "isolate"
+
+
+def socks_proxy_url(socks: str, tag: str = "", scheme: str = "socks5h") -> str:
+    if not tag:
+        return f"{scheme}://{socks}"
+    user, password = socks_credentials(tag)
+    return f"{scheme}://{quote(user, safe='')}:{quote(password, safe='')}@{socks}"
+
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+
+class IsolatedSocksRelay:
+    """
+    Local SOCKS5 listener on an ephemeral port. Clients connect without auth;
+    every upstream connection to Tor authenticates with this relay's tag, and
+    the client's own CONNECT request is then passed through unchanged.
+    """
+
+    def __init__(self, upstream: str, tag: str):
+        host, port = upstream.rsplit(":", 1)
+        self.upstream = (host, int(port))
+        self.tag = tag
+        self.connections = 0
+        self.upstream_failures = 0
+        self._server = None
+
+    @property
+    def server(self) -> str:
+        """Proxy address for Playwright: socks5://127.0.0.1:<port>."""
+        port = self._server.sockets[0].getsockname()[1]
+        return f"socks5://127.0.0.1:{port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _upstream_handshake(self):
+        reader, writer = await asyncio.open_connection(*self.upstream)
+        user, password = (s.encode() for s in socks_credentials(self.tag))
+        writer.write(b"\x05\x01\x02")  # SOCKS5, one method: username/password
+        if await reader.readexactly(2) != b"\x05\x02":
+            writer.close()
+            raise ConnectionError("Tor refused SOCKS5 username/password auth")
+        writer.write(b"\x01" + bytes([len(user)]) + user + bytes([len(password)]) + password)
+        if (await reader.readexactly(2))[1] != 0:
+            writer.close()
+            raise ConnectionError("Tor rejected SOCKS5 credentials")
+        return reader, writer
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            version, n_methods = await reader.readexactly(2)
+            methods = await reader.readexactly(n_methods)
+            if version != 5 or 0 not in methods:
+                writer.write(b"\x05\xff")
+                writer.close()
+                return
+            up_reader, up_writer = await self._upstream_handshake()
+        except (ConnectionError, OSError, asyncio.IncompleteReadError) as e:
+            self.upstream_failures += 1
+            logger.debug(f"SOCKS relay handshake failed: {e}")
+            writer.close()
+            return
+        writer.write(b"\x05\x00")
+        await asyncio.gather(_pipe(reader, up_writer), _pipe(up_reader, writer))
+
+
+async def socks_connect(socks: str, host: str, port: int, tag: str = "", timeout: float = 60.0) -> float:
+    """
+    Open and close one stream to host:port through Tor with `tag`'s credentials.
+    For an onion this makes tor fetch the descriptor and build the rendezvous
+    circuit, which later streams with the same credentials reuse. Returns the
+    seconds the CONNECT took; raises ConnectionError on a SOCKS failure.
+    """
+    up_host, up_port = socks.rsplit(":", 1)
+    started = time.monotonic()
+
+    async def connect():
+        reader, writer = await asyncio.open_connection(up_host, int(up_port))
+        try:
+            if tag:
+                user, password = (s.encode() for s in socks_credentials(tag))
+                writer.write(b"\x05\x01\x02")
+                if await reader.readexactly(2) != b"\x05\x02":
+                    raise ConnectionError("SOCKS5 username/password auth refused")
+                writer.write(b"\x01" + bytes([len(user)]) + user + bytes([len(password)]) + password)
+                if (await reader.readexactly(2))[1] != 0:
+                    raise ConnectionError("SOCKS5 credentials rejected")
+            else:
+                writer.write(b"\x05\x01\x00")
+                if await reader.readexactly(2) != b"\x05\x00":
+                    raise ConnectionError("SOCKS5 no-auth refused")
+            name = host.encode("idna")
+            writer.write(b"\x05\x01\x00\x03" + bytes([len(name)]) + name + port.to_bytes(2, "big"))
+            reply = await reader.readexactly(4)
+            if reply[1] != 0:
+                raise ConnectionError(f"SOCKS5 CONNECT failed with code {reply[1]}")
+        finally:
+            writer.close()
+
+    await asyncio.wait_for(connect(), timeout)
+    return time.monotonic() - started
@@ -0,0 +1,301 @@
+"""
+Background jobs for dark searches.
+
+A scrape can run for many minutes, longer than clients and proxies keep a
+request open. Searches are submitted as jobs to a fixed pool of worker tasks;
+clients poll the job for status and progress and fetch the report when it is
+done. Finished jobs are kept for JOB_RETENTION seconds. The job outlives the
+request that submitted it, so a dropped connection no longer wastes the work.
+
+Identical searches submitted while one is queued or running are coalesced:
+the newcomer gets its own job (and id, owned by its own user) attached to the
+in-flight one, and receives the same events and report without a second
+discovery and scrape.
+
+Workers only bound how many jobs are in progress; the discovery and each page
+scrape of a job wait for a slot of the weighted fair scrape scheduler (see
+scheduler.py) under the job's user and plan tier.
+"""
+
+import os
+import re
+import time
+import uuid
+import asyncio
+import logging
+
+from . import scraper
+from .scheduler import scrape_scheduler
+
+logger = logging.getLogger("dark_api")
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+# Seconds a finished job (and its report) stays retrievable
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "3600"))
+JOB_MAX_STORED = int(os.getenv("JOB_MAX_STORED", "1000"))
+JOB_COALESCE = os.getenv("JOB_COALESCE", "1") == "1"
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+
+def coalesce_key(params: dict) -> tuple:
+    """
+    Searches with the same key produce the same report. Keyword matching and the
+    engines are case-insensitive; context_offsets and validate_entities change the
+    report's shape so they are part of the key, rotate only changes circuits.
+    """
+    keyword = re.sub(r"\s+", " ", params.get("keyword", "")).strip().casefold()
+    return (keyword, params.get("max_results"), params.get("depth"),
+            params.get("context_offsets"), params.get("validate_entities"))
+
+
+class Job:
+    def __init__(self, user_id, params: dict, reservation=None, slot=None, tier: str = "free"):
+        self.id = uuid.uuid4().hex
+        self.user_id = str(user_id)
+        self.params = params
+        # Plan tier of the user; sets the job's share of the scrape scheduler
+        self.tier = tier
+        # Quota reservation and concurrent-search slot taken when the search was accepted
+        self.reservation = reservation
+        self.slot = slot
+        self.status = "queued"
+        self.stage = "queued"
+        self.session_id = None
+        self.pages_total = None
+        self.pages_done = 0
+        self.report = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = asyncio.Event()
+        self.coalesced_with = None      # id of the job whose pipeline this one shares
+        self.followers = []
+        self._subscribers = []
+        # Events so far, replayed to late subscribers and coalesced followers
+        self._history = []
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def subscribe(self) -> asyncio.Queue:
+        """
+        Queue receiving this job's scrape events from now on, followed by
+        {"type": "end"} once the job has finished.
+        """
+        queue = asyncio.Queue()
+        if self.finished:
+            queue.put_nowait({"type": "end"})
+        else:
+            for event in self._history:
+                queue.put_nowait(event)
+            self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+    def _publish(self, event: dict):
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def handle_event(self, event: dict):
+        """Progress callback passed to run_dark_scrape."""
+        self._history.append(event)
+        self._publish(event)
+        for follower in self.followers:
+            follower.handle_event(event)
+        kind = event["type"]
+        if kind == "stage":
+            self.stage = event["stage"]
+            self.session_id = event.get("session_id", self.session_id)
+        elif kind == "links":
+            self.pages_total = event["total"]
+        elif kind == "result":
+            self.pages_done += 1
+
+    def follow(self, leader: "Job"):
+        """Share `leader`'s pipeline, catching up on the events it already sent."""
+        self.coalesced_with = leader.id
+        self.status, self.started_at = leader.status, leader.started_at
+        for event in leader._history:
+            self.handle_event(event)
+        leader.followers.append(self)
+
+    def settle_quota(self):
+        """Commit the reservation, or refund it if the search ended before any page was scraped."""
+        if self.reservation is None:
+            return
+        if self.status != "done" and self.pages_total is None:
+            self.reservation.refund()
+        else:
+            self.reservation.commit()
+
+    def release(self):
+        """Settle the quota and free the user's concurrent-search slot."""
+        self.settle_quota()
+        if self.slot is not None:
+            self.slot.release()
+
+    def finish(self, status: str, report: dict = None, error: str = None):
+        self.status = self.stage = status
+        self.report, self.error = report, error
+        self.finished_at = time.time()
+        self.release()
+        self.done.set()
+        self._publish({"type": "end"})
+        self._subscribers = []
+        self._history = []
+
+    def summary(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "keyword": self.params.get("keyword"),
+            "tier": self.tier,
+            "session_id": self.session_id,
+            "progress": {"stage": self.stage, "pages_done": self.pages_done, "pages_total": self.pages_total},
+            "error": self.error,
+            "coalesced_with": self.coalesced_with,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    def __init__(self, workers: int = JOB_WORKERS, runner=None, scheduler=None):
+        self.workers = max(1, workers)
+        # Looked up at call time so tests can patch scraper.run_dark_scrape
+        self.runner = runner or (lambda **kw: scraper.run_dark_scrape(**kw))
+        self.scheduler = scheduler or scrape_scheduler
+        self._jobs = {}
+        self._inflight = {}
+        self.coalesced = 0
+        self._queue = None
+        self._tasks = []
+
+    def _start(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            loop = asyncio.get_running_loop()
+            self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, user_id, params: dict, reservation=None, slot=None, tier: str = "free") -> Job:
+        self._start()
+        self._prune()
+        job = Job(user_id, params, reservation, slot, tier)
+        self._jobs[job.id] = job
+        key = coalesce_key(params)
+        leader = self._inflight.get(key) if JOB_COALESCE else None
+        if leader is not None:
+            job.follow(leader)
+            self.coalesced += 1
+            logger.info(f"Job {job.id} coalesced with in-flight job {leader.id}")
+            return job
+        self._inflight[key] = job
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str, user_id=None):
+        job = self._jobs.get(job_id)
+        # Another user's job is reported as missing, not forbidden
+        if job is None or (user_id is not None and job.user_id != str(user_id)):
+            return None
+        return job
+
+    async def wait(self, job: Job, timeout: float = None) -> bool:
+        """True once the job has finished, False if `timeout` seconds passed first."""
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job):
+        job.started_at = time.time()
+        for j in [job, *job.followers]:
+            j.status = j.stage = "running"
+            j.started_at = job.started_at
+        report, error = None, None
+        try:
+            # Coalesced followers ride along in the leader's share
+            gate = lambda: self.scheduler.slot(job.user_id, job.tier)
+            report = await self.runner(**job.params, on_event=job.handle_event, gate=gate)
+            if "error" in report:
+                report, error = None, report["error"]
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed")
+            error = str(e)
+        finally:
+            # Newcomers from here on start a fresh search
+            key = coalesce_key(job.params)
+            if self._inflight.get(key) is job:
+                del self._inflight[key]
+        status = "failed" if error is not None else "done"
+        for j in [job, *job.followers]:
+            # Followers share the leader's report object; readers must not mutate it
+            j.finish(status, report, error)
+        job.followers = []
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and now - job.finished_at > JOB_RETENTION:
+                del self._jobs[job_id]
+        if len(self._jobs) >= JOB_MAX_STORED:
+            finished = sorted((j for j in self._jobs.values() if j.finished), key=lambda j: j.finished_at)
+            for job in finished[:len(self._jobs) - JOB_MAX_STORED + 1]:
+                del self._jobs[job.id]
+
+    def stats(self) -> dict:
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        for job in self._jobs.values():
+            counts[job.status] += 1
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "in_flight": len(self._inflight),
+            "coalesced": self.coalesced,
+            "jobs": counts,
+        }
+
+    async def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for job in self._jobs.values():
+            if not job.finished:
+                # Cancelled mid-scrape is still charged; still queued or in discovery is not
+                job.release()
+        self._tasks = []
+        self._queue = None
+        self._inflight = {}
+
+
+_manager = None
+
+
+def get_job_manager() -> JobManager:
+    global _manager
+    if _manager is None:
+        _manager = JobManager()
+    return _manager
+
+
+async def shutdown_job_manager():
+    global _manager
+    if _manager is not None:
+        await _manager.shutdown()
+        _manager = None
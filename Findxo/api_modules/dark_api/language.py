@@ -0,0 +1,108 @@
+"""
+Language identification for scraped pages.
+
+langdetect is slow on long inputs and random unless seeded, so pages are
+identified from a bounded, evenly spaced sample of their visible text and the
+result is cached by a hash of the whole text. Spooled pages, read in chunks,
+build the same kind of sample with `StreamingLanguageSample`. Called from the
+extraction pool, never on the event loop.
+"""
+
+import os
+import hashlib
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger("dark_scraper")
+
+# Optional language detection
+try:
+    from langdetect import DetectorFactory, detect as detect_lang
+    from langdetect.lang_detect_exception import LangDetectException
+    DetectorFactory.seed = 0  # langdetect is probabilistic; a fixed seed makes it repeatable
+    LANGDETECT_AVAILABLE = True
+except Exception:
+    LANGDETECT_AVAILABLE = False
+
+LANG_SAMPLE_CHARS = int(os.getenv("LANG_SAMPLE_CHARS", "2000"))
+LANG_SAMPLE_SEGMENTS = 4
+LANG_CACHE_SIZE = int(os.getenv("LANG_CACHE_SIZE", "4096"))
+
+_cache = OrderedDict()
+
+
+def sample_text(text: str, max_chars: int = LANG_SAMPLE_CHARS, segments: int = LANG_SAMPLE_SEGMENTS) -> str:
+    """
+    Deterministic sample of at most `max_chars`: equal slices taken at evenly
+    spaced offsets, so boilerplate at the top of a page does not decide alone.
+    """
+    text = " ".join(text.split()) if len(text) <= 4 * max_chars else text
+    if len(text) <= max_chars:
+        return text
+    size = max_chars // segments
+    step = (len(text) - size) // max(1, segments - 1)
+    parts = [text[i * step:i * step + size] for i in range(segments)]
+    return " ".join(" ".join(p.split()) for p in parts)
+
+
+def content_key(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8", errors="replace")).hexdigest()
+
+
+class StreamingLanguageSample:
+    """
+    Language sample of text fed in chunks of unknown total count: one slice
+    per chunk is kept, and whenever twice `segments` slices are held every
+    other one is dropped and later chunks are taken half as often. The kept
+    slices stay evenly spread over the text in O(max_chars) memory; `result()`
+    returns the sample and the content hash that `detect_language` caches by.
+    """
+
+    def __init__(self, max_chars: int = LANG_SAMPLE_CHARS, segments: int = LANG_SAMPLE_SEGMENTS):
+        self.segments = max(1, segments)
+        self.size = max(1, max_chars // self.segments)
+        self.stride = 1
+        self.chunks = 0
+        self.slices = []
+        self._hash = hashlib.sha1()
+
+    def feed(self, chunk: str):
+        self._hash.update(chunk.encode("utf-8", errors="replace"))
+        if self.chunks % self.stride == 0:
+            self.slices.append(" ".join(chunk[:self.size].split()))
+            if len(self.slices) >= 2 * self.segments:
+                self.slices = self.slices[::2]
+                self.stride *= 2
+        self.chunks += 1
+
+    def result(self):
+        kept = self.slices
+        if len(kept) > self.segments:
+            step = (len(kept) - 1) / (self.segments - 1) if self.segments > 1 else 0
+            kept = [kept[round(i * step)] for i in range(self.segments)]
+        return " ".join(kept), self._hash.hexdigest()
+
+
+def detect_language(text: str, key: str = None):
+    """
+    Return an ISO 639-1 code (e.g. "en") or None when undetectable. `key` is
+    the content hash of the text `text` was sampled from, if not itself.
+    """
+    if not LANGDETECT_AVAILABLE or not text or not text.strip():
+        return None
+    key = key or content_key(text)
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+    sample = sample_text(text)
+    try:
+        lang = detect_lang(sample)
+    except LangDetectException:
+        lang = None
+    except Exception as e:
+        logger.debug(f"Language detection failed: {e}")
+        lang = None
+    _cache[key] = lang
+    if len(_cache) > LANG_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return lang
@@ -0,0 +1,118 @@
+"""
+Onion service prefetch for queued scrape targets.
+
+The first stream to an onion spends seconds on the descriptor fetch and the
+rendezvous circuit before any HTTP happens. While page N is scraped, a bare
+SOCKS connect is opened for the next few queued onions with the credentials
+(and tor instance) their own scrape will use, so their rendezvous circuit is
+already up when their turn comes. A prefetch only counts as warming its page
+when it had finished before that page's fetch began.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from urllib.parse import urlparse
+
+from .isolation import socks_connect
+from .telemetry import telemetry
+from .tor_pool import get_tor_pool
+
+logger = logging.getLogger("dark_scraper")
+
+# How many queued onions to prefetch ahead of the page being scraped (0 = off)
+PREFETCH_AHEAD = int(os.getenv("PREFETCH_AHEAD", "2"))
+PREFETCH_TIMEOUT = float(os.getenv("PREFETCH_TIMEOUT", "60"))
+
+
+class OnionPrefetcher:
+    def __init__(self, ahead: int = PREFETCH_AHEAD, timeout: float = PREFETCH_TIMEOUT):
+        self.ahead = max(0, ahead)
+        self.timeout = timeout
+        self._tasks = {}
+        self._socks = {}
+        self._results = {}
+        self._ready = {}            # url -> prefetch had succeeded when the page fetch began
+
+    def schedule(self, url: str, tag: str = ""):
+        if url in self._tasks:
+            return
+        parsed = urlparse(url)
+        if not (parsed.hostname or "").endswith(".onion"):
+            return
+        socks = get_tor_pool().select().socks
+        self._socks[url] = socks
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        self._tasks[url] = asyncio.get_running_loop().create_task(
+            self._run(url, socks, parsed.hostname, port, tag)
+        )
+
+    def schedule_ahead(self, urls: list, index: int, tag_for):
+        """Prefetch the `ahead` targets queued after `urls[index]`; `tag_for(i)` gives each one's isolation tag."""
+        for j in range(index + 1, min(len(urls), index + 1 + self.ahead)):
+            self.schedule(urls[j], tag_for(j))
+
+    async def _run(self, url: str, socks: str, host: str, port: int, tag: str):
+        started = time.monotonic()
+        try:
+            seconds = await socks_connect(socks, host, port, tag, timeout=self.timeout)
+            self._results[url] = {"ok": True, "connect_ms": round(seconds * 1000, 1)}
+        except (ConnectionError, OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            self._results[url] = {"ok": False, "error": str(e) or type(e).__name__}
+            logger.debug(f"Prefetch of {url} failed: {e}")
+        elapsed = round((time.monotonic() - started) * 1000, 1)
+        # Descriptor fetch + rendezvous: the circuit setup share of a cold page load
+        telemetry.record("prefetch", host, socks, ok=self._results[url]["ok"],
+                         connect_ms=self._results[url].get("connect_ms"), total_ms=elapsed)
+
+    def socks_for(self, url: str):
+        """Tor instance the target was prefetched through, so its scrape can reuse the circuit."""
+        return self._socks.get(url)
+
+    def fetch_started(self, url: str):
+        """Call right before the target's own page fetch."""
+        if url in self._tasks:
+            self._ready[url] = bool((self._results.get(url) or {}).get("ok"))
+
+    def status(self, url: str):
+        task = self._tasks.get(url)
+        if task is None:
+            return None
+        ready = self._ready.get(url, False)
+        if not task.done():
+            # Still connecting: the scrape's own stream joins tor's pending rendezvous
+            return {"ok": None, "pending": True, "ready": ready}
+        return {**self._results.get(url, {}), "ready": ready}
+
+    async def close(self):
+        pending = [t for t in self._tasks.values() if not t.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+def summarize_ttfb(results: list) -> dict:
+    """
+    Mean time-to-first-byte of pages whose prefetch finished before their fetch
+    against cold ones (no prefetch, or a failed one). Pages whose prefetch was
+    still connecting when the fetch began were only partly warmed and count as
+    neither.
+    """
+    groups = {"prefetched": [], "cold": []}
+    for res in results:
+        ttfb = (res.get("timing") or {}).get("ttfb_ms")
+        if ttfb is None:
+            continue
+        prefetch = res.get("prefetch")
+        if prefetch is None or prefetch.get("ok") is False:
+            groups["cold"].append(ttfb)
+        elif prefetch.get("ready"):
+            groups["prefetched"].append(ttfb)
+    summary = {
+        name: {"pages": len(vals), "mean_ttfb_ms": round(sum(vals) / len(vals), 1) if vals else None}
+        for name, vals in groups.items()
+    }
+    if summary["prefetched"]["pages"] and summary["cold"]["pages"]:
+        summary["gain_ms"] = round(summary["cold"]["mean_ttfb_ms"] - summary["prefetched"]["mean_ttfb_ms"], 1)
+    return summary
@@ -0,0 +1,87 @@
+"""
+Field projection and pagination for search reports.
+
+A result carries every outgoing link of the page and full PGP blocks, so a
+report easily runs to megabytes when the client only wants titles and
+entities. `project_report` builds the response from the fields asked for, a
+page of results and a page of each result's links; nothing else is copied or
+serialized. The stored report (and report.json) are left untouched, since a
+finished report may be shared by coalesced jobs.
+"""
+
+# Top-level result keys; "entities" also accepts one level of sub-keys, e.g. entities.emails
+RESULT_FIELDS = (
+    "url", "scraped_at", "ok", "error", "depth", "title", "meta_description", "meta_keywords",
+    "links", "entities", "language", "keywords_found", "relevance_score", "invalid_entities",
+    "extraction", "timing", "prefetch",
+)
+ENTITY_FIELDS = (
+    "emails", "pgp_keys", "btc_addresses", "eth_addresses", "xmr_addresses",
+    "phones", "ibans", "credit_cards",
+)
+
+
+def parse_fields(fields: str | None) -> dict | None:
+    """
+    "url,title,entities.emails" -> {"url": None, "title": None, "entities": {"emails"}}.
+    None (or empty) means every field. Raises ValueError on unknown names.
+    """
+    if not fields:
+        return None
+    spec = {}
+    for name in (f.strip() for f in fields.split(",")):
+        if not name:
+            continue
+        top, _, sub = name.partition(".")
+        if top not in RESULT_FIELDS:
+            raise ValueError(f"Unknown field: {top}")
+        if sub:
+            if top != "entities" or sub not in ENTITY_FIELDS:
+                raise ValueError(f"Unknown field: {name}")
+            if spec.get(top, set()) is not None:
+                spec.setdefault(top, set()).add(sub)
+        else:
+            # A whole field wins over any of its sub-keys
+            spec[top] = None
+    # url identifies a result, so it is always returned
+    spec.setdefault("url", None)
+    return spec
+
+
+def project_result(result: dict, spec: dict | None = None, links_offset: int = 0,
+                   links_limit: int | None = None) -> dict:
+    """Copy of `result` with only the fields in `spec` and one page of its links."""
+    if spec is None:
+        out = dict(result)
+    else:
+        out = {}
+        for key, subs in spec.items():
+            if key not in result:
+                continue
+            value = result[key]
+            if subs is not None and isinstance(value, dict):
+                value = {k: v for k, v in value.items() if k in subs}
+            out[key] = value
+    if "links" in out and (links_offset or links_limit is not None):
+        links = out["links"] or []
+        end = None if links_limit is None else links_offset + links_limit
+        out["links"] = links[links_offset:end]
+        out["links_total"] = len(links)
+    return out
+
+
+def project_report(report: dict, spec: dict | None = None, offset: int = 0, limit: int | None = None,
+                   links_offset: int = 0, links_limit: int | None = None) -> dict:
+    """Report with `results` cut to [offset, offset + limit) and each result projected."""
+    results = report.get("results") or []
+    end = None if limit is None else offset + limit
+    page = [project_result(r, spec, links_offset, links_limit) for r in results[offset:end]]
+    out = {k: v for k, v in report.items() if k != "results"}
+    out["results"] = page
+    out["pagination"] = {
+        "offset": offset,
+        "limit": limit,
+        "total": len(results),
+        "next_offset": offset + len(page) if offset + len(page) < len(results) else None,
+    }
+    return out
@@ -0,0 +1,126 @@
+"""
+Daily request quota with atomic reservations.
+
+Checking the daily usage and recording the request in separate steps lets a
+burst of concurrent requests all pass the check. `QuotaCounter.reserve`
+decides and takes the request in one step under a lock, in O(1) from an
+in-memory per-user count. A reservation is committed once the search has run
+(recorded through usage_buffer) or refunded if it failed before any page was
+scraped.
+
+Counts are seeded from the database (plus this process's unflushed usage)
+and re-synced every QUOTA_SYNC_INTERVAL seconds to pick up requests served by
+other processes.
+"""
+
+import os
+import time
+import threading
+
+from .usage import usage_buffer
+
+QUOTA_SYNC_INTERVAL = float(os.getenv("QUOTA_SYNC_INTERVAL", "60"))
+
+
+class Reservation:
+    def __init__(self, counter, user_id: str, api_key_id: str, endpoint: str, date):
+        self.counter = counter
+        self.user_id = user_id
+        self.api_key_id = api_key_id
+        self.endpoint = endpoint
+        self.date = date
+        self.settled = None         # "committed" | "refunded"
+
+    def commit(self):
+        self.counter._settle(self, commit=True)
+
+    def refund(self):
+        self.counter._settle(self, commit=False)
+
+
+class _UserQuota:
+    __slots__ = ("date", "committed", "reserved", "synced_at")
+
+    def __init__(self, date, committed: int):
+        self.date = date
+        self.committed = committed
+        self.reserved = 0
+        self.synced_at = time.monotonic()
+
+
+class QuotaCounter:
+    def __init__(self, sync_interval: float = QUOTA_SYNC_INTERVAL):
+        self.sync_interval = sync_interval
+        self._users = {}
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.denied = 0
+        self.refunded = 0
+
+    def seed(self, user_id, date, committed: int):
+        """Set the user's committed count for `date` from a fresh database read."""
+        user_id = str(user_id)
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is None or state.date != date:
+                self._users[user_id] = _UserQuota(date, committed)
+            else:
+                state.committed = committed
+                state.synced_at = time.monotonic()
+
+    def _sync(self, user_id: str, date, load):
+        """Refresh the committed count if missing, from another day or older than sync_interval."""
+        with self._lock:
+            state = self._users.get(user_id)
+            fresh = (state is not None and state.date == date
+                     and time.monotonic() - state.synced_at < self.sync_interval)
+        if not fresh:
+            # The database read happens outside the lock; reservations are kept apart from it
+            self.seed(user_id, date, load())
+
+    def used(self, user_id, date, load) -> int:
+        """Requests counted today, including reservations still in flight."""
+        user_id = str(user_id)
+        self._sync(user_id, date, load)
+        with self._lock:
+            state = self._users[user_id]
+            return state.committed + state.reserved
+
+    def reserve(self, user_id, api_key_id, endpoint: str, date, limit: int, load):
+        """Take one request from today's quota; None if it is used up."""
+        user_id = str(user_id)
+        self._sync(user_id, date, load)
+        with self._lock:
+            state = self._users[user_id]
+            if state.committed + state.reserved >= limit:
+                self.denied += 1
+                return None
+            state.reserved += 1
+            self.admitted += 1
+        return Reservation(self, user_id, str(api_key_id), endpoint, date)
+
+    def _settle(self, reservation: Reservation, commit: bool):
+        with self._lock:
+            if reservation.settled:
+                return
+            reservation.settled = "committed" if commit else "refunded"
+            state = self._users.get(reservation.user_id)
+            if state is not None and state.date == reservation.date:
+                state.reserved = max(0, state.reserved - 1)
+                if commit:
+                    state.committed += 1
+            if commit:
+                usage_buffer.add(reservation.user_id, reservation.api_key_id, reservation.endpoint,
+                                 reservation.date)
+            else:
+                self.refunded += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            reserved = sum(s.reserved for s in self._users.values())
+            users = len(self._users)
+        return {"users": users, "in_flight": reserved, "admitted": self.admitted,
+                "denied": self.denied, "refunded": self.refunded}
+
+
+quota = QuotaCounter()
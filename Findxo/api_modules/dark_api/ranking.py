@@ -0,0 +1,95 @@
+"""
+Session-level relevance ranking.
+
+Each extraction worker reports only a page's token count and the counts of the
+query terms (`term_stats`), so nothing large crosses the process boundary. Once
+a session's pages are in, `rank_results` builds the term-frequency matrix for
+the whole session and scores every page with BM25 in a few NumPy operations.
+"""
+
+import re
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"\w+")
+_TRAILING_TOKEN_RE = re.compile(r"\w+\Z")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def query_terms(keyword: str) -> list:
+    """Unique lowercase tokens of the search keyword, in order."""
+    return list(dict.fromkeys(TOKEN_RE.findall((keyword or "").lower())))
+
+
+def term_stats(text: str, terms: list) -> dict:
+    tokens = TOKEN_RE.findall(text.lower())
+    return {"length": len(tokens), "tf": {t: tokens.count(t) for t in terms}}
+
+
+class StreamingTermStats:
+    """`term_stats` over a text fed in chunks; a token cut by a chunk edge is carried over."""
+
+    def __init__(self, terms: list):
+        self.terms = terms
+        self.length = 0
+        self.tf = dict.fromkeys(terms, 0)
+        self._carry = ""
+
+    def feed(self, chunk: str, final: bool = False):
+        buf = self._carry + chunk.lower()
+        self._carry = ""
+        if not final:
+            m = _TRAILING_TOKEN_RE.search(buf)
+            if m:
+                self._carry = m.group()
+                buf = buf[:m.start()]
+        tokens = TOKEN_RE.findall(buf)
+        self.length += len(tokens)
+        for t in self.terms:
+            self.tf[t] += tokens.count(t)
+
+    def result(self) -> dict:
+        return {"length": self.length, "tf": dict(self.tf)}
+
+
+def bm25_scores(tf: np.ndarray, lengths: np.ndarray, k1: float = BM25_K1, b: float = BM25_B) -> np.ndarray:
+    """
+    BM25 for a (documents x terms) frequency matrix. Document frequencies and
+    the average length are taken from the matrix itself, i.e. from the session.
+    """
+    n_docs = tf.shape[0]
+    if n_docs == 0 or tf.shape[1] == 0:
+        return np.zeros(n_docs)
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+    avgdl = lengths.mean() or 1.0
+    norm = k1 * (1.0 - b + b * lengths / avgdl)
+    return (idf * (tf * (k1 + 1.0)) / (tf + norm[:, None])).sum(axis=1)
+
+
+def rank_results(results: list, keyword: str) -> list:
+    """
+    Set `relevance_score` on every result and return them best first. Pages
+    that failed or lack stats score 0 and keep their engine order at the end.
+    """
+    terms = query_terms(keyword)
+    scored = [r for r in results if r.get("term_stats")]
+    rest = [r for r in results if not r.get("term_stats")]
+
+    tf = np.array([[r["term_stats"]["tf"].get(t, 0) for t in terms] for r in scored],
+                  dtype=np.float64).reshape(len(scored), len(terms))
+    lengths = np.array([r["term_stats"]["length"] for r in scored], dtype=np.float64)
+    scores = bm25_scores(tf, lengths)
+
+    for r, score in zip(scored, scores.tolist()):
+        r["relevance_score"] = round(score, 4)
+        del r["term_stats"]
+    for r in rest:
+        r["relevance_score"] = 0.0
+        r.pop("term_stats", None)
+
+    # Stable: equal scores keep engine order
+    order = np.argsort(-scores, kind="stable")
+    return [scored[i] for i in order] + rest
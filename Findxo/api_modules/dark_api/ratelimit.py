@@ -0,0 +1,160 @@
+"""
+Per-key and per-user rate limits for search submissions.
+
+A daily count alone lets one key start many expensive scrapes at once. Each
+search submission takes a token from a token bucket per API key and one per
+user (refilled at the plan's rate, holding up to its burst), and one of the
+user's concurrent-search slots, held until the job finishes. Denials carry the
+seconds until a retry can succeed, for the 429's Retry-After.
+
+Limits come per SubscriptionPlan tier (by plan name) from RATE_LIMITS:
+"free=0.2:2:1,investigator=1:5:2,pro=5:20:5" is requests per second, burst
+and concurrent searches. A user's own bucket allows RATE_USER_KEYS times a
+single key's rate, shared by all of the user's keys.
+"""
+
+import os
+import math
+import time
+import threading
+from collections import namedtuple
+
+PlanLimits = namedtuple("PlanLimits", "rate burst concurrent")
+
+RATE_LIMITS = os.getenv("RATE_LIMITS", "free=0.2:2:1,investigator=1:5:2,pro=5:20:5")
+RATE_USER_KEYS = float(os.getenv("RATE_USER_KEYS", "2"))
+# Suggested retry delay when all concurrent-search slots are busy
+RATE_CONCURRENCY_RETRY = float(os.getenv("RATE_CONCURRENCY_RETRY", "10"))
+RATE_MAX_BUCKETS = int(os.getenv("RATE_MAX_BUCKETS", "50000"))
+
+DEFAULT_TIER = "free"
+
+
+def parse_limits(spec: str) -> dict:
+    """"free=0.2:2:1,pro=5:20:5" -> {"free": PlanLimits(0.2, 2, 1), ...}"""
+    limits = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, values = part.partition("=")
+        rate, burst, concurrent = values.split(":")
+        limits[name.strip().casefold()] = PlanLimits(float(rate), float(burst), int(concurrent))
+    return limits
+
+
+class RateLimited(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until one token is available (0 if one is now)."""
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class ConcurrencySlot:
+    def __init__(self, limiter, user_id: str):
+        self.limiter = limiter
+        self.user_id = user_id
+        self.released = False
+
+    def release(self):
+        self.limiter._release(self)
+
+
+class RateLimiter:
+    def __init__(self, limits: dict = None, user_keys: float = RATE_USER_KEYS):
+        self.limits = limits if limits is not None else parse_limits(RATE_LIMITS)
+        self.user_keys = user_keys
+        self._buckets = {}
+        self._active = {}           # user_id -> in-flight searches
+        self._lock = threading.Lock()
+        self.denied = {"key_rate": 0, "user_rate": 0, "concurrency": 0}
+
+    def limits_for(self, tier: str) -> PlanLimits:
+        tier = (tier or DEFAULT_TIER).casefold()
+        return self.limits.get(tier) or self.limits.get(DEFAULT_TIER) or PlanLimits(1.0, 5, 2)
+
+    def _bucket(self, ident: tuple, rate: float, burst: float, now: float) -> TokenBucket:
+        bucket = self._buckets.get(ident)
+        if bucket is None or bucket.rate != rate or bucket.burst != burst:
+            # New, or the plan changed: start from the new tier's burst
+            bucket = self._buckets[ident] = TokenBucket(rate, burst)
+        bucket.refill(now)
+        return bucket
+
+    def _prune(self, now: float):
+        if len(self._buckets) <= RATE_MAX_BUCKETS:
+            return
+        for ident, bucket in list(self._buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst:
+                # A full bucket is the same as a fresh one
+                del self._buckets[ident]
+
+    def acquire(self, user_id, key_id, tier: str) -> ConcurrencySlot:
+        """
+        Take a request token from the key's and the user's buckets and one
+        concurrent-search slot; raises RateLimited without taking anything if
+        any of them is exhausted.
+        """
+        limits = self.limits_for(tier)
+        user_id, key_id = str(user_id), str(key_id)
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            key_bucket = self._bucket(("key", key_id), limits.rate, limits.burst, now)
+            user_bucket = self._bucket(("user", user_id), limits.rate * self.user_keys,
+                                       limits.burst * self.user_keys, now)
+            for reason, bucket in (("key_rate", key_bucket), ("user_rate", user_bucket)):
+                wait = bucket.wait_time()
+                if wait:
+                    self.denied[reason] += 1
+                    raise RateLimited(reason, wait)
+            if self._active.get(user_id, 0) >= limits.concurrent:
+                self.denied["concurrency"] += 1
+                raise RateLimited("concurrency", RATE_CONCURRENCY_RETRY)
+            key_bucket.tokens -= 1
+            user_bucket.tokens -= 1
+            self._active[user_id] = self._active.get(user_id, 0) + 1
+        return ConcurrencySlot(self, user_id)
+
+    def _release(self, slot: ConcurrencySlot):
+        with self._lock:
+            if slot.released:
+                return
+            slot.released = True
+            active = self._active.get(slot.user_id, 0) - 1
+            if active > 0:
+                self._active[slot.user_id] = active
+            else:
+                self._active.pop(slot.user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "tiers": {name: limits._asdict() for name, limits in self.limits.items()},
+                "buckets": len(self._buckets),
+                "active_searches": sum(self._active.values()),
+                "denied": dict(self.denied),
+            }
+
+
+rate_limiter = RateLimiter()
@@ -1,159 +1,392 @@
+import os
+import hmac
+import time
 import logging
 import hashlib
-from fastapi import APIRouter, HTTPException, Header, BackgroundTasks
+from datetime import timedelta
+from typing import Literal
+from fastapi import APIRouter, HTTPException, Header, Query, Depends
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from django.utils import timezone
-from django.db.models import Sum
-from .scraper import run_dark_scrape
+from django.db.models import OuterRef, Subquery, Sum
+from ..common.fastjson import FastJSONResponse
+from .jobs import get_job_manager
+from .projection import parse_fields, project_report
+from .streaming import MEDIA_TYPES, job_event_stream, negotiate_format
+from .extraction import get_extraction_executor
+from .tor_pool import get_tor_pool
+from .browser import get_browser_manager
+from .telemetry import telemetry
+from .quota import quota
+from .ratelimit import RateLimited, rate_limiter
+from .scheduler import scrape_scheduler
+from .usage import usage_buffer
+from ..common.loop_monitor import loop_lag_monitor
 from fastapi.concurrency import run_in_threadpool
 from accounts.models import SupabaseUser
-from subscriptions.models import APIKey, UserSubscription, APIUsage, SubscriptionPlan
+from subscriptions.models import APIKey, UserSubscription, APIUsage
+from subscriptions.auth_cache import AuthEntry, auth_cache
 
 # Setup logging
 logger = logging.getLogger("dark_api")
 
-router = APIRouter(prefix="/dark", tags=["dark-api"])
+# Shared secret for operator-only endpoints (x-operator-token); unset disables them
+OPERATOR_TOKEN = os.getenv("OPERATOR_TOKEN", "")
+
+router = APIRouter(prefix="/dark", tags=["dark-api"], default_response_class=FastJSONResponse)
 
 class SearchIn(BaseModel):
     keyword: str = Field(..., description="Keyword to search for on onion engines")
     max_results: int = Field(5, ge=1, le=50, description="Maximum number of top-level onion links to scrape")
     depth: int = Field(0, ge=0, le=2, description="Crawl depth for internal links")
-    rotate: bool = Field(False, description="Whether to rotate Tor identity between scrapes")
+    rotate: bool = Field(False, description="Use a fresh Tor circuit for every scraped page")
+    context_offsets: bool = Field(
+        False,
+        description="Return keyword contexts as plain text with match offsets instead of **bold** markdown",
+    )
+    validate_entities: Literal["none", "flag", "drop"] = Field(
+        "flag",
+        description="Checksum-validate BTC/ETH/XMR/card/IBAN candidates and flag or drop invalid ones",
+    )
 
 class SearchResponse(BaseModel):
     session_id: str
     keyword: str
     timestamp: str
+    entity_validation: dict | None = None
+    prefetch: dict | None = None
     results: list
+    pagination: dict | None = None
 
-def track_usage(user_id, api_key_id, endpoint):
+def _resolve_key(digest: str) -> AuthEntry:
     """
-    Background task to record API usage.
+    Load key, user, current plan and today's usage for a key hash in one
+    query (cache miss path), and seed the quota counter with the usage.
     """
-    try:
-        today = timezone.now().date()
-        usage, created = APIUsage.objects.get_or_create(
-            user_id=user_id,
-            api_key_id=api_key_id,
-            endpoint=endpoint,
-            date=today,
-            defaults={'request_count': 1}
-        )
-        if not created:
-            APIUsage.objects.filter(id=usage.id).update(request_count=usage.request_count + 1)
-    except Exception as e:
-        logger.error(f"Failed to track usage: {e}")
+    loaded_at = time.time()
+    today = timezone.now().date()
+    # Latest active subscription; none means the free limit
+    sub = UserSubscription.objects.filter(
+        user_id=OuterRef('user_id'), 
+        status='active'
+    ).order_by('-created_at')
+    usage = APIUsage.objects.filter(
+        user_id=OuterRef('user_id'), date=today
+    ).values('user_id').annotate(total=Sum('request_count')).values('total')
+    key_record = APIKey.objects.filter(key_hash=digest, status='active').annotate(
+        wallet_address=Subquery(SupabaseUser.objects.filter(id=OuterRef('user_id')).values('wallet_address')[:1]),
+        plan_name=Subquery(sub.values('plan__name')[:1]),
+        plan_daily_requests=Subquery(sub.values('plan__daily_requests')[:1]),
+        subscription_expires_at=Subquery(sub.values('expires_at')[:1]),
+        usage_today=Subquery(usage[:1]),
+    ).first()
+    if not key_record:
+        logger.warning(f"Invalid API key attempt: {digest[:10]}...")
+        raise HTTPException(status_code=401, detail="Invalid or inactive API key")
+
+    if key_record.wallet_address is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    user = SupabaseUser(id=key_record.user_id, wallet_address=key_record.wallet_address)
+
+    quota.seed(user.id, today, (key_record.usage_today or 0) + usage_buffer.pending(user.id, today))
+    entry = AuthEntry(key_record, user, key_record.plan_name, key_record.plan_daily_requests,
+                      key_record.subscription_expires_at, loaded_at=loaded_at)
+    return auth_cache.put(digest, entry)
+
+def _is_operator(x_operator_token: str) -> bool:
+    return bool(OPERATOR_TOKEN) and hmac.compare_digest(x_operator_token.encode(), OPERATOR_TOKEN.encode())
 
-def _check_api_key(x_api_key: str):
+def _require_operator(x_operator_token: str):
+    if not _is_operator(x_operator_token):
+        raise HTTPException(status_code=403, detail="Operator access required")
+
+def _authenticate(x_api_key: str) -> AuthEntry:
     """
-    Validates API key, checks subscription status, and enforces daily limits.
+    Validates the API key and its expiry. Resolved keys are served from
+    auth_cache, so a hot key costs no queries.
     """
     if not x_api_key:
         raise HTTPException(status_code=401, detail="Missing API key")
     
     digest = hashlib.sha256(x_api_key.encode()).hexdigest()
-    
-    # 1. Verify API Key
-    key_record = APIKey.objects.filter(key_hash=digest, status='active').first()
-    if not key_record:
-        logger.warning(f"Invalid API key attempt: {digest[:10]}...")
-        raise HTTPException(status_code=401, detail="Invalid or inactive API key")
-    
-    if key_record.expires_at and key_record.expires_at < timezone.now():
-        raise HTTPException(status_code=401, detail="API key expired")
+    entry = auth_cache.get(digest) or _resolve_key(digest)
 
-    # 2. Get User and Subscription
-    user = SupabaseUser.objects.filter(id=key_record.user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    now = timezone.now()
+    if entry.key_record.expires_at and entry.key_record.expires_at < now:
+        raise HTTPException(status_code=401, detail="API key expired")
+    # Coalesced per key and written with the next usage flush
+    usage_buffer.touch(entry.key_record.id, now)
+    return entry
 
-    # Find latest active subscription
-    sub = UserSubscription.objects.filter(
-        user_id=user.id, 
-        status='active'
-    ).select_related('plan').order_by('-created_at').first()
-
-    # Default to free plan if no sub found (though system should create one)
-    if not sub:
-        plan_limit = 10 
-    else:
-        # Check if subscription expired
-        if sub.expires_at and sub.expires_at < timezone.now():
-             # Fallback to free plan limit or block
-             plan_limit = 10
-        else:
-             plan_limit = sub.plan.daily_requests
-
-    # 3. Check Daily Usage
-    today = timezone.now().date()
-    current_usage = APIUsage.objects.filter(
-        user_id=user.id, 
-        date=today
+def _load_usage(user_id, date) -> int:
+    """Requests recorded for the day: flushed rows plus this process's unflushed ones."""
+    recorded = APIUsage.objects.filter(
+        user_id=user_id, 
+        date=date
     ).aggregate(total=Sum('request_count'))['total'] or 0
+    return recorded + usage_buffer.pending(user_id, date)
 
-    if current_usage >= plan_limit:
-        logger.warning(f"Usage limit reached for user {user.wallet_address}")
-        raise HTTPException(status_code=429, detail="Daily request limit reached. Please upgrade your plan.")
+def _limit_reached(entry: AuthEntry, now):
+    logger.warning(f"Usage limit reached for user {entry.user.wallet_address}")
+    # The quota resets at midnight (UTC)
+    tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    raise HTTPException(
+        status_code=429,
+        detail="Daily request limit reached. Please upgrade your plan.",
+        headers={"Retry-After": str(max(1, int((tomorrow - now).total_seconds())))},
+    )
 
-    # Update last used timestamp
-    APIKey.objects.filter(id=key_record.id).update(last_used_at=timezone.now())
-    
-    return user, key_record
+def _rate_limited(entry: AuthEntry, exc: RateLimited):
+    logger.info(f"Rate limited ({exc.reason}) key {entry.key_id[:8]} of user {entry.user.wallet_address}")
+    detail = {
+        "key_rate": "Too many requests for this API key.",
+        "user_rate": "Too many requests for this account.",
+        "concurrency": "Too many searches in progress for this account.",
+    }[exc.reason]
+    raise HTTPException(status_code=429, detail=f"{detail} Retry in {exc.retry_after}s.",
+                        headers={"Retry-After": str(exc.retry_after)})
+
+def _check_api_key(x_api_key: str, enforce_limit: bool = True):
+    """
+    Validates API key, checks subscription status, and enforces daily limits.
+    With enforce_limit=False only the key is checked (e.g. polling a job that
+    was already paid for). Does not count the request; see _reserve_request.
+    """
+    entry = _authenticate(x_api_key)
+    if enforce_limit:
+        now = timezone.now()
+        today = now.date()
+        if quota.used(entry.user_id, today, lambda: _load_usage(entry.user_id, today)) >= entry.plan_limit(now):
+            _limit_reached(entry, now)
+    return entry.user, entry.key_record
+
+def _reserve_request(x_api_key: str, endpoint: str):
+    """
+    _check_api_key for charged endpoints: applies the plan's per-key and
+    per-user rate limits, takes one of the user's concurrent-search slots and
+    atomically takes one request from today's quota. The reservation is
+    committed or refunded, and the slot freed, when the job ends. Returns
+    the user, the key and the job's admission (reservation, slot, plan tier).
+    """
+    entry = _authenticate(x_api_key)
+    now = timezone.now()
+    today = now.date()
+    tier = entry.plan_tier(now)
+    try:
+        slot = rate_limiter.acquire(entry.user_id, entry.key_id, tier)
+    except RateLimited as e:
+        _rate_limited(entry, e)
+    reservation = quota.reserve(entry.user_id, entry.key_id, endpoint, today, entry.plan_limit(now),
+                                lambda: _load_usage(entry.user_id, today))
+    if reservation is None:
+        slot.release()
+        _limit_reached(entry, now)
+    return entry.user, entry.key_record, {"reservation": reservation, "slot": slot, "tier": tier}
 
 @router.get("/verify")
 async def verify_key(x_api_key: str = Header(..., alias="x-api-key")):
     """
     Endpoint for the frontend to verify an API key and check limits.
     """
-    user, key_record = await run_in_threadpool(_check_api_key, x_api_key)
-    
-    # Get current usage for info
-    today = timezone.now().date()
+    entry = await run_in_threadpool(_authenticate, x_api_key)
+    now = timezone.now()
+    today = now.date()
+    # Seeded by the key lookup (or still fresh in memory): no second usage query
     current_usage = await run_in_threadpool(
-        lambda: APIUsage.objects.filter(user_id=user.id, date=today).aggregate(total=Sum('request_count'))['total'] or 0
+        quota.used, entry.user_id, today, lambda: _load_usage(entry.user_id, today)
     )
+    plan_limit = entry.plan_limit(now)
+    if current_usage >= plan_limit:
+        _limit_reached(entry, now)
 
     return {
         "valid": True,
-        "wallet_address": user.wallet_address,
-        "user_id": str(user.id),
-        "usage_today": current_usage
+        "wallet_address": entry.user.wallet_address,
+        "user_id": entry.user_id,
+        "usage_today": current_usage,
+        "plan": entry.plan_name,
+        "daily_limit": plan_limit,
+    }
+
+def _report_view(
+    fields: str | None = Query(
+        None, description="Comma-separated result fields to return, e.g. url,title,entities.emails (default: all)"
+    ),
+    offset: int = Query(0, ge=0, description="First result to return"),
+    limit: int | None = Query(None, ge=1, le=50, description="Results per page (default: all)"),
+    links_offset: int = Query(0, ge=0, description="First link to return in each result"),
+    links_limit: int | None = Query(None, ge=0, description="Links per result (default: all)"),
+) -> dict:
+    try:
+        spec = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"spec": spec, "offset": offset, "limit": limit,
+            "links_offset": links_offset, "links_limit": links_limit}
+
+def _job_params(body: SearchIn) -> dict:
+    return {
+        "keyword": body.keyword,
+        "max_results": body.max_results,
+        "depth": body.depth,
+        "rotate": body.rotate,
+        "context_offsets": body.context_offsets,
+        "validate_entities": body.validate_entities,
     }
 
+def _job_accepted(job) -> JSONResponse:
+    body = job.summary()
+    body["status_url"] = f"/v1/dark/jobs/{job.id}"
+    body["report_url"] = f"/v1/dark/jobs/{job.id}/report"
+    return FastJSONResponse(status_code=202, content=body)
+
 @router.post("/search", response_model=SearchResponse)
 async def search(
     body: SearchIn, 
-    background_tasks: BackgroundTasks,
-    x_api_key: str = Header(..., alias="x-api-key")
+    x_api_key: str = Header(..., alias="x-api-key"),
+    wait: float | None = Query(
+        None, gt=0, description="Seconds to wait for the report; on timeout a 202 with the job id is returned"
+    ),
+    view: dict = Depends(_report_view),
 ):
     """
     Performs a deep search and scrape of the dark web with usage tracking.
+    Runs as a job; without `wait` the request blocks until the report is ready.
     """
-    # Authenticate and check limits
-    user, key_record = await run_in_threadpool(_check_api_key, x_api_key)
+    # Authenticate and reserve one request of the daily quota
+    user, key_record, admission = await run_in_threadpool(_reserve_request, x_api_key, "/v1/dark/search")
     
-    # Track usage in background
-    background_tasks.add_task(track_usage, user.id, key_record.id, "/v1/dark/search")
-    
-    try:
-        logger.info(f"User {user.wallet_address} starting search for: {body.keyword}")
-        
-        report = await run_dark_scrape(
-            keyword=body.keyword,
-            max_results=body.max_results,
-            depth=body.depth,
-            rotate=body.rotate
+    logger.info(f"User {user.wallet_address} starting search for: {body.keyword}")
+    manager = get_job_manager()
+    job = manager.submit(user.id, _job_params(body), **admission)
+
+    if not await manager.wait(job, wait):
+        # Still running: the client continues with the job endpoints
+        return _job_accepted(job)
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=f"Scraper error: {job.error}")
+    # Returned as a response so the report is not re-validated through SearchResponse
+    return FastJSONResponse(project_report(job.report, **view))
+
+@router.post("/search/stream")
+async def search_stream(
+    body: SearchIn,
+    x_api_key: str = Header(..., alias="x-api-key"),
+    accept: str = Header("", alias="accept"),
+    format: Literal["ndjson", "sse"] | None = Query(None, description="Defaults from the Accept header"),
+    view: dict = Depends(_report_view),
+):
+    """
+    Same search, streamed: an event per scraped page as soon as it is done,
+    progress events in between and a summary at the end.
+    """
+    if body.validate_entities == "drop":
+        # Pages are sent before the session is validated, so nothing can be dropped from them
+        raise HTTPException(
+            status_code=422,
+            detail="validate_entities=drop is not supported when streaming; use flag (invalid "
+                   "candidates are listed in the summary) or /v1/dark/search",
         )
-        
-        if "error" in report:
-            raise HTTPException(status_code=500, detail=report["error"])
-            
-        return report
-        
-    except Exception as e:
-        logger.exception("Error during dark web search")
-        raise HTTPException(status_code=500, detail=f"Scraper error: {str(e)}")
+    user, key_record, admission = await run_in_threadpool(_reserve_request, x_api_key, "/v1/dark/search/stream")
+    fmt = negotiate_format(format, accept)
+    job = get_job_manager().submit(user.id, _job_params(body), **admission)
+    logger.info(f"User {user.wallet_address} streaming job {job.id} for: {body.keyword}")
+    return StreamingResponse(
+        job_event_stream(job, fmt, spec=view["spec"], links_offset=view["links_offset"],
+                         links_limit=view["links_limit"]),
+        media_type=MEDIA_TYPES[fmt],
+        # Stop nginx-style proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/jobs", status_code=202)
+async def submit_job(
+    body: SearchIn,
+    x_api_key: str = Header(..., alias="x-api-key"),
+):
+    """
+    Queue a dark search and return its job id immediately.
+    """
+    user, key_record, admission = await run_in_threadpool(_reserve_request, x_api_key, "/v1/dark/jobs")
+    job = get_job_manager().submit(user.id, _job_params(body), **admission)
+    logger.info(f"User {user.wallet_address} queued job {job.id} for: {body.keyword}")
+    return _job_accepted(job)
+
+async def _get_job(job_id: str, x_api_key: str):
+    user, _ = await run_in_threadpool(_check_api_key, x_api_key, False)
+    job = get_job_manager().get(job_id, user_id=user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    x_api_key: str = Header(..., alias="x-api-key"),
+    wait: float = Query(0, ge=0, le=300, description="Long-poll: seconds to wait for the job to finish"),
+):
+    """
+    Job status and progress.
+    """
+    job = await _get_job(job_id, x_api_key)
+    if wait and not job.finished:
+        await get_job_manager().wait(job, wait)
+    return job.summary()
+
+@router.get("/jobs/{job_id}/report", response_model=SearchResponse)
+async def get_job_report(
+    job_id: str,
+    x_api_key: str = Header(..., alias="x-api-key"),
+    view: dict = Depends(_report_view),
+):
+    """
+    Final report of a finished job; 202 with the job status while it is still running.
+    """
+    job = await _get_job(job_id, x_api_key)
+    if not job.finished:
+        return _job_accepted(job)
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=f"Scraper error: {job.error}")
+    # Returned as a response so the report is not re-validated through SearchResponse
+    return FastJSONResponse(project_report(job.report, **view))
 
 @router.get("/status")
-async def get_status():
-    return {"status": "operational", "engine": "multi-hybrid-v2"}
+async def get_status(x_operator_token: str = Header("", alias="x-operator-token")):
+    status = {"status": "operational", "engine": "multi-hybrid-v2"}
+    if not _is_operator(x_operator_token):
+        return status
+    # Internals for operators: pools, queues, caches and tor control state
+    status.update(
+        extraction=get_extraction_executor().stats(),
+        event_loop_lag=loop_lag_monitor.snapshot(),
+        tor=get_tor_pool().stats(),
+        browser=get_browser_manager().stats(),
+        jobs=get_job_manager().stats(),
+        auth_cache=auth_cache.stats(),
+        usage_buffer=usage_buffer.stats(),
+        quota=quota.stats(),
+        rate_limits=rate_limiter.stats(),
+        scheduler=scrape_scheduler.stats(),
+    )
+    return status
+
+@router.get("/telemetry")
+async def get_telemetry(
+    x_operator_token: str = Header("", alias="x-operator-token"),
+    group_by: Literal["host", "tor", "kind"] = Query("host"),
+    window: float | None = Query(None, gt=0, description="Only samples from the last N seconds"),
+    limit: int = Query(50, ge=1, le=500),
+):
+    """
+    Fetch latency aggregates (connect, TTFB, total, bytes) per onion host, tor
+    endpoint or fetch kind, slowest first. Operators only: samples span all
+    customers' scrapes.
+    """
+    _require_operator(x_operator_token)
+    return {
+        "group_by": group_by,
+        "window": window,
+        "samples": len(telemetry.samples()),
+        "groups": telemetry.aggregate(group_by=group_by, window=window, limit=limit),
+    }
@@ -0,0 +1,169 @@
+"""
+Weighted fair scheduling of scrape work across users.
+
+Browser and Tor capacity is shared, and pages used to be scraped in arrival
+order, so one user's 50-result job could hold it for its whole run. With
+SCRAPE_SLOTS set, every onion discovery and page scrape waits for one of that
+many slots from `scrape_scheduler`, which hands free slots out by weighted fair
+queuing: each
+request gets a virtual finish time (its user's previous finish, or the current
+virtual time if later, plus cost / weight) and the smallest is served first.
+A user with many queued pages therefore takes turns with everyone else, and a
+tier with twice the weight gets about twice the share while both are waiting.
+
+Weights per SubscriptionPlan tier (by plan name) come from SCHED_WEIGHTS,
+e.g. "free=1,investigator=2,pro=4"; unknown tiers get the free weight. Queue
+waits are kept per tier for /v1/dark/status.
+
+The default SCRAPE_SLOTS=0 sets no cap: each job in progress holds at most one
+slot, so scraping runs as wide as JOB_WORKERS and the Tor pool allow, and no
+request ever queues.
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager
+
+SCRAPE_SLOTS = int(os.getenv("SCRAPE_SLOTS", "0"))      # 0 = no cap
+SCHED_WEIGHTS = os.getenv("SCHED_WEIGHTS", "free=1,investigator=2,pro=4")
+# Recent waits per tier kept for the percentiles in stats()
+SCHED_WAIT_SAMPLES = int(os.getenv("SCHED_WAIT_SAMPLES", "1000"))
+
+DEFAULT_TIER = "free"
+
+
+def parse_weights(spec: str) -> dict:
+    """"free=1,pro=4" -> {"free": 1.0, "pro": 4.0}"""
+    weights = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        weights[name.strip().casefold()] = max(float(weight), 0.01)
+    return weights
+
+
+def _percentile(values: list, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _TierStats:
+    __slots__ = ("waiting", "granted", "wait_total", "wait_max", "recent")
+
+    def __init__(self):
+        self.waiting = 0
+        self.granted = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.recent = deque(maxlen=SCHED_WAIT_SAMPLES)
+
+    def record(self, wait: float):
+        self.granted += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.recent.append(wait)
+
+    def snapshot(self) -> dict:
+        recent = list(self.recent)
+        return {
+            "waiting": self.waiting,
+            "granted": self.granted,
+            "wait_avg_ms": round(self.wait_total / self.granted * 1000, 1) if self.granted else None,
+            "wait_p50_ms": round(_percentile(recent, 0.5) * 1000, 1) if recent else None,
+            "wait_p95_ms": round(_percentile(recent, 0.95) * 1000, 1) if recent else None,
+            "wait_max_ms": round(self.wait_max * 1000, 1),
+        }
+
+
+class FairScheduler:
+    def __init__(self, slots: int = SCRAPE_SLOTS, weights: dict = None):
+        self.slots = max(0, slots)
+        self.weights = weights if weights is not None else parse_weights(SCHED_WEIGHTS)
+        self.busy = 0
+        self.virtual = 0.0
+        self._finish = {}           # user_id -> virtual finish of their last request
+        self._heap = []             # (finish, seq, start, future)
+        self._seq = itertools.count()
+        self._tiers = {}
+
+    def weight_for(self, tier: str) -> float:
+        tier = (tier or DEFAULT_TIER).casefold()
+        return self.weights.get(tier) or self.weights.get(DEFAULT_TIER) or 1.0
+
+    def _tier_stats(self, tier: str) -> _TierStats:
+        tier = (tier or DEFAULT_TIER).casefold()
+        if tier not in self._tiers:
+            self._tiers[tier] = _TierStats()
+        return self._tiers[tier]
+
+    def _tag(self, user_id: str, tier: str, cost: float):
+        start = max(self.virtual, self._finish.get(user_id, 0.0))
+        finish = start + cost / self.weight_for(tier)
+        self._finish[user_id] = finish
+        if len(self._finish) > 10000:
+            # A finish tag behind the virtual time is the same as none
+            self._finish = {u: f for u, f in self._finish.items() if f > self.virtual}
+        return start, finish
+
+    async def acquire(self, user_id, tier: str = None, cost: float = 1.0):
+        """Wait for a scrape slot in weighted fair order; pair with release()."""
+        user_id = str(user_id)
+        stats = self._tier_stats(tier)
+        start, finish = self._tag(user_id, tier, cost)
+        if (not self.slots or self.busy < self.slots) and not self._heap:
+            self.busy += 1
+            self.virtual = start
+            stats.record(0.0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (finish, next(self._seq), start, future))
+        enqueued = time.monotonic()
+        stats.waiting += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as the waiter went away: pass the slot on
+                self.release()
+            raise
+        finally:
+            stats.waiting -= 1
+        stats.record(time.monotonic() - enqueued)
+
+    def release(self):
+        while self._heap:
+            _, _, start, future = heapq.heappop(self._heap)
+            if future.done():
+                continue
+            # The slot goes straight to the next request; busy is unchanged
+            self.virtual = start
+            future.set_result(None)
+            return
+        self.busy = max(0, self.busy - 1)
+
+    @asynccontextmanager
+    async def slot(self, user_id, tier: str = None, cost: float = 1.0):
+        await self.acquire(user_id, tier, cost)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "slots": self.slots,
+            "busy": self.busy,
+            "waiting": sum(1 for *_, future in self._heap if not future.done()),
+            "weights": dict(self.weights),
+            "tiers": {tier: stats.snapshot() for tier, stats in self._tiers.items()},
+        }
+
+
+scrape_scheduler = FairScheduler()
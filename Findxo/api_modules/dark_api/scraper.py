@@ -6,14 +6,15 @@ Modularized version of multi.py for FastAPI integration.
 
 import os
 import re
-import json
 import time
 import asyncio
 import random
 import hashlib
 import logging
+import html as html_lib
+from contextlib import nullcontext
 from pathlib import Path
-from urllib.parse import quote_plus, urlparse, urljoin
+from urllib.parse import quote_plus, urlparse, urljoin, parse_qs, unquote
 
 import requests
 import certifi
@@ -22,46 +23,39 @@ from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 
-logger = logging.getLogger("dark_scraper")
+from ..common.fastjson import dumps
+from .browser import get_browser_manager
+from .extraction import get_extraction_executor
+from .isolation import IsolatedSocksRelay, new_isolation_tag, socks_proxy_url
+from .prefetch import OnionPrefetcher, summarize_ttfb
+from .ranking import rank_results
+from .telemetry import telemetry
+from .tor_pool import get_tor_pool
+from .validators import validate_session_entities
 
-# Playwright (async)
-try:
-    from playwright.async_api import async_playwright
-except (ImportError, RuntimeError):
-    from .dummy_playwright import async_playwright
-    logger.warning("Playwright not available, using dummy fallback")
-
-# Optional stem for Tor control
-try:
-    from stem import Signal
-    from stem.control import Controller
-    STEM_AVAILABLE = True
-except Exception:
-    STEM_AVAILABLE = False
-
-# Optional language detection
-try:
-    from langdetect import detect as detect_lang
-    LANGDETECT_AVAILABLE = True
-except Exception:
-    LANGDETECT_AVAILABLE = False
+logger = logging.getLogger("dark_scraper")
 
 # -----------------------
 # Config / Env
 # -----------------------
 load_dotenv()
 
-TOR_SOCKS = os.getenv("TOR_SOCKS", "127.0.0.1:9050")          # socks5 proxy
-TOR_CONTROL = os.getenv("TOR_CONTROL", "")                    # host:port (optional)
-TOR_CONTROL_PASS = os.getenv("TOR_CONTROL_PASS", "")          # password for control (optional)
+TOR_SOCKS = os.getenv("TOR_SOCKS", "127.0.0.1:9050")          # socks5 proxy (TOR_SOCKS_POOL for several)
+# Separate circuits per session/page via SOCKS credentials (needs IsolateSOCKSAuth, tor's default)
+TOR_STREAM_ISOLATION = os.getenv("TOR_STREAM_ISOLATION", "1") == "1"
 CONCURRENCY = int(os.getenv("CONCURRENCY", "1"))
 DEFAULT_DEPTH = int(os.getenv("DEPTH", "0"))
 
+# Per-page caps (UTF-8 bytes) and streaming extraction
+MAX_PAGE_HTML_BYTES = int(os.getenv("MAX_PAGE_HTML_BYTES", str(5 * 1024 * 1024)))
+MAX_PAGE_TEXT_BYTES = int(os.getenv("MAX_PAGE_TEXT_BYTES", str(2 * 1024 * 1024)))
+STREAM_EXTRACTION = os.getenv("STREAM_EXTRACTION", "auto")    # auto | always | never
+STREAM_THRESHOLD_BYTES = int(os.getenv("STREAM_THRESHOLD_BYTES", str(1024 * 1024)))
+STREAM_CHUNK_CHARS = int(os.getenv("STREAM_CHUNK_CHARS", str(256 * 1024)))
+
 OUTPUT_BASE = Path("tor_scrape_output")
 OUTPUT_BASE.mkdir(exist_ok=True)
 
-logger = logging.getLogger("dark_scraper")
-
 # Time helper
 def ts():
     return time.strftime("%Y%m%d-%H%M%S")
@@ -78,12 +72,10 @@ def sanitize_filename(s: str) -> str:
     s = re.sub(r"[^A-Za-z0-9._-]+", "_", s)
     return s[:120]
 
-def build_tor_proxies():
-    # Use socks5h so DNS resolves through Tor
-    return {
-        "http": f"socks5h://{TOR_SOCKS}",
-        "https": f"socks5h://{TOR_SOCKS}",
-    }
+def build_tor_proxies(isolation: str = "", socks: str = ""):
+    # Use socks5h so DNS resolves through Tor; credentials pick an isolated circuit
+    proxy = socks_proxy_url(socks or TOR_SOCKS, isolation if TOR_STREAM_ISOLATION else "")
+    return {"http": proxy, "https": proxy}
 
 def sha1_short(s: str) -> str:
     if not s:
@@ -91,33 +83,25 @@ def sha1_short(s: str) -> str:
     return hashlib.sha1(s.encode("utf-8")).hexdigest()[:10]
 
 # Regex extractors
-EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", re.I)
-PGP_RE = re.compile(r"-----BEGIN PGP PUBLIC KEY BLOCK-----.*?-----END PGP PUBLIC KEY BLOCK-----", re.S)
-BTC_RE = re.compile(r"\b([13][a-km-zA-HJ-NP-Z1-9]{25,34})\b")
+# Every pattern must stay linear on hostile input (see tests/test_entity_patterns.py):
+# bounded repeats, no nested quantifiers, possessive parts where backtracking can't help.
+# Local part is capped at the RFC 5321 limit of 64 so a long run without "@" isn't rescanned from every offset
+EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]{1,64}+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", re.I)
+# Tempered body: an unterminated BEGIN stops at the next BEGIN instead of scanning to the end of the page
+PGP_RE = re.compile(
+    r"-----BEGIN PGP PUBLIC KEY BLOCK-----(?:(?!-----BEGIN PGP PUBLIC KEY BLOCK-----).)*?"
+    r"-----END PGP PUBLIC KEY BLOCK-----",
+    re.S,
+)
+BTC_RE = re.compile(r"\b([13][a-km-zA-HJ-NP-Z1-9]{25,34}|(?:bc1|BC1)[a-zA-HJ-NP-Z0-9]{11,71})\b")
 ETH_RE = re.compile(r"\b(0x[a-fA-F0-9]{40})\b")
-XMR_RE = re.compile(r"\b4[0-9A-Za-z]{90,110}\b")
-PHONE_RE = re.compile(r"\+?\d{1,4}?[-.\s]?\(?\d{1,3}?\)?[-.\s]?\d{1,4}[-.\s]?\d{1,4}[-.\s]?\d{1,9}", re.I)
-IBAN_RE = re.compile(r"\b[A-Z]{2}\d{2}[A-Z0-9]{4}\d{7}([A-Z0-9]?){0,16}\b", re.I)
+# Monero base58: 95 chars (standard "4…" / subaddress "8…") or 106 chars (integrated)
+XMR_RE = re.compile(r"\b[48][1-9A-HJ-NP-Za-km-z]{94}(?:[1-9A-HJ-NP-Za-km-z]{11})?\b")
+# Separators and parens are possessive: giving them back never lets a digit group match
+PHONE_RE = re.compile(r"\+?\d{1,4}?[-.\s]?+\(?+\d{1,3}?\)?+[-.\s]?+\d{1,4}[-.\s]?+\d{1,4}[-.\s]?+\d{1,9}", re.I)
+IBAN_RE = re.compile(r"\b[A-Z]{2}\d{2}[A-Z0-9]{4}\d{7}[A-Z0-9]{0,16}\b", re.I)
 CC_RE = re.compile(r"\b(?:4[0-9]{12}(?:[0-9]{3})?|5[1-5][0-9]{14}|3[47][0-9]{13}|3(?:0[0-5]|[68][0-9])[0-9]{11}|6(?:011|5[0-9]{2})[0-9]{12}|(?:2131|1800|35\d{3})\d{11})\b")
 
-# -----------------------
-# Tor control / NEWNYM
-# -----------------------
-def rotate_tor_identity():
-    if not STEM_AVAILABLE or not TOR_CONTROL:
-        return False, "Stem or TOR_CONTROL not configured"
-    try:
-        host, port = TOR_CONTROL.split(":")
-        with Controller.from_port(address=host, port=int(port)) as c:
-            if TOR_CONTROL_PASS:
-                c.authenticate(password=TOR_CONTROL_PASS)
-            else:
-                c.authenticate()
-            c.signal(Signal.NEWNYM)
-        return True, "NEWNYM signal sent"
-    except Exception as e:
-        return False, f"Failed NEWNYM: {e}"
-
 # -----------------------
 # Ahmia search (via Tor)
 # -----------------------
@@ -138,53 +122,72 @@ def clean_onion_links(raw_links):
             cleaned.append(link)
     return cleaned
 
-def search_onion_engines(keyword: str, max_results: int = 10, timeout: int = 180):
+# Engine configurations
+SEARCH_ENGINES = [
+    {
+        "name": "Ahmia (clearnet)",
+        "base": "https://ahmia.fi/search/?q=",
+        "tor": False,
+        "referer": "https://ahmia.fi/"
+    },
+    {
+        "name": "Ahmia (onion)",
+        "base": "http://juhanurmihxlp77nkq76byazcldy2hlmovfu2epvl5ankdibsot4csyd.onion/search/?q=",
+        "tor": True,
+        "referer": "http://juhanurmihxlp77nkq76byazcldy2hlmovfu2epvl5ankdibsot4csyd.onion/"
+    },
+    {
+        "name": "Torch",
+        "base": "http://torchdeedp3i2jigzjdmfpn5ttjhthh5wbmda2rr3jvqjg5p77c54dqd.onion/search?query=",
+        "tor": True,
+        "referer": "http://torchdeedp3i2jigzjdmfpn5ttjhthh5wbmda2rr3jvqjg5p77c54dqd.onion/"
+    }
+]
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0"
+]
+ENGINE_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1",
+    "DNT": "1"
+}
+
+_engine_session = None
+
+def get_engine_session() -> requests.Session:
     """
-    Query multiple engines and returns clean .onion URLs.
+    Process-wide session so clearnet engine connections (and their TLS
+    handshakes) are reused across searches. Tor requests still get a pool per
+    proxy URL, i.e. per isolation tag.
+    """
+    global _engine_session
+    if _engine_session is None:
+        session = requests.Session()
+        retries = Retry(total=3, backoff_factor=5, status_forcelist=[400, 429, 500, 502, 503, 504])
+        session.mount("https://", HTTPAdapter(max_retries=retries))
+        session.mount("http://", HTTPAdapter(max_retries=retries))
+        _engine_session = session
+    return _engine_session
+
+def search_onion_engines(keyword: str, max_results: int = 10, timeout: int = 180,
+                         isolation: str = "", socks: str = ""):
+    """
+    Query multiple engines and returns clean .onion URLs. Tor requests go to the
+    `socks` endpoint and carry the `isolation` tag as SOCKS credentials so they
+    get their own circuit.
     """
-    from urllib.parse import parse_qs, unquote
-    
-    # Engine configurations
     engines = [
-        {
-            "name": "Ahmia (clearnet)",
-            "base": "https://ahmia.fi/search/?q=",
-            "proxies": None,
-            "referer": "https://ahmia.fi/"
-        },
-        {
-            "name": "Ahmia (onion)",
-            "base": "http://juhanurmihxlp77nkq76byazcldy2hlmovfu2epvl5ankdibsot4csyd.onion/search/?q=",
-            "proxies": build_tor_proxies(),
-            "referer": "http://juhanurmihxlp77nkq76byazcldy2hlmovfu2epvl5ankdibsot4csyd.onion/"
-        },
-        {
-            "name": "Torch",
-            "base": "http://torchdeedp3i2jigzjdmfpn5ttjhthh5wbmda2rr3jvqjg5p77c54dqd.onion/search?query=",
-            "proxies": build_tor_proxies(),
-            "referer": "http://torchdeedp3i2jigzjdmfpn5ttjhthh5wbmda2rr3jvqjg5p77c54dqd.onion/"
-        }
-    ]
-
-    user_agents = [
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0"
+        dict(engine, proxies=build_tor_proxies(isolation, socks) if engine["tor"] else None)
+        for engine in SEARCH_ENGINES
     ]
-    headers = {
-        "User-Agent": random.choice(user_agents),
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.5",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Connection": "keep-alive",
-        "Upgrade-Insecure-Requests": "1",
-        "DNT": "1"
-    }
-
-    session = requests.Session()
-    retries = Retry(total=3, backoff_factor=5, status_forcelist=[400, 429, 500, 502, 503, 504])
-    session.mount("https://", HTTPAdapter(max_retries=retries))
-    session.mount("http://", HTTPAdapter(max_retries=retries))
+    headers = dict(ENGINE_HEADERS, **{"User-Agent": random.choice(USER_AGENTS)})
+    session = get_engine_session()
 
     for engine in engines:
         url = engine["base"] + quote_plus(keyword)
@@ -206,6 +209,8 @@ def search_onion_engines(keyword: str, max_results: int = 10, timeout: int = 180
                 logger.error(f"Tor test failed for {engine['name']}: {str(e)}")
                 continue
 
+        started = time.monotonic()
+        resp = None
         try:
             logger.info(f"Attempting {engine['name']} search for: {keyword}")
             resp = session.get(
@@ -235,6 +240,15 @@ def search_onion_engines(keyword: str, max_results: int = 10, timeout: int = 180
 
         except Exception as e:
             logger.error(f"{engine['name']} error: {str(e)}")
+        finally:
+            # requests' `elapsed` stops when the response headers are parsed, i.e. TTFB
+            telemetry.record(
+                "engine", urlparse(url).hostname, (socks or TOR_SOCKS) if proxies else None,
+                ok=resp is not None and resp.ok,
+                ttfb_ms=round(resp.elapsed.total_seconds() * 1000, 1) if resp is not None else None,
+                total_ms=round((time.monotonic() - started) * 1000, 1),
+                nbytes=len(resp.content) if resp is not None else None,
+            )
 
     return []
 
@@ -263,38 +277,205 @@ def extract_meta_from_html(html: str, base_url: str = "") -> dict:
     links = []
     if soup:
         for a in soup.select("a[href]"):
-            href = a.get("href", "").strip()
-            if not href:
-                continue
-            if base_url and not href.startswith("http"):
-                try:
-                    href = urljoin(base_url, href)
-                except Exception:
-                    pass
-            links.append(href)
+            href = _resolve_link(a.get("href", ""), base_url)
+            if href:
+                links.append(href)
     return {"title": title, "meta_description": meta_desc, "meta_keywords": meta_keywords, "links": links}
 
-def find_keyword_context(text: str, keyword: str, window: int = 160) -> list:
-    if not keyword or not text:
+def _resolve_link(href: str, base_url: str) -> str:
+    href = href.strip()
+    if href and base_url and not href.startswith("http"):
+        try:
+            href = urljoin(base_url, href)
+        except Exception:
+            pass
+    return href
+
+HEAD_END_RE = re.compile(r"</head\s*>", re.I)
+
+def html_head(html: str) -> str:
+    """`html` up to the end of its <head>, or all of it when no </head> is found."""
+    m = HEAD_END_RE.search(html)
+    return html[:m.end()] if m else html
+
+WS_RE = re.compile(r"\s+")
+
+def _collapse_ws(segments):
+    """
+    Join (text, is_match) segments with whitespace collapsed and the ends stripped,
+    returning the excerpt and the offsets of the match segments inside it.
+    """
+    out, highlights, length = [], [], 0
+    for seg, is_match in segments:
+        seg = WS_RE.sub(" ", seg)
+        if seg.startswith(" ") and (not out or out[-1].endswith(" ")):
+            seg = seg[1:]
+        if is_match and seg:
+            highlights.append([length, length + len(seg)])
+        out.append(seg)
+        length += len(seg)
+    excerpt = "".join(out)
+    stripped = excerpt.rstrip()
+    if len(stripped) != len(excerpt):
+        highlights = [[s, min(e, len(stripped))] for s, e in highlights if s < len(stripped)]
+    return stripped, highlights
+
+def _highlight_markdown(excerpt: str, highlights: list) -> str:
+    parts, pos = [], 0
+    for h_start, h_end in highlights:
+        parts.append(excerpt[pos:h_start])
+        parts.append(f"**{excerpt[h_start:h_end]}**")
+        pos = h_end
+    parts.append(excerpt[pos:])
+    return "".join(parts)
+
+def find_keyword_context(text: str, keyword: str, window: int = 160, limit: int = 5,
+                         offsets: bool = False, max_span: int = 0) -> list:
+    """
+    Return up to `limit` unique excerpts around case-insensitive matches of `keyword`.
+
+    Overlapping windows are merged into one excerpt (at most `max_span` characters,
+    default four windows) and scanning stops as soon as `limit` unique excerpts
+    exist, so work is bounded by the text actually consumed.
+    By default excerpts are markdown strings with matches wrapped in `**`. With
+    `offsets=True` each excerpt is a dict with the plain `text`, the `start`/`end`
+    of the window in the source text and `highlights`, a list of `[start, end]`
+    match offsets inside `text`, leaving highlighting to the client.
+    """
+    if not keyword or not text or limit <= 0:
         return []
-    k = keyword.lower()
-    excerpts = []
-    for m in re.finditer(re.escape(k), text.lower()):
+    pattern = re.compile(re.escape(keyword), re.IGNORECASE)
+    max_span = max_span or 4 * window + len(keyword)
+    excerpts, seen = [], set()
+
+    def emit(win_start, win_end, spans):
+        # Dedupe on a cheap normalized prefix before building the full excerpt
+        head = WS_RE.sub(" ", text[win_start:min(win_end, win_start + 200)]).lstrip()
+        if len(head) < 50 and win_end > win_start + 200:
+            head = WS_RE.sub(" ", text[win_start:win_end]).lstrip()
+        key = head[:50].rstrip().lower()
+        if key in seen:
+            return
+        seen.add(key)
+        segments, pos = [], win_start
+        for m_start, m_end in spans:
+            segments.append((text[pos:m_start], False))
+            segments.append((text[m_start:m_end], True))
+            pos = m_end
+        segments.append((text[pos:win_end], False))
+        excerpt, highlights = _collapse_ws(segments)
+        if offsets:
+            excerpts.append({"text": excerpt, "start": win_start, "end": win_end,
+                             "highlights": highlights})
+        else:
+            excerpts.append(_highlight_markdown(excerpt, highlights))
+
+    win_start = win_end = None
+    spans = []
+    for m in pattern.finditer(text):
         start = max(0, m.start() - window)
         end = min(len(text), m.end() + window)
-        context = text[start:end].strip().replace("\n", " ")
-        context = re.sub(r'\s+', ' ', context)
-        highlighted_context = re.sub(f'({re.escape(keyword)})', r'**\1**', context, flags=re.IGNORECASE)
-        excerpts.append(highlighted_context)
-    
-    unique_excerpts = []
-    seen = set()
-    for excerpt in excerpts:
-        key = excerpt[:50].lower()
-        if key not in seen:
-            unique_excerpts.append(excerpt)
-            seen.add(key)
-    return unique_excerpts[:5]
+        if win_end is not None and m.end() <= win_end:
+            # Already inside the open window
+            spans.append((m.start(), m.end()))
+            continue
+        if win_end is not None and start <= win_end and end - win_start <= max_span:
+            # Overlaps the open window: extend it instead of starting a new excerpt
+            spans.append((m.start(), m.end()))
+            win_end = end
+            continue
+        if win_end is not None:
+            emit(win_start, win_end, spans)
+            if len(excerpts) >= limit:
+                return excerpts
+        # A capped window may end inside this match's leading context; never re-cover
+        # it, but always start at or before the match itself
+        win_start, win_end = min(max(start, win_end or 0), m.start()), end
+        spans = [(m.start(), m.end())]
+    if win_end is not None:
+        emit(win_start, win_end, spans)
+    return excerpts[:limit]
+
+class StreamingKeywordContext:
+    """
+    find_keyword_context over text fed in chunks. A tail of the previous chunk is
+    carried over so windows crossing a boundary are rebuilt whole; excerpts that
+    still touch the end of a non-final buffer are deferred to the next chunk.
+    """
+
+    def __init__(self, keyword: str, window: int = 160, limit: int = 5, offsets: bool = False):
+        self.keyword = keyword
+        self.window = window
+        self.limit = limit
+        self.offsets = offsets
+        self.carry = 5 * window + len(keyword)
+        self.excerpts = []
+        self._seen = set()
+        self._buf = ""
+        self._base = 0  # absolute offset of _buf[0]
+
+    @property
+    def done(self) -> bool:
+        return not self.keyword or len(self.excerpts) >= self.limit
+
+    def feed(self, chunk: str, final: bool = False):
+        if self.done:
+            return
+        buf = self._buf + chunk
+        found = find_keyword_context(buf, self.keyword, self.window,
+                                     limit=self.limit + len(self._seen), offsets=True)
+        for ex in found:
+            if ex["end"] >= len(buf) and not final:
+                continue
+            key = ex["text"][:50].rstrip().lower()
+            if key in self._seen:
+                continue
+            self._seen.add(key)
+            ex["start"] += self._base
+            ex["end"] += self._base
+            self.excerpts.append(ex)
+            if self.done:
+                break
+        if len(buf) > self.carry:
+            self._base += len(buf) - self.carry
+            buf = buf[-self.carry:]
+        self._buf = buf
+
+    def result(self) -> list:
+        excerpts = self.excerpts[:self.limit]
+        if self.offsets:
+            return excerpts
+        return [_highlight_markdown(ex["text"], ex["highlights"]) for ex in excerpts]
+
+# Patterns whose matches are single short tokens; PGP blocks are handled separately
+TOKEN_PATTERNS = {
+    "emails": EMAIL_RE,
+    "btc_addresses": BTC_RE,
+    "eth_addresses": ETH_RE,
+    "xmr_addresses": XMR_RE,
+    "phones": PHONE_RE,
+    "ibans": IBAN_RE,
+    "credit_cards": CC_RE,
+}
+# A pattern is skipped outright when its required substring is absent
+PATTERN_PREFILTER = {"emails": "@"}
+PGP_BEGIN = "-----BEGIN PGP PUBLIC KEY BLOCK-----"
+PGP_END = "-----END PGP PUBLIC KEY BLOCK-----"
+
+def _finalize_entities(found: dict, pgps: list) -> dict:
+    btc_filtered = [addr for addr in found["btc_addresses"] if 26 <= len(addr) <= 35 or addr[:3].lower() == "bc1"]
+    eth_filtered = [addr for addr in found["eth_addresses"] if len(addr) == 42 and addr.startswith('0x')]
+
+    return {
+        "emails": list(found["emails"]),
+        "pgp_keys": pgps,
+        "btc_addresses": btc_filtered,
+        "eth_addresses": eth_filtered,
+        "xmr_addresses": list(found["xmr_addresses"]),
+        "phones": [p for p in found["phones"] if len(p.strip()) > 8],
+        "ibans": list(found["ibans"]),
+        "credit_cards": list(found["credit_cards"])
+    }
 
 def extract_entities(text: str) -> dict:
     if not text:
@@ -303,40 +484,187 @@ def extract_entities(text: str) -> dict:
             "eth_addresses": [], "xmr_addresses": [], "phones": [],
             "ibans": [], "credit_cards": []
         }
-    
-    emails = list(set(EMAIL_RE.findall(text)))
-    pgps = PGP_RE.findall(text)
-    btc = list(set(BTC_RE.findall(text)))
-    eth = list(set(ETH_RE.findall(text)))
-    xmr = list(set(XMR_RE.findall(text)))
-    phones = list(set(PHONE_RE.findall(text)))
-    ibans = list(set(IBAN_RE.findall(text)))
-    cc = list(set(CC_RE.findall(text)))
-    
-    btc_filtered = [addr for addr in btc if 26 <= len(addr) <= 35]
-    eth_filtered = [addr for addr in eth if len(addr) == 42 and addr.startswith('0x')]
-    
-    return {
-        "emails": emails, 
-        "pgp_keys": pgps, 
-        "btc_addresses": btc_filtered, 
-        "eth_addresses": eth_filtered, 
-        "xmr_addresses": xmr,
-        "phones": [p for p in phones if len(p.strip()) > 8],
-        "ibans": ibans,
-        "credit_cards": cc
+
+    found = {
+        name: set(pattern.findall(text)) if PATTERN_PREFILTER.get(name, "") in text else set()
+        for name, pattern in TOKEN_PATTERNS.items()
     }
+    return _finalize_entities(found, PGP_RE.findall(text))
+
+A_HREF_RE = re.compile(r"""<a\b[^>]*?\shref\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""", re.I)
+
+class StreamingLinkExtractor:
+    """
+    The `links` of extract_meta_from_html over HTML fed in chunks, in document
+    order. Uses the same overlap and ownership rule as StreamingEntityExtractor.
+    """
+
+    def __init__(self, base_url: str = "", overlap: int = 4096):
+        self.base_url = base_url
+        self.overlap = overlap
+        self.links = []
+        self._buf = ""
+        self._owned = 0
+
+    def feed(self, chunk: str, final: bool = False):
+        buf = self._buf + chunk
+        limit = len(buf) if final else max(self._owned, len(buf) - self.overlap)
+        for m in A_HREF_RE.finditer(buf, self._owned):
+            if m.start() >= limit:
+                break
+            href = next(g for g in m.groups() if g is not None)
+            href = _resolve_link(html_lib.unescape(href), self.base_url)
+            if href:
+                self.links.append(href)
+        keep = max(0, limit - self.overlap)
+        self._buf = buf[keep:]
+        self._owned = limit - keep
+
+    def result(self) -> list:
+        return self.links
+
+class StreamingEntityExtractor:
+    """
+    extract_entities over text fed in chunks. Only the last `overlap` characters
+    are kept between chunks; a token match is accepted by the chunk it starts in,
+    so entities spanning a boundary are found exactly once. PGP blocks can be far
+    longer than the overlap and are collected across chunks up to `max_pgp_chars`.
+    """
+
+    def __init__(self, overlap: int = 1024, max_pgp_chars: int = 65536):
+        self.overlap = overlap
+        self.max_pgp_chars = max_pgp_chars
+        self.found = {name: set() for name in TOKEN_PATTERNS}
+        self.pgps = []
+        self._buf = ""
+        self._owned = 0   # matches starting before this index belonged to the previous chunk
+        self._pgp = None  # PGP block still waiting for its END marker
+
+    def feed(self, chunk: str, final: bool = False):
+        buf = self._buf + chunk
+        limit = len(buf) if final else max(self._owned, len(buf) - self.overlap)
+        for name, pattern in TOKEN_PATTERNS.items():
+            if PATTERN_PREFILTER.get(name, "") not in buf:
+                continue
+            for m in pattern.finditer(buf):
+                if m.start() >= limit:
+                    break
+                if m.start() >= self._owned:
+                    self.found[name].add(m.group(1) if pattern.groups else m.group(0))
+        self._feed_pgp(buf, chunk, limit, final)
+        keep = max(0, limit - self.overlap)
+        self._buf = buf[keep:]
+        self._owned = limit - keep
+
+    def _feed_pgp(self, buf: str, chunk: str, limit: int, final: bool):
+        search_from = self._owned
+        if self._pgp is not None:
+            pending = self._pgp + chunk
+            j = pending.find(PGP_END)
+            k = pending.find(PGP_BEGIN, 1)
+            if k >= 0 and (j < 0 or k < j):
+                self._pgp = None
+                search_from = max(search_from, len(buf) - (len(pending) - k))
+            elif j >= 0:
+                self.pgps.append(pending[:j + len(PGP_END)])
+                search_from = max(search_from, len(buf) - (len(pending) - j - len(PGP_END)))
+                self._pgp = None
+            elif len(pending) > self.max_pgp_chars or final:
+                self._pgp = None
+            else:
+                self._pgp = pending
+                return
+        i = buf.find(PGP_BEGIN, search_from)
+        j = buf.find(PGP_END, i) if i >= 0 else -1
+        while 0 <= i < limit:
+            k = buf.find(PGP_BEGIN, i + 1, j if j >= 0 else len(buf))
+            if k >= 0:
+                # Like PGP_RE, a block that is never closed gives way to the next BEGIN
+                i = k
+                continue
+            if j < 0:
+                self._pgp = None if final else buf[i:]
+                return
+            self.pgps.append(buf[i:j + len(PGP_END)])
+            i = buf.find(PGP_BEGIN, j + len(PGP_END))
+            j = buf.find(PGP_END, i) if i >= 0 else -1
+
+    def result(self) -> dict:
+        return _finalize_entities(self.found, self.pgps)
 
 # -----------------------
 # Scrape onion page (Playwright)
 # -----------------------
-async def scrape_onion_page(playwright, url: str, out_dir: Path, keyword: str = "", depth: int = 0):
-    browser = await playwright.chromium.launch(
-        headless=True,
-        proxy={"server": f"socks5://{TOR_SOCKS}"},
-        args=["--no-sandbox", "--disable-dev-shm-usage"]
+# Serialize the page once inside the browser; Python then pulls it whole or in slices
+PAGE_SNAPSHOT_JS = """() => {
+    window.__findxo = {
+        html: document.documentElement.outerHTML,
+        text: document.body ? document.body.innerText : ""
+    };
+    return {html: window.__findxo.html.length, text: window.__findxo.text.length};
+}"""
+PAGE_SLICE_JS = "([key, start, end]) => window.__findxo[key].slice(start, end)"
+
+def use_streaming(total_chars: int) -> bool:
+    if STREAM_EXTRACTION == "always":
+        return True
+    if STREAM_EXTRACTION == "never":
+        return False
+    return total_chars > STREAM_THRESHOLD_BYTES
+
+def cap_text(s: str, max_bytes: int):
+    """Truncate `s` to at most `max_bytes` of UTF-8; returns (text, info)."""
+    data = s.encode("utf-8", errors="replace")
+    if len(data) <= max_bytes:
+        return s, {"bytes": len(data), "truncated": False}
+    s = data[:max_bytes].decode("utf-8", errors="ignore")
+    return s, {"bytes": len(s.encode("utf-8")), "truncated": True}
+
+async def spool_page_source(page, key: str, total_chars: int, path: Path, max_bytes: int) -> dict:
+    """
+    Copy the snapshotted page `key` ("html" or "text") to `path` in
+    STREAM_CHUNK_CHARS slices, stopping at `max_bytes`. Only one slice is held
+    in memory at a time.
+    """
+    written, truncated = 0, False
+    with open(path, "w", encoding="utf-8", errors="replace") as fh:
+        for start in range(0, total_chars, STREAM_CHUNK_CHARS):
+            chunk = await page.evaluate(PAGE_SLICE_JS, [key, start, start + STREAM_CHUNK_CHARS])
+            chunk, info = cap_text(chunk, max_bytes - written)
+            fh.write(chunk)
+            written += info["bytes"]
+            if info["truncated"]:
+                truncated = True
+                break
+    return {"bytes": written, "truncated": truncated}
+
+async def response_timing(response, elapsed: float) -> dict:
+    """
+    Connect time (proxy + tor circuit/rendezvous), TTFB, bytes and total time of
+    the main document. Browser timings are ms from request start, -1 if unknown.
+    """
+    timing = {"connect_ms": None, "ttfb_ms": None, "total_ms": round(elapsed * 1000, 1), "bytes": None}
+    if response is None:
+        return timing
+    rt = response.request.timing
+    if rt.get("connectEnd", -1) >= 0 and rt.get("connectStart", -1) >= 0:
+        timing["connect_ms"] = round(rt["connectEnd"] - rt["connectStart"], 1)
+    if rt.get("responseStart", -1) >= 0:
+        timing["ttfb_ms"] = round(rt["responseStart"], 1)
+    try:
+        sizes = await response.request.sizes()
+        timing["bytes"] = sizes["responseHeadersSize"] + sizes["responseBodySize"]
+    except Exception:
+        pass
+    return timing
+
+async def scrape_onion_page(browser, url: str, out_dir: Path, keyword: str = "", depth: int = 0,
+                            context_offsets: bool = False, proxy_server: str = ""):
+    # A context per page on the shared browser; the proxy is set per context
+    context = await browser.new_context(
+        viewport={"width": 1280, "height": 900},
+        proxy={"server": proxy_server or f"socks5://{TOR_SOCKS}"},
     )
-    context = await browser.new_context(viewport={"width": 1280, "height": 900})
     page = await context.new_page()
 
     safe_name = sanitize_filename(url) + "_" + sha1_short(url)
@@ -353,26 +681,44 @@ async def scrape_onion_page(playwright, url: str, out_dir: Path, keyword: str =
 
     try:
         logger.info(f"Scraping {url}")
-        await page.goto(url, wait_until="domcontentloaded", timeout=60000)
+        started = time.monotonic()
+        response = await page.goto(url, wait_until="domcontentloaded", timeout=60000)
+        meta["timing"] = await response_timing(response, time.monotonic() - started)
         await asyncio.sleep(random.uniform(1.0, 2.5))
 
-        raw_html = await page.content()
+        sizes = await page.evaluate(PAGE_SNAPSHOT_JS)
         html_path = site_dir / f"{safe_name}.html"
-        html_path.write_text(raw_html, encoding="utf-8", errors="replace")
-        
-        shot_path = site_dir / f"{safe_name}.png"
-        await page.screenshot(path=str(shot_path), full_page=True)
-
-        visible_text = await page.inner_text("body")
         text_path = site_dir / f"{safe_name}.txt"
-        text_path.write_text(visible_text, encoding="utf-8", errors="replace")
+        payload = {"url": url, "keyword": keyword, "context_offsets": context_offsets}
+
+        if use_streaming(sizes["html"] + sizes["text"]):
+            # Large page: copy it out of the browser slice by slice and let the
+            # extraction worker read the capped files back in chunks
+            html_info = await spool_page_source(page, "html", sizes["html"], html_path, MAX_PAGE_HTML_BYTES)
+            text_info = await spool_page_source(page, "text", sizes["text"], text_path, MAX_PAGE_TEXT_BYTES)
+            payload.update(html_path=str(html_path), text_path=str(text_path))
+        else:
+            snapshot = await page.evaluate("() => window.__findxo")
+            raw_html, html_info = cap_text(snapshot["html"], MAX_PAGE_HTML_BYTES)
+            visible_text, text_info = cap_text(snapshot["text"], MAX_PAGE_TEXT_BYTES)
+            html_path.write_text(raw_html, encoding="utf-8", errors="replace")
+            text_path.write_text(visible_text, encoding="utf-8", errors="replace")
+            payload.update(html=raw_html, text=visible_text)
+
+        meta["extraction"] = {
+            "mode": "stream" if "html_path" in payload else "full",
+            "truncated": html_info["truncated"] or text_info["truncated"],
+            "html_bytes": html_info["bytes"],
+            "text_bytes": text_info["bytes"],
+            "html_chars_total": sizes["html"],
+            "text_chars_total": sizes["text"],
+        }
 
-        parsed = extract_meta_from_html(raw_html, base_url=url)
-        meta.update(parsed)
-        meta["entities"] = extract_entities(visible_text + "\n" + raw_html)
+        shot_path = site_dir / f"{safe_name}.png"
+        await page.screenshot(path=str(shot_path), full_page=True)
 
-        if keyword:
-            meta["keywords_found"] = find_keyword_context(visible_text, keyword)
+        # Parsing and entity extraction run in the extraction pool, off the event loop
+        meta.update(await get_extraction_executor().extract(payload))
 
         meta["ok"] = True
     except Exception as e:
@@ -380,42 +726,117 @@ async def scrape_onion_page(playwright, url: str, out_dir: Path, keyword: str =
         logger.error(f"Error scraping {url}: {e}")
     finally:
         await context.close()
-        await browser.close()
         return meta
 
+async def scrape_isolated(browser, url: str, out_dir: Path, keyword: str, isolation: str,
+                          prefer_socks: str = None, **kwargs):
+    """
+    `scrape_onion_page` on a Tor instance leased from the pool (`prefer_socks`
+    if it is usable), with the browser routed through a relay bound to `isolation`.
+    """
+    async with get_tor_pool().lease(prefer_socks) as tor:
+        started = time.monotonic()
+        if not TOR_STREAM_ISOLATION:
+            res = await scrape_onion_page(browser, url, out_dir, keyword,
+                                          proxy_server=f"socks5://{tor.socks}", **kwargs)
+            refused = False
+        else:
+            async with IsolatedSocksRelay(tor.socks, isolation) as relay:
+                res = await scrape_onion_page(browser, url, out_dir, keyword, proxy_server=relay.server, **kwargs)
+            refused = bool(relay.upstream_failures)
+        # A dead onion is not the instance's fault; only a refused SOCKS handshake is
+        if refused:
+            tor.record(ok=False)
+        elif res["ok"]:
+            tor.record(time.monotonic() - started)
+        timing = res.get("timing") or {}
+        telemetry.record("page", urlparse(url).hostname, tor.socks, ok=res["ok"],
+                         connect_ms=timing.get("connect_ms"), ttfb_ms=timing.get("ttfb_ms"),
+                         total_ms=timing.get("total_ms"), nbytes=timing.get("bytes"))
+        return res
+
 # -----------------------
 # Main Runner
 # -----------------------
-async def run_dark_scrape(keyword: str, max_results: int = 5, depth: int = 0, rotate: bool = False):
+def _emit(on_event, event: dict):
+    if on_event is None:
+        return
+    try:
+        on_event(event)
+    except Exception as e:
+        logger.error(f"Scrape event handler failed: {e}")
+
+def write_report(path: Path, report: dict):
+    path.write_bytes(dumps(report, indent=True))
+
+async def run_dark_scrape(keyword: str, max_results: int = 5, depth: int = 0, rotate: bool = False,
+                          context_offsets: bool = False, validate_entities: str = "flag", on_event=None,
+                          gate=None):
+    """
+    Discover onion links for `keyword`, scrape them and build the session report.
+    `on_event`, if given, is called with progress events: {"type": "stage"},
+    {"type": "links", "total"} and {"type": "result", "index", "result"} per page.
+    `gate`, if given, returns an async context manager held around the
+    discovery and around each page scrape (a scheduler slot, see jobs.py).
+    """
+    gate = gate or nullcontext
     session_id = f"{sanitize_filename(keyword)}_{ts()}"
     session_dir = OUTPUT_BASE / session_id
     session_dir.mkdir(parents=True, exist_ok=True)
     report_dir = session_dir / "reports"
     report_dir.mkdir(exist_ok=True)
 
-    onion_links = search_onion_engines(keyword, max_results=max_results)
+    # One circuit for the session; rotate=True gives every page a fresh one
+    # instead of a process-wide NEWNYM that would also hit concurrent scrapes
+    isolation = new_isolation_tag()
+    _emit(on_event, {"type": "stage", "stage": "discovery", "session_id": session_id})
+    async with gate(), get_tor_pool().lease() as tor:
+        onion_links = await asyncio.to_thread(
+            search_onion_engines, keyword, max_results=max_results, isolation=isolation, socks=tor.socks
+        )
     if not onion_links:
         return {"error": "No links found", "keyword": keyword}
+    _emit(on_event, {"type": "links", "total": len(onion_links)})
+    _emit(on_event, {"type": "stage", "stage": "scraping"})
+
+    def tag_for(i):
+        return (f"{isolation}-{i}" if rotate else isolation) if TOR_STREAM_ISOLATION else ""
 
     results = []
-    async with async_playwright() as pw:
-        for link in onion_links:
-            if rotate:
-                rotate_tor_identity()
-                await asyncio.sleep(5)
-            
-            res = await scrape_onion_page(pw, link, report_dir, keyword, depth=0)
+    browser = await get_browser_manager().get()
+    prefetcher = OnionPrefetcher()
+    try:
+        for i, link in enumerate(onion_links):
+            # Rendezvous for the next queued onions is set up while this one is scraped
+            prefetcher.schedule_ahead(onion_links, i, tag_for)
+            async with gate():
+                prefetcher.fetch_started(link)
+                res = await scrape_isolated(browser, link, report_dir, keyword, tag_for(i),
+                                            prefer_socks=prefetcher.socks_for(link),
+                                            context_offsets=context_offsets)
+            res["prefetch"] = prefetcher.status(link)
             results.append(res)
+            _emit(on_event, {"type": "result", "index": i, "result": res})
             await asyncio.sleep(random.uniform(2, 5))
+    finally:
+        await prefetcher.close()
+
+    _emit(on_event, {"type": "stage", "stage": "report"})
+    # Checksum-validate crypto/card/IBAN candidates once across the whole session
+    validation = validate_session_entities(results, mode=validate_entities)
+    # BM25 over the whole session; the report lists the most relevant pages first
+    results = rank_results(results, keyword)
 
     report = {
         "session_id": session_id,
         "keyword": keyword,
         "timestamp": ts(),
+        "entity_validation": validation,
+        "prefetch": summarize_ttfb(results),
         "results": results
     }
     
-    with open(session_dir / "report.json", "w") as f:
-        json.dump(report, f, indent=2)
+    # Multi-megabyte for large sessions: encode and write off the event loop
+    await asyncio.to_thread(write_report, session_dir / "report.json", report)
     
     return report
@@ -0,0 +1,83 @@
+"""
+Incremental delivery of a search job as NDJSON or Server-Sent Events.
+
+Each page result is sent as soon as its scrape finishes, with progress events
+in between and a final summary once the session report is built. The summary
+carries the session-level fields (validation counts, prefetch timing, the
+relevance order) rather than repeating every result.
+"""
+
+import os
+import asyncio
+
+from ..common.fastjson import dumps
+from .projection import project_result
+
+STREAM_HEARTBEAT = float(os.getenv("STREAM_HEARTBEAT", "15"))
+
+# Scrape-time fields consumed by ranking; the report never exposes them
+INTERNAL_FIELDS = ("term_stats",)
+
+STREAM_FORMATS = ("ndjson", "sse")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+
+def negotiate_format(fmt: str, accept: str) -> str:
+    if fmt in STREAM_FORMATS:
+        return fmt
+    return "sse" if "text/event-stream" in (accept or "") else "ndjson"
+
+
+def encode(event: str, data: dict, fmt: str) -> bytes:
+    if fmt == "sse":
+        return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+    return dumps(dict(data, event=event)) + b"\n"
+
+
+def summary_event(job) -> dict:
+    if job.status == "failed":
+        return {"job_id": job.id, "status": "failed", "detail": job.error}
+    report = job.report
+    ranking = []
+    for res in report["results"]:
+        entry = {"url": res.get("url"), "relevance_score": res.get("relevance_score")}
+        if res.get("invalid_entities"):
+            # Flagged after the page was streamed: validation runs over the whole session
+            entry["invalid_entities"] = res["invalid_entities"]
+        ranking.append(entry)
+    summary = {k: v for k, v in report.items() if k != "results"}
+    summary.update(job_id=job.id, status=job.status, ranking=ranking)
+    return summary
+
+
+async def job_event_stream(job, fmt: str = "ndjson", heartbeat: float = STREAM_HEARTBEAT,
+                           spec: dict = None, links_offset: int = 0, links_limit: int = None):
+    """
+    Yield encoded events for `job` until it ends. Results are projected with
+    `spec` and the links page, as in project_report.
+    """
+    queue = job.subscribe()
+    try:
+        yield encode("accepted", job.summary(), fmt)
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle connection during slow page loads
+                yield b": keepalive\n\n" if fmt == "sse" else encode("heartbeat", {}, fmt)
+                continue
+            kind = event["type"]
+            if kind == "end":
+                yield encode("summary" if job.status == "done" else "error", summary_event(job), fmt)
+                return
+            if kind == "result":
+                result = {k: v for k, v in event["result"].items() if k not in INTERNAL_FIELDS}
+                result = project_result(result, spec, links_offset, links_limit)
+                yield encode("result", {"index": event["index"], "result": result}, fmt)
+            elif kind == "links":
+                yield encode("progress", {"stage": "links", "pages_total": event["total"]}, fmt)
+            else:
+                yield encode("progress", {"stage": event["stage"], "pages_done": job.pages_done,
+                                          "pages_total": job.pages_total}, fmt)
+    finally:
+        job.unsubscribe(queue)
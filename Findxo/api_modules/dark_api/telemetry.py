@@ -0,0 +1,84 @@
+"""
+Fetch latency telemetry.
+
+Every page scrape, engine query and onion prefetch records its connect time,
+time-to-first-byte, transferred bytes and total time, tagged with the onion
+host and the tor endpoint it went through. Samples live in a bounded ring
+buffer; `aggregate` groups them for the /v1/dark/telemetry endpoint so
+timeouts and concurrency can be tuned from data.
+"""
+
+import os
+import time
+import threading
+from collections import deque
+
+TELEMETRY_MAX_SAMPLES = int(os.getenv("TELEMETRY_MAX_SAMPLES", "5000"))
+
+METRICS = ("connect_ms", "ttfb_ms", "total_ms")
+GROUP_KEYS = ("host", "tor", "kind")
+
+
+def _percentile(data: list, q: float):
+    return data[min(len(data) - 1, int(len(data) * q))]
+
+
+class FetchTelemetry:
+    def __init__(self, max_samples: int = TELEMETRY_MAX_SAMPLES):
+        self._samples = deque(maxlen=max_samples)
+        # Engine queries record from worker threads
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, host: str, tor: str = None, ok: bool = True, connect_ms: float = None,
+               ttfb_ms: float = None, total_ms: float = None, nbytes: int = None):
+        sample = {
+            "ts": time.time(), "kind": kind, "host": host, "tor": tor, "ok": ok,
+            "connect_ms": connect_ms, "ttfb_ms": ttfb_ms, "total_ms": total_ms, "bytes": nbytes,
+        }
+        with self._lock:
+            self._samples.append(sample)
+
+    def samples(self, since: float = None) -> list:
+        with self._lock:
+            data = list(self._samples)
+        if since is not None:
+            data = [s for s in data if s["ts"] >= since]
+        return data
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+    def aggregate(self, group_by: str = "host", window: float = None, limit: int = 50) -> list:
+        """
+        Per-group count, error rate, mean/p50/p95 of each timing and byte totals,
+        slowest groups (by p95 total time) first.
+        """
+        if group_by not in GROUP_KEYS:
+            raise ValueError(f"group_by must be one of {GROUP_KEYS}")
+        since = time.time() - window if window else None
+        groups = {}
+        for s in self.samples(since):
+            groups.setdefault(s[group_by] or "unknown", []).append(s)
+
+        rows = []
+        for key, items in groups.items():
+            row = {group_by: key, "count": len(items),
+                   "errors": sum(1 for s in items if not s["ok"])}
+            row["error_rate"] = round(row["errors"] / len(items), 3)
+            for metric in METRICS:
+                vals = sorted(s[metric] for s in items if s[metric] is not None)
+                row[metric] = {
+                    "mean": round(sum(vals) / len(vals), 1),
+                    "p50": round(_percentile(vals, 0.5), 1),
+                    "p95": round(_percentile(vals, 0.95), 1),
+                } if vals else None
+            sizes = [s["bytes"] for s in items if s["bytes"] is not None]
+            row["bytes_total"] = sum(sizes)
+            row["bytes_mean"] = round(sum(sizes) / len(sizes)) if sizes else None
+            rows.append(row)
+        rows.sort(key=lambda r: -(r["total_ms"] or {}).get("p95", 0))
+        return rows[:limit]
+
+
+telemetry = FetchTelemetry()
@@ -0,0 +1,220 @@
+"""
+Long-lived Tor control-port client.
+
+One authenticated `stem` controller is kept open for the life of the app and
+reconnected when tor restarts, so a NEWNYM costs one round trip instead of a
+TCP handshake plus AUTHENTICATE. stem is synchronous: every call runs in a
+worker thread behind an asyncio lock, which keeps the event loop free and
+serializes access to the shared socket.
+
+A rotation is complete when tor reports a freshly BUILT circuit after the
+NEWNYM, not after a fixed sleep. Tor ignores NEWNYMs sent less than ~10s
+apart, so rotations are queued and spaced, and callers queued behind an
+in-flight rotation share its result.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger("dark_scraper")
+
+# Optional stem for Tor control
+try:
+    from stem import CircStatus, Signal, SocketError
+    from stem.control import Controller, EventType
+    STEM_AVAILABLE = True
+except Exception:
+    STEM_AVAILABLE = False
+
+load_dotenv()
+
+TOR_CONTROL = os.getenv("TOR_CONTROL", "")                    # host:port (optional)
+TOR_CONTROL_PASS = os.getenv("TOR_CONTROL_PASS", "")          # password for control (optional)
+# Tor rate-limits NEWNYM to one per 10 seconds
+TOR_NEWNYM_INTERVAL = float(os.getenv("TOR_NEWNYM_INTERVAL", "10"))
+# Upper bound on waiting for a fresh circuit after NEWNYM
+TOR_NEWNYM_TIMEOUT = float(os.getenv("TOR_NEWNYM_TIMEOUT", "15"))
+
+
+def newnym_and_wait(controller, timeout: float = TOR_NEWNYM_TIMEOUT):
+    """
+    Blocking: send NEWNYM on an authenticated controller and wait until tor
+    builds a new general-purpose circuit. Returns the seconds waited, or None
+    if no circuit was built within `timeout`.
+    """
+    built = threading.Event()
+
+    def on_circ(event):
+        if event.status == CircStatus.BUILT and event.purpose in (None, "GENERAL"):
+            built.set()
+
+    controller.add_event_listener(on_circ, EventType.CIRC)
+    try:
+        started = time.monotonic()
+        controller.signal(Signal.NEWNYM)
+        if not timeout:
+            return 0.0
+        return time.monotonic() - started if built.wait(timeout) else None
+    finally:
+        controller.remove_event_listener(on_circ)
+
+
+class TorControlClient:
+    def __init__(self, address: str = TOR_CONTROL, password: str = TOR_CONTROL_PASS):
+        self.address = address
+        self.password = password
+        self.connects = 0
+        self.rotations = 0
+        self.failures = 0
+        self.last_rotation = None
+        self.last_rotation_wait = None
+        self.rate_limited = 0
+        self.coalesced = 0
+        self.wait_timeouts = 0
+        self.last_error = None
+        self._controller = None
+        self._lock = asyncio.Lock()
+        self._rotate_lock = asyncio.Lock()
+        self._sent_at = 0.0         # monotonic time of the last NEWNYM
+        self._last_result = None
+
+    @property
+    def configured(self) -> bool:
+        return STEM_AVAILABLE and bool(self.address)
+
+    # --- blocking side, always called from a worker thread under the lock ---
+    def _connect(self):
+        host, port = self.address.rsplit(":", 1)
+        controller = Controller.from_port(address=host, port=int(port))
+        try:
+            if self.password:
+                controller.authenticate(password=self.password)
+            else:
+                controller.authenticate()
+        except Exception:
+            controller.close()
+            raise
+        return controller
+
+    def _drop(self):
+        if self._controller is not None:
+            try:
+                self._controller.close()
+            except Exception:
+                pass
+            self._controller = None
+
+    def _ensure(self):
+        if self._controller is None or not self._controller.is_alive():
+            self._drop()
+            self._controller = self._connect()
+            self.connects += 1
+            logger.info(f"Connected to Tor control port {self.address}")
+        return self._controller
+
+    def _call(self, fn):
+        # A socket that died since the last call (tor restart, idle timeout) gets one reconnect
+        for attempt in range(2):
+            controller = self._ensure()
+            try:
+                return fn(controller)
+            except SocketError:
+                self._drop()
+                if attempt:
+                    raise
+
+    async def _run(self, fn):
+        async with self._lock:
+            return await asyncio.to_thread(self._call, fn)
+
+    # --- async API ---
+    async def connect(self) -> bool:
+        """Open the connection ahead of the first rotation; failures are only logged."""
+        if not self.configured:
+            return False
+        try:
+            await self._run(lambda c: None)
+            return True
+        except Exception as e:
+            self.last_error = str(e)
+            logger.warning(f"Tor control port {self.address} unavailable: {e}")
+            return False
+
+    async def rotate(self, wait: bool = True, timeout: float = TOR_NEWNYM_TIMEOUT):
+        """
+        Send NEWNYM and, with `wait`, return once a fresh circuit is built (or
+        after `timeout`). Returns (ok, message) like the old per-call helper.
+        """
+        if not self.configured:
+            return False, "Stem or TOR_CONTROL not configured"
+        requested = time.monotonic()
+        async with self._rotate_lock:
+            if self._sent_at > requested and self._last_result is not None:
+                # A rotation started after this request already gave us a new identity
+                self.coalesced += 1
+                return self._last_result
+            delay = self._sent_at + TOR_NEWNYM_INTERVAL - time.monotonic()
+            if delay > 0:
+                self.rate_limited += 1
+                await asyncio.sleep(delay)
+            self._sent_at = time.monotonic()
+            try:
+                waited = await self._run(lambda c: newnym_and_wait(c, timeout if wait else 0))
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                self._last_result = None
+                return False, f"Failed NEWNYM: {e}"
+            self.rotations += 1
+            self.last_rotation = time.time()
+            self.last_rotation_wait = waited
+            if waited is None:
+                self.wait_timeouts += 1
+                self._last_result = (True, f"NEWNYM sent; no new circuit within {timeout}s")
+            elif wait:
+                self._last_result = (True, f"NEWNYM complete, new circuit after {waited:.2f}s")
+            else:
+                self._last_result = (True, "NEWNYM signal sent")
+            return self._last_result
+
+    async def status(self) -> dict:
+        info = {
+            "configured": self.configured,
+            "address": self.address or None,
+            "connected": False,
+            "connects": self.connects,
+            "rotations": self.rotations,
+            "failures": self.failures,
+            "last_rotation": self.last_rotation,
+            "last_rotation_wait": self.last_rotation_wait,
+            "rate_limited": self.rate_limited,
+            "coalesced": self.coalesced,
+            "wait_timeouts": self.wait_timeouts,
+            "last_error": self.last_error,
+        }
+        if not self.configured:
+            return info
+
+        def query(c):
+            return {
+                "version": str(c.get_version()),
+                "circuit_established": c.get_info("status/circuit-established", "0") == "1",
+                "bootstrap": c.get_info("status/bootstrap-phase", ""),
+            }
+
+        try:
+            info.update(await self._run(query))
+            info["connected"] = True
+        except Exception as e:
+            self.last_error = info["last_error"] = str(e)
+        return info
+
+    async def close(self):
+        async with self._lock:
+            await asyncio.to_thread(self._drop)
+
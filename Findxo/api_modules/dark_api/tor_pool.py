@@ -0,0 +1,235 @@
+"""
+Pool of local tor daemons.
+
+A single tor process caps throughput, so discovery and scraping lease an
+instance from `TorPool` instead of using one fixed SOCKS port. Selection is
+least-loaded (fewest active leases) or latency-weighted (active leases scaled
+by the instance's observed page latency). Instances failing health checks or
+repeated requests are skipped until they recover; a drained instance takes no
+new leases while its in-flight ones finish.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+
+from .tor_control import TorControlClient, TOR_CONTROL, TOR_CONTROL_PASS
+
+logger = logging.getLogger("dark_scraper")
+
+load_dotenv()
+
+TOR_SOCKS = os.getenv("TOR_SOCKS", "127.0.0.1:9050")
+# Comma-separated; TOR_CONTROL_POOL entries pair with TOR_SOCKS_POOL by position (blank = none)
+TOR_SOCKS_POOL = os.getenv("TOR_SOCKS_POOL", "")
+TOR_CONTROL_POOL = os.getenv("TOR_CONTROL_POOL", "")
+TOR_POOL_STRATEGY = os.getenv("TOR_POOL_STRATEGY", "least_loaded")   # least_loaded | latency
+TOR_HEALTH_INTERVAL = float(os.getenv("TOR_HEALTH_INTERVAL", "30"))
+TOR_MAX_FAILURES = int(os.getenv("TOR_MAX_FAILURES", "3"))
+
+
+class NoTorInstance(Exception):
+    pass
+
+
+class TorInstance:
+    def __init__(self, socks: str, control: str = "", password: str = ""):
+        self.socks = socks
+        self.control = TorControlClient(control, password) if control else None
+        self.active = 0
+        self.leases = 0
+        self.latency = None         # EWMA of page fetch seconds
+        self.healthy = True
+        self.draining = False
+        self.failures = 0           # consecutive
+        self.last_check = None
+        self.control_status = None  # from the last health check
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and not self.draining
+
+    def record(self, seconds: float = None, ok: bool = True):
+        if ok:
+            self.failures = 0
+            if seconds is not None:
+                self.latency = seconds if self.latency is None else 0.8 * self.latency + 0.2 * seconds
+        else:
+            self.failures += 1
+            if self.failures >= TOR_MAX_FAILURES and self.healthy:
+                self.healthy = False
+                logger.warning(f"Tor instance {self.socks} marked unhealthy after {self.failures} failures")
+
+    def stats(self) -> dict:
+        return {
+            "socks": self.socks,
+            "control": self.control.address if self.control else None,
+            "healthy": self.healthy,
+            "draining": self.draining,
+            "active": self.active,
+            "leases": self.leases,
+            "latency_s": None if self.latency is None else round(self.latency, 3),
+            "failures": self.failures,
+            "last_check": self.last_check,
+        }
+
+
+class TorPool:
+    def __init__(self, instances: list, strategy: str = TOR_POOL_STRATEGY):
+        if not instances:
+            raise ValueError("TorPool needs at least one instance")
+        self.instances = instances
+        self.strategy = strategy
+        self._health_task = None
+
+    @classmethod
+    def from_env(cls):
+        socks = [s.strip() for s in TOR_SOCKS_POOL.split(",") if s.strip()] or [TOR_SOCKS]
+        if TOR_SOCKS_POOL:
+            controls = [c.strip() for c in TOR_CONTROL_POOL.split(",")]
+        else:
+            controls = [TOR_CONTROL]
+        controls += [""] * (len(socks) - len(controls))
+        return cls([TorInstance(s, c, TOR_CONTROL_PASS) for s, c in zip(socks, controls)])
+
+    def get(self, socks: str) -> TorInstance:
+        for inst in self.instances:
+            if inst.socks == socks:
+                return inst
+        raise KeyError(socks)
+
+    def _cost(self, inst: TorInstance):
+        if self.strategy == "latency":
+            known = [i.latency for i in self.instances if i.latency is not None]
+            # Unmeasured instances are assumed average so they still get traffic
+            latency = inst.latency if inst.latency is not None else (sum(known) / len(known) if known else 1.0)
+            return ((inst.active + 1) * latency, inst.leases)
+        return (inst.active, inst.latency or 0.0, inst.leases)
+
+    def select(self, prefer: str = None) -> TorInstance:
+        if prefer:
+            # Keep work on the instance that already holds its circuits, if still usable
+            for inst in self.instances:
+                if inst.socks == prefer and inst.available:
+                    return inst
+        candidates = [i for i in self.instances if i.available]
+        if not candidates:
+            # Nothing healthy: fall back to any non-drained instance rather than fail outright
+            candidates = [i for i in self.instances if not i.draining]
+        if not candidates:
+            raise NoTorInstance("All Tor instances are draining")
+        return min(candidates, key=self._cost)
+
+    @asynccontextmanager
+    async def lease(self, prefer: str = None):
+        """Hold an instance for one unit of work; failures count towards its health."""
+        inst = self.select(prefer)
+        inst.active += 1
+        inst.leases += 1
+        try:
+            yield inst
+        except Exception:
+            inst.record(ok=False)
+            raise
+        finally:
+            inst.active -= 1
+
+    # --- draining ---
+    def drain(self, socks: str):
+        self.get(socks).draining = True
+
+    def undrain(self, socks: str):
+        self.get(socks).draining = False
+
+    async def wait_drained(self, socks: str, timeout: float = 300) -> bool:
+        inst = self.get(socks)
+        deadline = time.monotonic() + timeout
+        while inst.active and time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+        return inst.active == 0
+
+    # --- health ---
+    async def _check(self, inst: TorInstance):
+        host, port = inst.socks.rsplit(":", 1)
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host, int(port)), 5)
+            writer.close()
+            ok = True
+            if inst.control and inst.control.configured:
+                status = inst.control_status = await inst.control.status()
+                # A reachable control port that reports no circuit means tor is still bootstrapping
+                ok = not status["connected"] or status.get("circuit_established", True)
+        except (OSError, asyncio.TimeoutError):
+            ok = False
+        inst.last_check = time.time()
+        if ok and not inst.healthy:
+            logger.info(f"Tor instance {inst.socks} healthy again")
+            inst.failures = 0
+        elif not ok and inst.healthy:
+            logger.warning(f"Tor instance {inst.socks} failed health check")
+        inst.healthy = ok
+
+    async def check_health(self):
+        await asyncio.gather(*(self._check(i) for i in self.instances))
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(TOR_HEALTH_INTERVAL)
+            try:
+                await self.check_health()
+            except Exception as e:
+                logger.error(f"Tor health check error: {e}")
+
+    async def start(self):
+        for inst in self.instances:
+            if inst.control:
+                await inst.control.connect()
+        await self.check_health()
+        if self._health_task is None:
+            self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        for inst in self.instances:
+            if inst.control:
+                await inst.control.close()
+
+    def stats(self) -> dict:
+        """
+        Pool state as of the last health check. Never queries the control
+        ports, which would contend with rotations for the control lock.
+        """
+        instances = []
+        for inst in self.instances:
+            info = inst.stats()
+            if inst.control:
+                info["control_status"] = inst.control_status
+            instances.append(info)
+        return {"strategy": self.strategy, "instances": instances}
+
+
+_pool = None
+
+
+def get_tor_pool() -> TorPool:
+    global _pool
+    if _pool is None:
+        _pool = TorPool.from_env()
+    return _pool
+
+
+async def shutdown_tor_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
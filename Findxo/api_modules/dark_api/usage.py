@@ -0,0 +1,224 @@
+"""
+Write-behind buffer for API usage counters and key last-use times.
+
+Requests only bump in-memory counters; every USAGE_FLUSH_INTERVAL seconds (and
+at shutdown) the buffer is written out in one transaction: one upsert
+statement adding each (user, key, endpoint, day) increment to its row, and one
+bulk update of api_keys.last_used_at with the latest use per key. Increments
+are added in SQL (`request_count + n`), so concurrent API processes never lose
+counts. The upsert needs the unique indexes from
+find/scripts/019_api_usage_daily_unique.sql (one for rows with an API key, a
+partial one for rows without); without them the buffer falls back to one
+`UPDATE ... SET request_count = request_count + n` per row.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+import threading
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from subscriptions.models import APIKey, APIUsage
+
+logger = logging.getLogger("dark_api")
+
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "2"))
+# 0 forces the per-row UPDATE path (no unique index on api_usage)
+USAGE_UPSERT = os.getenv("USAGE_UPSERT", "1") == "1"
+
+
+def _missing_unique_index(error: DatabaseError) -> bool:
+    """ON CONFLICT had no matching unique index (PostgreSQL 42P10, or SQLite's equivalent)."""
+    if getattr(error.__cause__, "pgcode", None) == "42P10":
+        return True
+    message = str(error).lower()
+    return "on conflict" in message and "unique" in message
+
+
+class UsageBuffer:
+    def __init__(self, interval: float = USAGE_FLUSH_INTERVAL, upsert: bool = USAGE_UPSERT):
+        self.interval = interval
+        self.upsert = upsert
+        self._counts = {}           # (user_id, api_key_id, endpoint, date) -> increment
+        self._last_used = {}        # api_key_id -> datetime
+        # Swapped out by a flush and not yet committed; still counted by pending()
+        self._flushing = {}
+        # Filled from request threads; swapped out by the flush thread
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._task = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.requests_written = 0
+        self.errors = 0
+        self.last_flush_ms = None
+
+    def add(self, user_id, api_key_id, endpoint: str, date, count: int = 1):
+        key = (str(user_id), str(api_key_id) if api_key_id else None, endpoint, date)
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + count
+
+    def touch(self, api_key_id, when):
+        with self._lock:
+            known = self._last_used.get(str(api_key_id))
+            if known is None or when > known:
+                self._last_used[str(api_key_id)] = when
+
+    def pending(self, user_id, date) -> int:
+        """Requests of the user on `date` counted here but not yet flushed."""
+        user_id = str(user_id)
+        with self._lock:
+            return sum(n for counts in (self._counts, self._flushing)
+                       for (u, _, _, d), n in counts.items() if u == user_id and d == date)
+
+    def _swap(self):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            last_used, self._last_used = self._last_used, {}
+            self._flushing = counts
+        return counts, last_used
+
+    def _committed(self):
+        with self._lock:
+            self._flushing = {}
+
+    def _restore(self, counts: dict, last_used: dict):
+        # A failed flush is retried with the next one rather than dropped
+        with self._lock:
+            for key, n in counts.items():
+                self._counts[key] = self._counts.get(key, 0) + n
+            for api_key_id, when in last_used.items():
+                known = self._last_used.get(api_key_id)
+                if known is None or when > known:
+                    self._last_used[api_key_id] = when
+            self._flushing = {}
+
+    def _upsert_counts(self, counts: dict):
+        table = APIUsage._meta.db_table
+        fields = {f.attname: f for f in APIUsage._meta.fields}
+
+        def prep(name, value):
+            # UUIDs are stored differently per backend (uuid vs hex char)
+            return fields[name].get_db_prep_value(value, connection)
+
+        created_at = prep("created_at", timezone.now())
+        keyed = {k: n for k, n in counts.items() if k[1] is not None}
+        keyless = {k: n for k, n in counts.items() if k[1] is None}
+        # Each conflict target names the (partial) unique index it relies on
+        for group, target in (
+            (keyed, "(user_id, api_key_id, endpoint, date) WHERE api_key_id IS NOT NULL"),
+            (keyless, "(user_id, endpoint, date) WHERE api_key_id IS NULL"),
+        ):
+            if not group:
+                continue
+            rows, params = [], []
+            for (user_id, api_key_id, endpoint, date), n in group.items():
+                rows.append("(%s, %s, %s, %s, %s, %s, %s)")
+                params += [prep("id", uuid.uuid4()), prep("user_id", uuid.UUID(user_id)),
+                           prep("api_key_id", api_key_id and uuid.UUID(api_key_id)),
+                           endpoint, prep("date", date), n, created_at]
+            sql = (
+                f"INSERT INTO {table} (id, user_id, api_key_id, endpoint, date, request_count, created_at) "
+                f"VALUES {', '.join(rows)} "
+                f"ON CONFLICT {target} "
+                f"DO UPDATE SET request_count = {table}.request_count + EXCLUDED.request_count"
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+
+    def _update_counts(self, counts: dict):
+        for (user_id, api_key_id, endpoint, date), n in counts.items():
+            updated = APIUsage.objects.filter(
+                user_id=user_id, api_key_id=api_key_id, endpoint=endpoint, date=date
+            ).update(request_count=F('request_count') + n)
+            if not updated:
+                APIUsage.objects.create(user_id=user_id, api_key_id=api_key_id, endpoint=endpoint,
+                                        date=date, request_count=n)
+
+    def _write(self, counts: dict, last_used: dict):
+        # One transaction, so a failed flush can be restored in full
+        with transaction.atomic():
+            if counts and self.upsert:
+                try:
+                    # Savepoint: a missing unique index only rolls back this statement
+                    with transaction.atomic():
+                        self._upsert_counts(counts)
+                    counts = {}
+                except DatabaseError as e:
+                    if not _missing_unique_index(e):
+                        # Anything else (e.g. a dropped connection) fails this flush only
+                        raise
+                    logger.warning(f"Usage upsert unavailable ({e}); falling back to per-row updates")
+                    self.upsert = False
+            if counts:
+                self._update_counts(counts)
+            if last_used:
+                APIKey.objects.bulk_update(
+                    [APIKey(id=api_key_id, last_used_at=when) for api_key_id, when in last_used.items()],
+                    ["last_used_at"],
+                )
+
+    def flush(self) -> int:
+        """Write pending usage; returns the number of requests written. Blocking."""
+        with self._flush_lock:
+            counts, last_used = self._swap()
+            if not counts and not last_used:
+                return 0
+            started = time.perf_counter()
+            try:
+                self._write(counts, last_used)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Failed to flush API usage: {e}")
+                self._restore(counts, last_used)
+                return 0
+            self._committed()
+            self.flushes += 1
+            self.rows_written += len(counts) + len(last_used)
+            written = sum(counts.values())
+            self.requests_written += written
+            self.last_flush_ms = round((time.perf_counter() - started) * 1000, 1)
+            return written
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await asyncio.to_thread(self.flush)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = sum(self._counts.values())
+            keys = len(self._last_used)
+        return {
+            "interval": self.interval,
+            "upsert": self.upsert,
+            "pending_requests": pending,
+            "pending_keys": keys,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "requests_written": self.requests_written,
+            "errors": self.errors,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+usage_buffer = UsageBuffer()
@@ -0,0 +1,294 @@
+"""
+Checksum validation for entities extracted by the scraper.
+
+The extraction regexes only match the shape of an address or number, so most
+candidates on a noisy page are false positives. The checks here confirm the
+embedded checksum (Base58Check / bech32 for BTC, EIP-55 for mixed-case ETH,
+Monero base58 + Keccak for XMR, Luhn for cards, mod-97 for IBANs) and are run
+once per session over every unique candidate.
+"""
+
+import hashlib
+import logging
+
+logger = logging.getLogger("dark_scraper")
+
+VALIDATION_MODES = ("none", "flag", "drop")
+
+# -----------------------
+# Keccak-256 (pre-NIST padding, as used by Ethereum and Monero)
+# -----------------------
+_KECCAK_RC = [
+    0x0000000000000001, 0x0000000000008082, 0x800000000000808A, 0x8000000080008000,
+    0x000000000000808B, 0x0000000080000001, 0x8000000080008081, 0x8000000000008009,
+    0x000000000000008A, 0x0000000000000088, 0x0000000080008009, 0x000000008000000A,
+    0x000000008000808B, 0x800000000000008B, 0x8000000000008089, 0x8000000000008003,
+    0x8000000000008002, 0x8000000000000080, 0x000000000000800A, 0x800000008000000A,
+    0x8000000080008081, 0x8000000000008080, 0x0000000080000001, 0x8000000080008008,
+]
+_KECCAK_ROT = [
+    [0, 36, 3, 41, 18],
+    [1, 44, 10, 45, 2],
+    [62, 6, 43, 15, 61],
+    [28, 55, 25, 21, 56],
+    [27, 20, 39, 8, 14],
+]
+_MASK64 = (1 << 64) - 1
+
+
+def _rotl64(v: int, n: int) -> int:
+    return ((v << n) | (v >> (64 - n))) & _MASK64 if n else v
+
+
+def _keccak_f(a: list) -> None:
+    for rc in _KECCAK_RC:
+        c = [a[x][0] ^ a[x][1] ^ a[x][2] ^ a[x][3] ^ a[x][4] for x in range(5)]
+        d = [c[(x - 1) % 5] ^ _rotl64(c[(x + 1) % 5], 1) for x in range(5)]
+        b = [[0] * 5 for _ in range(5)]
+        for x in range(5):
+            for y in range(5):
+                b[y][(2 * x + 3 * y) % 5] = _rotl64(a[x][y] ^ d[x], _KECCAK_ROT[x][y])
+        for x in range(5):
+            for y in range(5):
+                a[x][y] = b[x][y] ^ (~b[(x + 1) % 5][y] & b[(x + 2) % 5][y])
+        a[0][0] ^= rc
+
+
+def keccak256(data: bytes) -> bytes:
+    rate = 136
+    padded = bytearray(data)
+    padded.append(0x01)
+    padded.extend(b"\x00" * (-len(padded) % rate))
+    padded[-1] |= 0x80
+    state = [[0] * 5 for _ in range(5)]
+    for off in range(0, len(padded), rate):
+        block = padded[off:off + rate]
+        for i in range(rate // 8):
+            state[i % 5][i // 5] ^= int.from_bytes(block[i * 8:i * 8 + 8], "little")
+        _keccak_f(state)
+    out = b"".join(state[i % 5][i // 5].to_bytes(8, "little") for i in range(4))
+    return out
+
+
+# -----------------------
+# Base58 helpers
+# -----------------------
+B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+_B58_INDEX = {c: i for i, c in enumerate(B58_ALPHABET)}
+
+
+def _b58_to_int(s: str):
+    n = 0
+    for ch in s:
+        digit = _B58_INDEX.get(ch)
+        if digit is None:
+            return None
+        n = n * 58 + digit
+    return n
+
+
+def b58decode_check(s: str):
+    """Decode a Bitcoin Base58Check string; returns the payload or None."""
+    n = _b58_to_int(s)
+    if n is None:
+        return None
+    raw = n.to_bytes((n.bit_length() + 7) // 8, "big")
+    raw = b"\x00" * (len(s) - len(s.lstrip("1"))) + raw
+    if len(raw) < 5:
+        return None
+    payload, checksum = raw[:-4], raw[-4:]
+    if hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4] != checksum:
+        return None
+    return payload
+
+
+# Monero encodes 8-byte blocks as 11 characters; a short last block maps back by index
+_XMR_BLOCK_SIZES = [0, 2, 3, 5, 6, 7, 9, 10, 11]
+
+
+def xmr_b58decode(s: str):
+    """Decode Monero's block-wise base58; returns bytes or None."""
+    out = bytearray()
+    for off in range(0, len(s), 11):
+        chunk = s[off:off + 11]
+        try:
+            size = _XMR_BLOCK_SIZES.index(len(chunk))
+        except ValueError:
+            return None
+        n = _b58_to_int(chunk)
+        if n is None or n >> (8 * size):
+            return None
+        out.extend(n.to_bytes(size, "big"))
+    return bytes(out)
+
+
+# -----------------------
+# Bech32 / bech32m (BIP-173 / BIP-350)
+# -----------------------
+BECH32_CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+_BECH32_CONST = 1
+_BECH32M_CONST = 0x2BC830A3
+
+
+def _bech32_polymod(values) -> int:
+    gen = (0x3B6A57B2, 0x26508E6D, 0x1EA119FA, 0x3D4233DD, 0x2A1462B3)
+    chk = 1
+    for v in values:
+        top = chk >> 25
+        chk = (chk & 0x1FFFFFF) << 5 ^ v
+        for i in range(5):
+            chk ^= gen[i] if (top >> i) & 1 else 0
+    return chk
+
+
+def _convertbits(data, frombits: int, tobits: int):
+    acc = bits = 0
+    out = []
+    maxv = (1 << tobits) - 1
+    for v in data:
+        acc = (acc << frombits) | v
+        bits += frombits
+        while bits >= tobits:
+            bits -= tobits
+            out.append((acc >> bits) & maxv)
+    if bits >= frombits or (acc << (tobits - bits)) & maxv:
+        return None
+    return out
+
+
+def is_valid_segwit(addr: str, hrp: str = "bc") -> bool:
+    if addr.lower() != addr and addr.upper() != addr:
+        return False
+    addr = addr.lower()
+    pos = addr.rfind("1")
+    if addr[:pos] != hrp or pos + 7 > len(addr) or len(addr) > 90:
+        return False
+    try:
+        data = [BECH32_CHARSET.index(c) for c in addr[pos + 1:]]
+    except ValueError:
+        return False
+    expanded = [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp]
+    const = _bech32_polymod(expanded + data)
+    if not data or data[0] > 16:
+        return False
+    if const != (_BECH32_CONST if data[0] == 0 else _BECH32M_CONST):
+        return False
+    program = _convertbits(data[1:-6], 5, 8)
+    if program is None or not 2 <= len(program) <= 40:
+        return False
+    return data[0] != 0 or len(program) in (20, 32)
+
+
+# -----------------------
+# Per-entity validators
+# -----------------------
+def is_valid_btc(addr: str) -> bool:
+    if addr[:3].lower() == "bc1":
+        return is_valid_segwit(addr)
+    payload = b58decode_check(addr)
+    # 0x00 = P2PKH, 0x05 = P2SH
+    return payload is not None and len(payload) == 21 and payload[0] in (0x00, 0x05)
+
+
+def is_valid_eth(addr: str) -> bool:
+    body = addr[2:]
+    if len(body) != 40 or not addr.startswith("0x"):
+        return False
+    if body.lower() == body or body.upper() == body:
+        # No EIP-55 checksum to verify
+        return True
+    digest = keccak256(body.lower().encode("ascii")).hex()
+    for ch, h in zip(body, digest):
+        if ch.isalpha() and ch.isupper() != (int(h, 16) >= 8):
+            return False
+    return True
+
+
+def is_valid_xmr(addr: str) -> bool:
+    # 95 chars: standard/subaddress (69 bytes); 106 chars: integrated (77 bytes)
+    if len(addr) not in (95, 106):
+        return False
+    raw = xmr_b58decode(addr)
+    if raw is None or len(raw) not in (69, 77):
+        return False
+    return keccak256(raw[:-4])[:4] == raw[-4:]
+
+
+def luhn_ok(number: str) -> bool:
+    digits = [int(c) for c in number if c.isdigit()]
+    if len(digits) < 12:
+        return False
+    total = 0
+    for i, d in enumerate(reversed(digits)):
+        if i % 2:
+            d *= 2
+            if d > 9:
+                d -= 9
+        total += d
+    return total % 10 == 0
+
+
+def is_valid_iban(iban: str) -> bool:
+    iban = iban.replace(" ", "").upper()
+    if not 15 <= len(iban) <= 34 or not iban.isalnum():
+        return False
+    rearranged = iban[4:] + iban[:4]
+    return int("".join(str(int(c, 36)) for c in rearranged)) % 97 == 1
+
+
+VALIDATORS = {
+    "btc_addresses": is_valid_btc,
+    "eth_addresses": is_valid_eth,
+    "xmr_addresses": is_valid_xmr,
+    "credit_cards": luhn_ok,
+    "ibans": is_valid_iban,
+}
+
+
+# -----------------------
+# Session batch
+# -----------------------
+def validate_session_entities(results: list, mode: str = "flag") -> dict:
+    """
+    Validate every checksummed entity across a session's page results in one pass.
+
+    Each unique candidate is checked once no matter how many pages repeat it. With
+    mode="drop" invalid candidates are removed from each page's `entities`; with
+    mode="flag" they are kept and listed under the page's `invalid_entities`.
+    Returns a summary for the session report.
+    """
+    summary = {"mode": mode, "checked": 0, "invalid": 0}
+    if mode == "none":
+        return summary
+
+    verdicts = {}
+    for field, check in VALIDATORS.items():
+        unique = set()
+        for res in results:
+            unique.update((res.get("entities") or {}).get(field, ()))
+        for cand in unique:
+            try:
+                verdicts[(field, cand)] = check(cand)
+            except Exception as e:
+                logger.debug(f"Validation of {field} candidate failed: {e}")
+                verdicts[(field, cand)] = False
+    summary["checked"] = len(verdicts)
+    summary["invalid"] = sum(1 for ok in verdicts.values() if not ok)
+
+    for res in results:
+        entities = res.get("entities") or {}
+        invalid = {}
+        for field in VALIDATORS:
+            values = entities.get(field)
+            if not values:
+                continue
+            bad = [v for v in values if not verdicts[(field, v)]]
+            if not bad:
+                continue
+            if mode == "drop":
+                entities[field] = [v for v in values if verdicts[(field, v)]]
+            else:
+                invalid[field] = bad
+        if invalid:
+            res["invalid_entities"] = invalid
+    return summary
@@ -0,0 +1,120 @@
+"""
+Startup warm-up for the scraper.
+
+Without it the first search after a deploy pays for the extraction workers
+spawning, the browser launch, tor building circuits and fetching the engines'
+onion descriptors, and the clearnet engine's TLS handshake. `start_warm_up`
+runs all of that in the background at startup; `/ready` reports "not ready"
+until it has finished.
+"""
+
+import os
+import time
+import asyncio
+import logging
+
+import requests
+
+from .browser import get_browser_manager
+from .extraction import get_extraction_executor
+from .scraper import SEARCH_ENGINES, build_tor_proxies, get_engine_session
+from .tor_pool import get_tor_pool
+
+logger = logging.getLogger("dark_scraper")
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+# Upper bound per warm-up step; a step that times out is recorded as failed
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "120"))
+
+
+class WarmupState:
+    def __init__(self):
+        self.started_at = None
+        self.finished_at = None
+        self.steps = {}
+        self._task = None
+
+    @property
+    def ready(self) -> bool:
+        return self.finished_at is not None
+
+    def snapshot(self) -> dict:
+        return {
+            "ready": self.ready,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "steps": dict(self.steps),
+        }
+
+    async def step(self, name: str, coro):
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(coro, WARMUP_TIMEOUT)
+            self.steps[name] = {"ok": True}
+        except Exception as e:
+            self.steps[name] = {"ok": False, "error": str(e) or type(e).__name__}
+            logger.warning(f"Warm-up step {name} failed: {e}")
+        self.steps[name]["seconds"] = round(time.monotonic() - started, 3)
+
+
+def _fetch(url: str, proxies=None):
+    # Any response (even an error page) means the connection or circuit is up.
+    # Tor fetches skip the shared session: later searches use their own isolated
+    # proxy pools anyway, what is being warmed is tor's circuits and descriptors.
+    if proxies:
+        requests.get(url, proxies=proxies, timeout=60)
+    else:
+        get_engine_session().get(url, timeout=60)
+
+
+async def _prime_engines():
+    """Clearnet handshakes on the shared session, plus circuits and onion descriptors per tor instance."""
+    jobs = []
+    for engine in SEARCH_ENGINES:
+        if not engine["tor"]:
+            jobs.append(asyncio.to_thread(_fetch, engine["referer"]))
+            continue
+        for inst in get_tor_pool().instances:
+            jobs.append(asyncio.to_thread(_fetch, engine["referer"], build_tor_proxies(socks=inst.socks)))
+    results = await asyncio.gather(*jobs, return_exceptions=True)
+    failed = [r for r in results if isinstance(r, Exception)]
+    if failed and len(failed) == len(results):
+        raise failed[0]
+
+
+async def _warm_tor():
+    await get_tor_pool().start()
+    await _prime_engines()
+
+
+async def warm_up(state: WarmupState):
+    state.started_at = time.time()
+    await asyncio.gather(
+        state.step("extraction", get_extraction_executor().warm_up()),
+        state.step("browser", get_browser_manager().get()),
+        state.step("tor", _warm_tor()),
+    )
+    state.finished_at = time.time()
+    logger.info(f"Warm-up finished in {state.finished_at - state.started_at:.1f}s")
+
+
+warmup_state = WarmupState()
+
+
+def start_warm_up():
+    if not WARMUP_ENABLED:
+        # Ready at once; the tor pool still needs its control connections and health loop
+        warmup_state.started_at = warmup_state.finished_at = time.time()
+        warmup_state._task = asyncio.get_running_loop().create_task(get_tor_pool().start())
+        return
+    warmup_state._task = asyncio.get_running_loop().create_task(warm_up(warmup_state))
+
+
+async def stop_warm_up():
+    task = warmup_state._task
+    if task is not None and not task.done():
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
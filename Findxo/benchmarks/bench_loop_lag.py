@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Event-loop lag under concurrent searches: inline extraction vs the extraction pool.
+
+Usage: python benchmarks/bench_loop_lag.py [--searches 8] [--pages 5] [--kb 400]
+"""
+
+import sys
+import time
+import random
+import asyncio
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from api_modules.common.loop_monitor import LoopLagMonitor  # noqa: E402
+from api_modules.dark_api.extraction import ExtractionExecutor, process_page  # noqa: E402
+
+
+def synthetic_page(kb: int) -> dict:
+    words = ["market", "vendor", "escrow", "leak", "dump", "admin@example.com",
+             "1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa", "+1 (555) 010-9999", "4111111111111111"]
+    text = " ".join(random.choice(words) for _ in range(kb * 1024 // 8))
+    links = "".join(f'<a href="/p/{i}">link {i}</a>' for i in range(kb * 2))
+    html = f"<html><head><title>bench</title></head><body><p>{text}</p>{links}</body></html>"
+    return {"url": "http://bench.onion/", "html": html, "text": text, "keyword": "leak"}
+
+
+async def run(mode: str, searches: int, pages: int, kb: int) -> dict:
+    monitor = LoopLagMonitor(interval=0.01, samples=100000)
+    executor = ExtractionExecutor(workers=0 if mode == "thread" else 4)
+    if mode == "process":
+        await executor.warm_up()
+    payloads = [synthetic_page(kb) for _ in range(pages)]
+
+    async def search():
+        for payload in payloads:
+            if mode == "inline":
+                process_page(payload)
+            else:
+                await executor.extract(payload)
+            await asyncio.sleep(0)
+
+    monitor.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(search() for _ in range(searches)))
+    elapsed = time.perf_counter() - start
+    await monitor.stop()
+    executor.shutdown()
+    return {"mode": mode, "elapsed_s": round(elapsed, 2), **monitor.snapshot()}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--searches", type=int, default=8)
+    ap.add_argument("--pages", type=int, default=5)
+    ap.add_argument("--kb", type=int, default=400)
+    args = ap.parse_args()
+    for mode in ("inline", "thread", "process"):
+        print(asyncio.run(run(mode, args.searches, args.pages, args.kb)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Per-pattern timing of the scraper's entity regexes on adversarial inputs.
+
+Usage: python benchmarks/bench_patterns.py [--size 200000]
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from api_modules.dark_api import scraper  # noqa: E402
+
+
+def adversarial_inputs(n: int) -> dict:
+    return {
+        "digits": "1" * n,
+        "digit_separators": "1-2 3.4 " * (n // 8),
+        "phone_fragments": "9241 +" * (n // 6),
+        "parens": "+1 (23) 4 " * (n // 10),
+        "alnum": "a" * n,
+        "alnum_dots": "a." * (n // 2),
+        "at_then_run": "a@" + "b" * n,
+        "xmr_like": ("4" + "A" * 200 + " ") * (n // 202),
+        "pgp_unterminated": "-----BEGIN PGP PUBLIC KEY BLOCK-----\n" * (n // 37),
+        "prose": "lorem ipsum dolor sit amet, contact admin@example.com +1 555 010 9999. " * (n // 72),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size", type=int, default=200000)
+    args = ap.parse_args()
+
+    patterns = dict(scraper.TOKEN_PATTERNS, pgp_keys=scraper.PGP_RE)
+    inputs = adversarial_inputs(args.size)
+    print(f"{'input':<18}" + "".join(f"{name[:10]:>12}" for name in patterns))
+    for label, text in inputs.items():
+        row = []
+        for pattern in patterns.values():
+            start = time.perf_counter()
+            pattern.findall(text)
+            row.append((time.perf_counter() - start) * 1000)
+        print(f"{label:<18}" + "".join(f"{ms:>10.1f}ms" for ms in row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Report serialization and compression: the previous response path (pydantic
+response_model validation + stdlib json) against fastjson, and gzip/brotli
+size and time at the configured levels.
+
+Usage: python benchmarks/bench_report_json.py [report.json ...] [--pages 20] [--links 2000] [--repeat 5]
+Without report files a session is synthesized with process_page.
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+from pathlib import Path
+
+from pydantic import BaseModel
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from api_modules.common import compression  # noqa: E402
+from api_modules.common.fastjson import ORJSON_AVAILABLE, dumps  # noqa: E402
+from api_modules.dark_api.extraction import process_page  # noqa: E402
+
+PGP = "-----BEGIN PGP PUBLIC KEY BLOCK-----\n" + "\n".join(
+    "".join(random.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdef0123456789+/") for _ in range(64)) for _ in range(40)
+) + "\n-----END PGP PUBLIC KEY BLOCK-----"
+
+
+class SearchResponse(BaseModel):
+    # Mirrors dark_api.router.SearchResponse, which cannot be imported without Django
+    session_id: str
+    keyword: str
+    timestamp: str
+    entity_validation: dict | None = None
+    prefetch: dict | None = None
+    results: list
+
+
+def synthetic_report(pages: int, links: int) -> dict:
+    results = []
+    for i in range(pages):
+        text = " ".join(random.choice(["leak", "dump", "vendor", "admin@example.com", "escrow"]) for _ in range(4000))
+        anchors = "".join(f'<a href="/listing/{i}/{j}">item {j}</a>' for j in range(links))
+        html = f"<html><head><title>market {i}</title></head><body><p>{text}</p><pre>{PGP}</pre>{anchors}</body></html>"
+        res = process_page({"url": f"http://market{i}.onion/", "html": html, "text": text + PGP, "keyword": "leak"})
+        res.pop("term_stats", None)
+        res.update(url=f"http://market{i}.onion/", ok=True, depth=0, relevance_score=random.random(),
+                   timing={"connect_ms": 812.4, "ttfb_ms": 1530.2, "total_ms": 4210.9, "bytes": len(html)})
+        results.append(res)
+    return {"session_id": "bench", "keyword": "leak", "timestamp": "20240101_000000",
+            "entity_validation": {}, "prefetch": {}, "results": results}
+
+
+def best_of(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def bench(name: str, report: dict, repeat: int):
+    def stdlib_response():
+        model = SearchResponse.model_validate(report)
+        return json.dumps(model.model_dump(mode="json"), ensure_ascii=False, separators=(",", ":")).encode()
+
+    body = dumps(report)
+    row = {
+        "report": name,
+        "bytes": len(body),
+        "response_stdlib_ms": round(best_of(stdlib_response, repeat), 1),
+        "response_fast_ms": round(best_of(lambda: dumps(report), repeat), 1),
+        "report_file_stdlib_ms": round(best_of(lambda: json.dumps(report, indent=2), repeat), 1),
+        "report_file_fast_ms": round(best_of(lambda: dumps(report, indent=True), repeat), 1),
+    }
+    for encoding in ("gzip", "br") if compression.BROTLI_AVAILABLE else ("gzip",):
+        row[f"{encoding}_ms"] = round(best_of(lambda: compression.compress(body, encoding), repeat), 1)
+        row[f"{encoding}_bytes"] = len(compression.compress(body, encoding))
+    print(row)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("reports", nargs="*", help="report.json files from tor_scrape_output")
+    ap.add_argument("--pages", type=int, default=20)
+    ap.add_argument("--links", type=int, default=2000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    print({"orjson": ORJSON_AVAILABLE, "brotli": compression.BROTLI_AVAILABLE})
+    if args.reports:
+        for path in args.reports:
+            bench(path, json.loads(Path(path).read_text()), args.repeat)
+    else:
+        bench(f"synthetic {args.pages}x{args.links} links", synthetic_report(args.pages, args.links), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
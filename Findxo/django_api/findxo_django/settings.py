@@ -73,6 +73,18 @@ DATABASES = {
     )
 }
 
+# A shared cache (e.g. redis://host:6379/0) carries API-key cache invalidations
+# from these views to every API process; the default is per-process memory
+CACHE_URL = os.getenv('CACHE_URL', '')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_URL,
+    } if CACHE_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -0,0 +1,148 @@
+"""
+In-process cache of resolved API keys.
+
+Resolving a key for the dark API (key, user, latest subscription with its
+plan) takes one query. `auth_cache` keeps the result per key hash for
+AUTH_CACHE_TTL seconds, so a hot key authenticates without touching the
+database (today's usage is counted in memory by the API's quota counter).
+
+Views and webhooks that revoke keys or change subscriptions call
+`invalidate_key` / `invalidate_user`. Besides dropping local entries, each
+call stamps Django's cache; entries loaded before the stamp are ignored. The
+views run in the Django process, so the stamps only reach the API when the
+cache backend is shared (CACHE_URL). With the default per-process memory cache
+the API cache stays off, and every request resolves its key from the database,
+so a revoked key or a downgraded plan takes effect immediately.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+# Daily limit for users without a current subscription
+FREE_DAILY_REQUESTS = 10
+
+
+def shared_cache_configured() -> bool:
+    """Whether Django's default cache is visible to other processes (not local memory)."""
+    backend = settings.CACHES.get("default", {}).get("BACKEND", "")
+    return not backend.endswith(("LocMemCache", "DummyCache"))
+
+
+def _stamp_key(kind: str, ident) -> str:
+    return f"auth_cache:{kind}:{ident}"
+
+
+class AuthEntry:
+    def __init__(self, key_record, user, plan_name: str = None, daily_requests: int = None,
+                 subscription_expires_at=None, loaded_at: float = None):
+        self.key_record = key_record
+        self.user = user
+        self.user_id = str(user.id)
+        self.key_id = str(key_record.id)
+        # Plan of the latest active subscription; None without one
+        self.plan_name = plan_name
+        self.daily_requests = daily_requests
+        self.subscription_expires_at = subscription_expires_at
+        # Taken before the queries ran, so an invalidation racing the load still wins
+        self.loaded_at = loaded_at or time.time()
+
+    def plan_limit(self, now) -> int:
+        """Daily limit at `now`; an expired subscription falls back to the free limit."""
+        if self.daily_requests is None:
+            return FREE_DAILY_REQUESTS
+        if self.subscription_expires_at and self.subscription_expires_at < now:
+            return FREE_DAILY_REQUESTS
+        return self.daily_requests
+
+    def plan_tier(self, now) -> str:
+        """Plan name at `now`; "free" without a current subscription."""
+        if self.plan_name is None:
+            return "free"
+        if self.subscription_expires_at and self.subscription_expires_at < now:
+            return "free"
+        return self.plan_name
+
+
+class AuthCache:
+    def __init__(self, ttl: float = None, max_entries: int = AUTH_CACHE_SIZE):
+        if ttl is None:
+            # Invalidations from the Django process could not reach a local-memory cache
+            ttl = AUTH_CACHE_TTL if shared_cache_configured() else 0
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # Filled from threadpool workers; invalidated from Django views
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest: str):
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(digest)
+        if entry is not None and time.time() - entry.loaded_at > self.ttl:
+            entry = None
+        if entry is not None:
+            stamps = cache.get_many([_stamp_key("user", entry.user_id), _stamp_key("key", entry.key_id)])
+            if any(stamp >= entry.loaded_at for stamp in stamps.values()):
+                entry = None
+        if entry is None:
+            self.misses += 1
+            with self._lock:
+                self._entries.pop(digest, None)
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, digest: str, entry: AuthEntry) -> AuthEntry:
+        if self.ttl <= 0:
+            return entry
+        with self._lock:
+            self._entries[digest] = entry
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    # --- invalidation ---
+    def _drop(self, match):
+        with self._lock:
+            for digest in [d for d, e in self._entries.items() if match(e)]:
+                del self._entries[digest]
+
+    def invalidate_user(self, user_id):
+        user_id = str(user_id)
+        cache.set(_stamp_key("user", user_id), time.time(), self.ttl * 2 or None)
+        self._drop(lambda e: e.user_id == user_id)
+
+    def invalidate_key(self, key_id):
+        key_id = str(key_id)
+        cache.set(_stamp_key("key", key_id), time.time(), self.ttl * 2 or None)
+        self._drop(lambda e: e.key_id == key_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"ttl": self.ttl, "entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+auth_cache = AuthCache()
+
+
+def invalidate_user(user_id):
+    auth_cache.invalidate_user(user_id)
+
+
+def invalidate_key(key_id):
+    auth_cache.invalidate_key(key_id)
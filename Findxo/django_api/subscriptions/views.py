@@ -8,6 +8,7 @@ from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from .models import SubscriptionPlan, UserSubscription, APIKey
+from .auth_cache import invalidate_key, invalidate_user
 from .serializers import PlanSerializer, SubscriptionSerializer, SubscribeInputSerializer, APIKeySerializer
 from django.conf import settings
 from django.urls import reverse
@@ -176,6 +177,7 @@ class SolanaVerifyView(generics.GenericAPIView):
                 status='active',
                 solana_signature=signature_str
             )
+            invalidate_user(user.id)
 
             return Response({
                 'success': True, 
@@ -215,6 +217,7 @@ class CancelSubscriptionView(generics.GenericAPIView):
 
         sub.status = 'canceled'
         sub.save()
+        invalidate_user(user.id)
         return Response({'detail': 'Subscription marked as canceled.'})
 
 class SubscriptionStatusView(generics.RetrieveAPIView):
@@ -315,4 +318,5 @@ class RevokeAPIKeyView(generics.GenericAPIView):
              return Response({'detail': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
         
         APIKey.objects.filter(user_id=profile.user.id, id=pk).update(status='revoked')
+        invalidate_key(pk)
         return Response({'detail': 'API Key revoked'}, status=status.HTTP_200_OK)
@@ -6,6 +6,7 @@ from django.db import transaction
 from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from .models import UserSubscription, SubscriptionPlan
+from .auth_cache import invalidate_user
 from datetime import datetime, timedelta
 from django.utils import timezone
 
@@ -59,6 +60,7 @@ def handle_charge_success(event):
                 sub.expires_at = timezone.now() + timedelta(days=days)
                 sub.status = 'active'
                 sub.save()
+                invalidate_user(sub.user_id)
                 return
         return
 
@@ -89,6 +91,7 @@ def handle_charge_success(event):
                 paystack_subscription_id=paystack_subscription_id,
                 paystack_customer_code=customer_code
             )
+        invalidate_user(user_id)
     except Exception as e:
         print(f"Error handling charge.success: {e}")
 
@@ -103,10 +106,14 @@ def handle_subscription_disable(event):
     subscription_code = data.get('subscription_code')
     
     if subscription_code:
-        UserSubscription.objects.filter(paystack_subscription_id=subscription_code).update(
+        subs = UserSubscription.objects.filter(paystack_subscription_id=subscription_code)
+        user_ids = set(subs.values_list('user_id', flat=True))
+        subs.update(
             status='canceled',
             expires_at=timezone.now()
         )
+        for user_id in user_ids:
+            invalidate_user(user_id)
 
 def handle_payment_failed(event):
     data = event['data']
@@ -35,6 +35,17 @@ try:
 except Exception:
     STEM_AVAILABLE = False
 
+# Shared NEWNYM helper when run from the repo root; otherwise a plain NEWNYM
+try:
+    from api_modules.dark_api.tor_control import TOR_NEWNYM_INTERVAL, TOR_NEWNYM_TIMEOUT, newnym_and_wait
+except Exception:
+    TOR_NEWNYM_INTERVAL = float(os.getenv("TOR_NEWNYM_INTERVAL", "10"))
+    TOR_NEWNYM_TIMEOUT = float(os.getenv("TOR_NEWNYM_TIMEOUT", "15"))
+
+    def newnym_and_wait(controller, timeout: float = TOR_NEWNYM_TIMEOUT):
+        controller.signal(Signal.NEWNYM)
+        return None
+
 # Optional language detection
 try:
     from langdetect import detect as detect_lang
@@ -98,18 +109,33 @@ XMR_RE = re.compile(r"\b4[0-9A-Za-z]{90,110}\b")
 # -----------------------
 # Tor control / NEWNYM
 # -----------------------
+_last_newnym = 0.0
+
 def rotate_tor_identity():
+    """
+    NEWNYM, then block until tor has built a fresh circuit (bounded by
+    TOR_NEWNYM_TIMEOUT) instead of sleeping a fixed time. Calls closer together
+    than tor's NEWNYM rate limit are delayed rather than silently ignored.
+    Blocking: async code runs it via asyncio.to_thread.
+    """
+    global _last_newnym
     if not STEM_AVAILABLE or not TOR_CONTROL:
         return False, "Stem or TOR_CONTROL not configured"
     try:
+        delay = _last_newnym + TOR_NEWNYM_INTERVAL - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
         host, port = TOR_CONTROL.split(":")
         with Controller.from_port(address=host, port=int(port)) as c:
             if TOR_CONTROL_PASS:
                 c.authenticate(password=TOR_CONTROL_PASS)
             else:
                 c.authenticate()
-            c.signal(Signal.NEWNYM)
-        return True, "NEWNYM signal sent"
+            _last_newnym = time.monotonic()
+            waited = newnym_and_wait(c, TOR_NEWNYM_TIMEOUT)
+        if waited is None:
+            return True, f"NEWNYM sent; no new circuit within {TOR_NEWNYM_TIMEOUT}s"
+        return True, f"NEWNYM complete, new circuit after {waited:.2f}s"
     except Exception as e:
         return False, f"Failed NEWNYM: {e}"
 
@@ -207,7 +233,6 @@ def search_ahmia(keyword: str, max_results: int = 10, timeout: int = 180):
             if STEM_AVAILABLE and TOR_CONTROL:
                 ok, msg = rotate_tor_identity()
                 logger.info(f"[v0] Tor identity rotation for {engine['name']}: {msg}")
-                time.sleep(15)
 
         # Anti-rate-limiting delay
         time.sleep(10)
@@ -539,9 +564,8 @@ async def run_session():
     async with async_playwright() as pw:
         for idx, link in enumerate(onion_links, start=1):
             if rotate:
-                ok, msg = rotate_tor_identity()
+                ok, msg = await asyncio.to_thread(rotate_tor_identity)
                 logger.info(("[âœ”]" if ok else "[!]") + f" {msg}")
-                await asyncio.sleep(3 + random.random() * 3)
 
             meta, site_dir = await scrape_onion_page(pw, link, session_dir / "reports", keyword, depth=0)
             results.append(meta)
@@ -553,9 +577,8 @@ async def run_session():
                 for j, il in enumerate(internals, start=1):
                     try:
                         if rotate:
-                            ok, msg = rotate_tor_identity()
+                            ok, msg = await asyncio.to_thread(rotate_tor_identity)
                             logger.info(("[âœ”]" if ok else "[!]") + f" {msg}")
-                            await asyncio.sleep(2 + random.random() * 2)
                         submeta, subdir = await scrape_onion_page(pw, il, session_dir / "reports", keyword, depth=1)
                         results.append(submeta)
                         await asyncio.sleep(random.uniform(1.0, 3.0))
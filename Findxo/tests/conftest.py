@@ -61,3 +61,21 @@ def create_user_and_token(client):
 
 	return _create
 
+
+
+@pytest.fixture()
+def subscription_tables():
+	# The Supabase tables are unmanaged; create them in the test database for the duration of a test
+	from django.db import connection
+	from accounts.models import SupabaseUser
+	from subscriptions.models import SubscriptionPlan, UserSubscription, APIKey, APIUsage
+	models = [SupabaseUser, SubscriptionPlan, UserSubscription, APIKey, APIUsage]
+	with connection.schema_editor() as editor:
+		for model in models:
+			editor.create_model(model)
+	try:
+		yield
+	finally:
+		with connection.schema_editor() as editor:
+			for model in reversed(models):
+				editor.delete_model(model)
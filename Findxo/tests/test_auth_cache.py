@@ -0,0 +1,141 @@
+import hashlib
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from fastapi import HTTPException
+
+
+def make_entry(daily_requests=100, expires_at=None, loaded_at=None):
+	from subscriptions.auth_cache import AuthEntry
+	user = SimpleNamespace(id=uuid.uuid4(), wallet_address="wallet")
+	key = SimpleNamespace(id=uuid.uuid4(), user_id=user.id, expires_at=None)
+	return AuthEntry(key, user, "pro", daily_requests, expires_at, loaded_at=loaded_at)
+
+
+def test_entries_expire_and_invalidate():
+	from subscriptions.auth_cache import AuthCache, FREE_DAILY_REQUESTS
+	cache = AuthCache(ttl=60)
+	entry = cache.put("d1", make_entry())
+	other = cache.put("d2", make_entry())
+	assert cache.get("d1") is entry
+	cache.invalidate_key(entry.key_id)
+	assert cache.get("d1") is None and cache.get("d2") is other
+	cache.invalidate_user(other.user_id)
+	assert cache.get("d2") is None
+	# An entry whose load started before the invalidation is not trusted either
+	cache.put("d2", make_entry(loaded_at=1.0))
+	assert cache.get("d2") is None
+
+	now = timezone.now()
+	assert make_entry(expires_at=now - timedelta(days=1)).plan_limit(now) == FREE_DAILY_REQUESTS
+	assert make_entry(expires_at=now + timedelta(days=1)).plan_limit(now) == 100
+
+
+
+def test_invalidation_reaches_other_processes_through_the_shared_cache():
+	from django.test import override_settings
+	from subscriptions.auth_cache import AuthCache, shared_cache_configured
+
+	# Two processes sharing Django's cache: the Django app revokes, the API reads
+	views_process, api_process = AuthCache(ttl=60), AuthCache(ttl=60)
+	entry = api_process.put("d1", make_entry())
+	other = api_process.put("d2", make_entry())
+	views_process.invalidate_key(entry.key_id)
+	assert api_process.get("d1") is None and api_process.get("d2") is other
+	views_process.invalidate_user(other.user_id)
+	assert api_process.get("d2") is None
+
+	# A per-process memory cache cannot carry the stamps, so caching stays off there
+	assert not shared_cache_configured() and AuthCache().ttl == 0
+	redis = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://cache:6379/0"}}
+	with override_settings(CACHES=redis):
+		assert shared_cache_configured() and AuthCache().ttl > 0
+
+def test_hot_key_authenticates_without_queries(monkeypatch):
+	from api_modules.dark_api.quota import quota
+	from api_modules.dark_api.ratelimit import rate_limiter
+	from api_modules.dark_api.router import _check_api_key, _reserve_request
+	from subscriptions.auth_cache import auth_cache
+
+	# As with a shared CACHE_URL backend
+	monkeypatch.setattr(auth_cache, "ttl", 60)
+
+	raw = "hot-key"
+	entry = auth_cache.put(hashlib.sha256(raw.encode()).hexdigest(), make_entry(daily_requests=2))
+	today = timezone.now().date()
+	quota.used(entry.user_id, today, lambda: 1)
+	try:
+		with CaptureQueriesContext(connection) as queries:
+			user, key = _check_api_key(raw)
+			_, _, admission = _reserve_request(raw, "/v1/dark/search")
+		assert len(queries) == 0 and key is entry.key_record
+		for check in (_check_api_key, lambda k: _reserve_request(k, "/v1/dark/search")):
+			with pytest.raises(HTTPException) as exc:
+				check(raw)
+			assert exc.value.status_code == 429 and int(exc.value.headers["Retry-After"]) > 0
+		# The slot of a request denied by the daily limit is handed back
+		assert rate_limiter.stats()["active_searches"] == 1
+		assert admission["tier"] == "pro"
+		admission["slot"].release()
+		assert _check_api_key(raw, enforce_limit=False)[0] is entry.user
+		admission["reservation"].refund()
+		assert _check_api_key(raw)[0] is entry.user
+	finally:
+		auth_cache.clear()
+		quota._users.clear()
+		rate_limiter._buckets.clear()
+
+
+
+def test_verify_at_the_limit_returns_429_with_retry_after(client, monkeypatch):
+	from api_modules.dark_api.quota import quota
+	from subscriptions.auth_cache import auth_cache
+
+	monkeypatch.setattr(auth_cache, "ttl", 60)
+
+	raw = "verify-key"
+	entry = auth_cache.put(hashlib.sha256(raw.encode()).hexdigest(), make_entry(daily_requests=2))
+	today = timezone.now().date()
+	quota.used(entry.user_id, today, lambda: 2)
+	try:
+		r = client.get("/v1/dark/verify", headers={"x-api-key": raw})
+		assert r.status_code == 429 and int(r.headers["retry-after"]) > 0
+	finally:
+		auth_cache.clear()
+		quota._users.clear()
+
+def test_key_user_plan_and_usage_resolve_in_one_query(subscription_tables):
+	from accounts.models import SupabaseUser
+	from api_modules.dark_api.quota import quota
+	from api_modules.dark_api.router import _authenticate
+	from subscriptions.auth_cache import auth_cache
+	from subscriptions.models import APIKey, APIUsage, SubscriptionPlan, UserSubscription
+
+	user = SupabaseUser.objects.create(id=uuid.uuid4(), wallet_address="wallet-1")
+	pro = SubscriptionPlan.objects.create(name="pro", daily_requests=1000)
+	free = SubscriptionPlan.objects.create(name="free", daily_requests=10)
+	UserSubscription.objects.create(user_id=user.id, plan=free, status="canceled")
+	UserSubscription.objects.create(user_id=user.id, plan=pro, expires_at=timezone.now() + timedelta(days=30))
+	raw = "resolved-key"
+	key = APIKey.objects.create(user_id=user.id, name="k", key_hash=hashlib.sha256(raw.encode()).hexdigest())
+	today = timezone.now().date()
+	for endpoint, n in (("/v1/dark/search", 3), ("/v1/dark/jobs", 2)):
+		APIUsage.objects.create(user_id=user.id, api_key=key, endpoint=endpoint, date=today, request_count=n)
+	try:
+		with CaptureQueriesContext(connection) as queries:
+			entry = _authenticate(raw)
+			used = quota.used(user.id, today, lambda: pytest.fail("usage was not seeded"))
+		assert len(queries) == 1
+		assert entry.user.wallet_address == "wallet-1" and entry.plan_name == "pro" and entry.daily_requests == 1000
+		assert used == 5
+		with pytest.raises(HTTPException) as exc:
+			_authenticate("unknown-key")
+		assert exc.value.status_code == 401
+	finally:
+		auth_cache.clear()
+		quota._users.clear()
@@ -0,0 +1,89 @@
+import json
+
+import anyio
+import numpy as np
+from httpx import AsyncClient, ASGITransport
+from starlette.applications import Starlette
+from starlette.responses import StreamingResponse
+from starlette.routing import Route
+
+from api_modules.common import compression
+from api_modules.common.compression import CompressionMiddleware, choose_encoding
+from api_modules.common.fastjson import FastJSONResponse, dumps
+
+
+def test_choose_encoding(monkeypatch):
+	monkeypatch.setattr(compression, "BROTLI_AVAILABLE", False)
+	assert choose_encoding("gzip, deflate, br") == "gzip"
+	assert choose_encoding("br;q=1.0, gzip;q=0") is None
+	assert choose_encoding("identity") is None and choose_encoding("") is None
+	monkeypatch.setattr(compression, "BROTLI_AVAILABLE", True)
+	assert choose_encoding("gzip, br") == "br"
+	assert choose_encoding("gzip;q=1, br;q=0.5") == "gzip"
+	assert choose_encoding("*") == "br"
+
+
+def test_fast_json_matches_stdlib():
+	report = {"results": [{"url": "http://x.onion", "relevance_score": np.float64(1.25), "title": "ü"}], 1: None}
+	expected = {"results": [{"url": "http://x.onion", "relevance_score": 1.25, "title": "ü"}], "1": None}
+	assert json.loads(dumps(report)) == expected
+	assert dumps({"a": 1}, indent=True).startswith(b"{\n  ")
+
+
+def test_middleware_compresses_large_bodies_only(monkeypatch):
+	monkeypatch.setattr(compression, "BROTLI_AVAILABLE", False)
+	report = {"results": [{"url": f"http://p{i}.onion", "links": ["http://x.onion/a"] * 50} for i in range(50)]}
+
+	async def big(request):
+		return FastJSONResponse(report)
+
+	async def small(request):
+		return FastJSONResponse({"ok": True})
+
+	async def stream(request):
+		async def gen():
+			for i in range(3):
+				yield b'{"event":"result"}\n' * 200
+		return StreamingResponse(gen(), media_type="application/x-ndjson")
+
+	app = CompressionMiddleware(Starlette(routes=[Route("/big", big), Route("/small", small), Route("/stream", stream)]))
+
+	async def fetch(path, encoding="gzip, br"):
+		async with AsyncClient(transport=ASGITransport(app=app), base_url="http://t") as ac:
+			resp = await ac.get(path, headers={"accept-encoding": encoding})
+			return resp.headers, resp.content
+
+	headers, body = anyio.run(fetch, "/big")
+	assert headers["content-encoding"] == "gzip" and headers["vary"] == "Accept-Encoding"
+	assert json.loads(body) == report and int(headers["content-length"]) < len(dumps(report)) / 5
+	assert "content-encoding" not in anyio.run(fetch, "/small")[0]
+	assert "content-encoding" not in anyio.run(fetch, "/big", "identity")[0]
+	headers, body = anyio.run(fetch, "/stream")
+	assert "content-encoding" not in headers and body.count(b"\n") == 600
+
+
+def test_real_app_compresses_through_logging_middleware(client):
+	from starlette.middleware import Middleware
+	from api_modules.app import LoggingMiddleware
+
+	# LoggingMiddleware (BaseHTTPMiddleware) re-sends bodies in several messages
+	resp = client.get("/openapi.json", headers={"accept-encoding": "gzip"})
+	assert resp.status_code == 200 and resp.headers["content-encoding"] == "gzip"
+	assert "x-process-time" in resp.headers and resp.json()["info"]["title"]
+
+	async def stream(request):
+		async def gen():
+			for i in range(3):
+				yield b'{"event":"result"}\n' * 200
+		return StreamingResponse(gen(), media_type="text/event-stream")
+
+	app = Starlette(routes=[Route("/stream", stream)],
+	                middleware=[Middleware(CompressionMiddleware), Middleware(LoggingMiddleware)])
+
+	async def fetch():
+		async with AsyncClient(transport=ASGITransport(app=app), base_url="http://t") as ac:
+			resp = await ac.get("/stream", headers={"accept-encoding": "gzip"})
+			return resp.headers, resp.content
+
+	headers, body = anyio.run(fetch)
+	assert "content-encoding" not in headers and body.count(b"\n") == 600
@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from api_modules.dark_api import scraper
+
+# Hostile inputs that made the original patterns backtrack or rescan
+N = 20000
+ADVERSARIAL = {
+	"digits": "1" * N,
+	"digit_separators": "1-2 3.4 " * (N // 8),
+	"phone_fragments": "9241 +" * (N // 6),
+	"parens": "+1 (23) 4 " * (N // 10),
+	"alnum": "a" * N,
+	"alnum_dots": "a." * (N // 2),
+	"at_then_run": "a@" + "b" * N,
+	"xmr_like": ("4" + "A" * 200 + " ") * (N // 202),
+	"pgp_unterminated": "-----BEGIN PGP PUBLIC KEY BLOCK-----\n" * (N // 37),
+}
+
+PATTERNS = dict(scraper.TOKEN_PATTERNS, pgp_keys=scraper.PGP_RE)
+
+# Milliseconds allowed per pattern for one N-sized adversarial input
+BUDGET_MS = {
+	"emails": 300,
+	"phones": 300,
+	"pgp_keys": 100,
+	"btc_addresses": 100,
+	"eth_addresses": 100,
+	"xmr_addresses": 100,
+	"ibans": 100,
+	"credit_cards": 100,
+}
+
+RECALL = {
+	"emails": ["admin@example.com", "first.last+tag@mail.co.uk", "x_y%z@sub-domain.io"],
+	"btc_addresses": ["1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa", "3J98t1WpEZ73CNmQviecrnyiWrnqRhWNLy",
+					  "bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4"],
+	"eth_addresses": ["0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed"],
+	"xmr_addresses": ["44AFFq5kSiGBoZ4NMDwYtN18obc8AemS33DBLWs3H7otXft3XjrpDtQGv7SqSsaBYBb98uNbr2VBBEt7f2wfn3RVGQBEP3A"],
+	"phones": ["+1 (555) 010-9999", "+44 20 7946 0958", "555.123.4567", "+49-30-1234567"],
+	"ibans": ["DE89370400440532013000", "GB82WEST12345698765432"],
+	"credit_cards": ["4111111111111111", "5500000000000004", "340000000000009"],
+}
+
+
+@pytest.mark.parametrize("name", sorted(PATTERNS))
+def test_pattern_time_budget(name):
+	pattern = PATTERNS[name]
+	for label, text in ADVERSARIAL.items():
+		start = time.perf_counter()
+		pattern.findall(text)
+		elapsed_ms = (time.perf_counter() - start) * 1000
+		assert elapsed_ms < BUDGET_MS[name], f"{name} took {elapsed_ms:.0f}ms on {label}"
+
+
+@pytest.mark.parametrize("name", sorted(RECALL))
+def test_pattern_recall(name):
+	for sample in RECALL[name]:
+		entities = scraper.extract_entities(f"contact: {sample} (verified)")
+		assert sample in entities[name], sample
+
+
+def test_pgp_block_recall():
+	block = "-----BEGIN PGP PUBLIC KEY BLOCK-----\nmQINBF\n=abcd\n-----END PGP PUBLIC KEY BLOCK-----"
+	text = "-----BEGIN PGP PUBLIC KEY BLOCK-----\ntruncated " + block
+	assert scraper.extract_entities(text)["pgp_keys"] == [block]
@@ -0,0 +1,105 @@
+import asyncio
+
+from api_modules.dark_api.jobs import JobManager
+
+
+async def fake_scrape(keyword, on_event=None, pages=3, delay=0.02, **kwargs):
+	if keyword == "nothing":
+		return {"error": "No links found", "keyword": keyword}
+	if keyword == "boom":
+		raise RuntimeError("browser crashed")
+	on_event({"type": "stage", "stage": "discovery", "session_id": "s1"})
+	on_event({"type": "links", "total": pages})
+	for i in range(pages):
+		await asyncio.sleep(delay)
+		on_event({"type": "result", "index": i, "result": {"url": str(i), "term_stats": {"tf": {}, "length": 1}}})
+	return {"session_id": "s1", "keyword": keyword, "results": [{"url": str(i)} for i in range(pages)]}
+
+
+def test_job_runs_in_background_with_progress():
+	async def scenario():
+		manager = JobManager(workers=1, runner=fake_scrape)
+		job = manager.submit("u1", {"keyword": "leak"})
+		assert job.status == "queued"
+		assert not await manager.wait(job, timeout=0.03)
+		mid = job.summary()
+		assert await manager.wait(job, timeout=2)
+		await manager.shutdown()
+		return mid, job
+
+	mid, job = asyncio.run(scenario())
+	assert mid["status"] == "running" and mid["progress"]["pages_total"] == 3
+	assert job.status == "done" and job.pages_done == 3 and job.session_id == "s1"
+	assert len(job.report["results"]) == 3
+
+
+def test_failed_jobs_and_ownership():
+	async def scenario():
+		manager = JobManager(workers=2, runner=fake_scrape)
+		empty = manager.submit("u1", {"keyword": "nothing"})
+		crash = manager.submit("u1", {"keyword": "boom"})
+		await manager.wait(empty, 1)
+		await manager.wait(crash, 1)
+		stats = manager.stats()
+		await manager.shutdown()
+		return manager, empty, crash, stats
+
+	manager, empty, crash, stats = asyncio.run(scenario())
+	assert empty.status == "failed" and empty.error == "No links found"
+	assert crash.status == "failed" and "crashed" in crash.error
+	assert stats["jobs"]["failed"] == 2
+	assert manager.get(empty.id, user_id="u1") is empty
+	assert manager.get(empty.id, user_id="u2") is None
+
+
+def test_stream_sends_results_then_summary():
+	import json
+	from api_modules.dark_api.streaming import job_event_stream
+
+	async def scenario():
+		manager = JobManager(workers=1, runner=fake_scrape)
+		job = manager.submit("u1", {"keyword": "leak"})
+		lines = [json.loads(chunk) async for chunk in job_event_stream(job, "ndjson", heartbeat=0.005)]
+		await manager.shutdown()
+		return lines
+
+	lines = asyncio.run(scenario())
+	events = [line["event"] for line in lines if line["event"] != "heartbeat"]
+	assert events[0] == "accepted" and events[-1] == "summary"
+	results = [line for line in lines if line["event"] == "result"]
+	assert [line["index"] for line in results] == [0, 1, 2]
+	assert all("term_stats" not in line["result"] for line in results)
+	assert "heartbeat" in [line["event"] for line in lines]
+	assert [r["url"] for r in lines[-1]["ranking"]] == ["0", "1", "2"] and "results" not in lines[-1]
+
+
+def test_stream_rejects_drop_validation(client):
+	body = {"keyword": "leak", "validate_entities": "drop"}
+	resp = client.post("/v1/dark/search/stream", json=body, headers={"x-api-key": "any"})
+	assert resp.status_code == 422 and "drop" in resp.json()["detail"]
+
+
+def test_identical_searches_share_one_pipeline():
+	calls = []
+
+	async def counting_scrape(**kwargs):
+		calls.append(kwargs["keyword"])
+		return await fake_scrape(**kwargs)
+
+	async def scenario():
+		manager = JobManager(workers=2, runner=counting_scrape)
+		params = {"keyword": "Leak", "max_results": 5, "depth": 0}
+		first = manager.submit("u1", params)
+		await asyncio.sleep(0.03)
+		second = manager.submit("u2", dict(params, keyword="  leak "))
+		other = manager.submit("u2", dict(params, depth=1))
+		await manager.wait(second, 2)
+		await manager.wait(other, 2)
+		stats = manager.stats()
+		await manager.shutdown()
+		return first, second, stats
+
+	first, second, stats = asyncio.run(scenario())
+	assert len(calls) == 2 and stats["coalesced"] == 1
+	assert second.coalesced_with == first.id and second.user_id == "u2"
+	assert second.status == "done" and second.report is first.report and second.pages_done == 3
@@ -0,0 +1,36 @@
+import pytest
+
+from api_modules.dark_api.projection import parse_fields, project_report
+
+
+def make_report(pages=5, links=30):
+	results = [{
+		"url": f"http://p{i}.onion", "title": f"page {i}", "ok": True,
+		"links": [f"http://p{i}.onion/{j}" for j in range(links)],
+		"entities": {"emails": ["a@b.c"], "pgp_keys": ["-----BEGIN PGP"], "btc_addresses": []},
+	} for i in range(pages)]
+	return {"session_id": "s1", "keyword": "leak", "timestamp": "t", "results": results}
+
+
+def test_fields_and_pages():
+	report = make_report()
+	spec = parse_fields("title, entities.emails")
+	out = project_report(report, spec, offset=3, limit=10)
+	assert [r["url"] for r in out["results"]] == ["http://p3.onion", "http://p4.onion"]
+	assert out["results"][0] == {"url": "http://p3.onion", "title": "page 3", "entities": {"emails": ["a@b.c"]}}
+	assert out["pagination"] == {"offset": 3, "limit": 10, "total": 5, "next_offset": None}
+	assert out["session_id"] == "s1" and len(report["results"][3]) == 5
+
+
+def test_links_page_and_defaults():
+	report = make_report(pages=3)
+	out = project_report(report, parse_fields("links"), limit=2, links_offset=10, links_limit=5)
+	assert out["results"][0]["links"] == [f"http://p0.onion/{j}" for j in range(10, 15)]
+	assert out["results"][0]["links_total"] == 30 and out["pagination"]["next_offset"] == 2
+	full = project_report(report)
+	assert full["results"] == report["results"] and full["results"][0] is not report["results"][0]
+	assert parse_fields("entities,entities.emails")["entities"] is None
+	with pytest.raises(ValueError):
+		parse_fields("html")
+	with pytest.raises(ValueError):
+		parse_fields("title.emails")
@@ -0,0 +1,55 @@
+import asyncio
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from api_modules.dark_api.jobs import JobManager
+
+TODAY = datetime.date(2024, 1, 1)
+
+
+def test_burst_never_exceeds_limit():
+	from api_modules.dark_api.quota import QuotaCounter
+	quota = QuotaCounter()
+
+	def attempt(_):
+		return quota.reserve("u1", "k1", "/v1/dark/search", TODAY, 10, lambda: 3)
+
+	with ThreadPoolExecutor(16) as pool:
+		admitted = [r for r in pool.map(attempt, range(50)) if r is not None]
+	assert len(admitted) == 7 and quota.stats()["denied"] == 43
+	admitted[0].refund()
+	admitted[0].refund()
+	assert quota.used("u1", TODAY, lambda: 3) == 9
+	assert quota.reserve("u1", "k1", "/v1/dark/search", TODAY, 10, lambda: 3) is not None
+	assert quota.reserve("u1", "k1", "/v1/dark/search", TODAY, 10, lambda: 3) is None
+
+
+def test_jobs_commit_or_refund_their_reservation():
+	from api_modules.dark_api.quota import QuotaCounter
+	from api_modules.dark_api.usage import usage_buffer
+
+	async def scrape(keyword, on_event=None, **kwargs):
+		if keyword == "nothing":
+			return {"error": "No links found", "keyword": keyword}
+		on_event({"type": "links", "total": 1})
+		if keyword == "boom":
+			raise RuntimeError("browser crashed")
+		return {"session_id": "s1", "keyword": keyword, "results": []}
+
+	quota = QuotaCounter()
+	before = usage_buffer.pending("u1", TODAY)
+
+	async def scenario():
+		manager = JobManager(workers=2, runner=scrape)
+		jobs = [manager.submit("u1", {"keyword": k}, quota.reserve("u1", "k1", "/v1/dark/jobs", TODAY, 10, lambda: 0))
+		        for k in ("leak", "nothing", "boom")]
+		for job in jobs:
+			await manager.wait(job, 2)
+		await manager.shutdown()
+		return jobs
+
+	done, empty, crashed = asyncio.run(scenario())
+	assert done.reservation.settled == "committed" and crashed.reservation.settled == "committed"
+	assert empty.reservation.settled == "refunded"
+	assert quota.used("u1", TODAY, lambda: 0) == 2 and usage_buffer.pending("u1", TODAY) - before == 2
+	usage_buffer._swap()
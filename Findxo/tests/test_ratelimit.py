@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from api_modules.dark_api.jobs import JobManager
+from api_modules.dark_api.ratelimit import PlanLimits, RateLimited, RateLimiter, parse_limits
+
+
+def test_key_and_user_buckets_per_tier():
+	assert parse_limits("free=0.2:2:1, Pro=5:20:5")["pro"] == PlanLimits(5.0, 20.0, 5)
+	limiter = RateLimiter({"free": PlanLimits(0.5, 2, 10), "pro": PlanLimits(50, 20, 20)}, user_keys=2)
+
+	limiter.acquire("u1", "k1", "free")
+	limiter.acquire("u1", "k1", None)
+	with pytest.raises(RateLimited) as exc:
+		limiter.acquire("u1", "k1", "free")
+	assert exc.value.reason == "key_rate" and exc.value.retry_after == 2
+
+	# A second key has its own bucket, but shares the user's (twice one key's burst)
+	limiter.acquire("u1", "k2", "free")
+	limiter.acquire("u1", "k2", "free")
+	with pytest.raises(RateLimited) as exc:
+		limiter.acquire("u1", "k3", "free")
+	assert exc.value.reason == "user_rate"
+
+	# Unknown plans get the free limits; plan names are case-insensitive
+	limiter.acquire("u2", "k4", "gold")
+	limiter.acquire("u2", "k4", "gold")
+	with pytest.raises(RateLimited):
+		limiter.acquire("u2", "k4", "gold")
+	for _ in range(20):
+		limiter.acquire("u3", "k5", "Pro")
+	assert limiter.stats()["denied"] == {"key_rate": 2, "user_rate": 1, "concurrency": 0}
+
+
+def test_concurrent_searches_are_released_when_jobs_finish():
+	limiter = RateLimiter({"free": PlanLimits(100, 100, 2)})
+	release = asyncio.Event()
+
+	async def scrape(keyword, on_event=None, **kwargs):
+		await release.wait()
+		return {"session_id": "s1", "keyword": keyword, "results": []}
+
+	async def scenario():
+		manager = JobManager(workers=4, runner=scrape)
+		jobs = [manager.submit("u1", {"keyword": k}, slot=limiter.acquire("u1", "k1", "free")) for k in ("a", "b")]
+		with pytest.raises(RateLimited) as exc:
+			limiter.acquire("u1", "k1", "free")
+		assert exc.value.reason == "concurrency"
+		# Other users are not affected
+		limiter.acquire("u2", "k2", "free").release()
+		release.set()
+		for job in jobs:
+			await manager.wait(job, 2)
+		jobs[0].slot.release()
+		assert limiter.stats()["active_searches"] == 0
+		limiter.acquire("u1", "k1", "free")
+		await manager.shutdown()
+
+	asyncio.run(scenario())
@@ -0,0 +1,85 @@
+import asyncio
+
+from api_modules.dark_api.jobs import JobManager
+from api_modules.dark_api.scheduler import FairScheduler, parse_weights
+
+
+async def _served_order(scheduler, requests):
+	"""Queue `requests` ((user, tier) pairs) behind a held slot and return the order they are served in."""
+	order = []
+
+	async def scrape(user, tier):
+		async with scheduler.slot(user, tier):
+			order.append(user)
+			await asyncio.sleep(0)
+
+	await scheduler.acquire("holder")
+	tasks = [asyncio.create_task(scrape(user, tier)) for user, tier in requests]
+	await asyncio.sleep(0)
+	scheduler.release()
+	await asyncio.gather(*tasks)
+	return order
+
+
+def test_users_and_tiers_share_slots_by_weight():
+	assert parse_weights("free=1, Pro=4") == {"free": 1.0, "pro": 4.0}
+
+	async def scenario():
+		scheduler = FairScheduler(slots=1, weights={"free": 1, "pro": 3})
+		# A user with a long job queued first no longer makes a later one wait it out
+		order = await _served_order(scheduler, [("a", "free")] * 6 + [("b", "free")] * 2)
+		assert order == ["a", "b", "a", "b", "a", "a", "a", "a"]
+		# Three times the weight, three times the share while both wait
+		order = await _served_order(scheduler, [("f", "free")] * 6 + [("p", "pro")] * 6)
+		assert order[:8].count("p") == 6
+		stats = scheduler.stats()
+		assert stats["busy"] == 0 and stats["waiting"] == 0
+		assert stats["tiers"]["pro"]["granted"] == 6 and stats["tiers"]["pro"]["wait_p95_ms"] is not None
+
+	asyncio.run(scenario())
+
+
+def test_cancelled_waiters_and_jobs_release_their_slots():
+	async def scrape(keyword, on_event=None, gate=None, **kwargs):
+		for _ in range(3):
+			async with gate():
+				await asyncio.sleep(0.01)
+		return {"session_id": "s1", "keyword": keyword, "results": []}
+
+	async def scenario():
+		scheduler = FairScheduler(slots=1)
+		await scheduler.acquire("u1")
+		waiter = asyncio.create_task(scheduler.acquire("u2"))
+		await asyncio.sleep(0)
+		waiter.cancel()
+		await asyncio.gather(waiter, return_exceptions=True)
+		scheduler.release()
+		assert scheduler.busy == 0
+
+		manager = JobManager(workers=4, runner=scrape, scheduler=scheduler)
+		jobs = [manager.submit("u1", {"keyword": "a"}, tier="pro"),
+		        manager.submit("u2", {"keyword": "b"}, tier="free")]
+		for job in jobs:
+			await manager.wait(job, 2)
+		await manager.shutdown()
+		assert [job.status for job in jobs] == ["done", "done"]
+		stats = scheduler.stats()
+		assert stats["busy"] == 0
+		# Three pages each; the slot taken above without a tier counts as free
+		assert stats["tiers"]["pro"]["granted"] == 3 and stats["tiers"]["free"]["granted"] == 4
+
+	asyncio.run(scenario())
+
+
+def test_zero_slots_never_queue():
+	async def scenario():
+		scheduler = FairScheduler(slots=0)
+		for user in ("u1", "u2", "u3"):
+			await asyncio.wait_for(scheduler.acquire(user), 1)
+		stats = scheduler.stats()
+		assert stats["busy"] == 3 and stats["waiting"] == 0
+		for _ in range(3):
+			scheduler.release()
+		assert scheduler.busy == 0
+
+	asyncio.run(scenario())
@@ -0,0 +1,187 @@
+import asyncio
+
+from api_modules.dark_api import scraper
+
+
+def test_keyword_context_merges_overlapping_windows():
+	text = "alpha leak beta leak gamma " + "x" * 500 + " delta LEAK epsilon"
+	contexts = scraper.find_keyword_context(text, "leak", window=20)
+	assert len(contexts) == 2
+	assert contexts[0].count("**leak**") == 2
+	assert "**LEAK**" in contexts[1]
+
+
+def test_keyword_context_offsets_match_excerpt():
+	text = "start\n\n  the   Leak  was\tbig " + "y" * 400 + " another leak here"
+	contexts = scraper.find_keyword_context(text, "leak", window=15, offsets=True)
+	assert len(contexts) == 2
+	first = contexts[0]
+	assert "  " not in first["text"]
+	assert [first["text"][s:e] for s, e in first["highlights"]] == ["Leak"]
+	assert text[first["start"]:first["end"]].lower().count("leak") == 1
+
+
+def test_keyword_context_window_starts_at_or_before_its_match():
+	# The first window is capped at offset 5, inside the second match (4..7)
+	text = "key key tail"
+	contexts = scraper.find_keyword_context(text, "key", window=2, max_span=6, offsets=True)
+	assert [(c["start"], c["end"]) for c in contexts] == [(0, 5), (4, 9)]
+	for c in contexts:
+		assert text[c["start"]:c["end"]].startswith("key")
+		assert [c["text"][s:e] for s, e in c["highlights"]] == ["key"]
+
+
+def test_keyword_context_stops_at_limit():
+	text = " ".join(f"item{i} secret" for i in range(5000))
+	contexts = scraper.find_keyword_context(text, "secret", window=5, limit=3)
+	assert len(contexts) == 3
+	assert scraper.find_keyword_context(text, "", window=5) == []
+
+
+def test_extraction_executor_thread_mode():
+	from api_modules.dark_api.extraction import ExtractionExecutor
+
+	payload = {
+		"url": "http://example.onion/",
+		"html": '<html><head><title>T</title></head><body><a href="/x">x</a></body></html>',
+		"text": "contact admin@example.com about the leak",
+		"keyword": "leak",
+	}
+	result = asyncio.run(ExtractionExecutor(workers=0).extract(payload))
+	assert result["title"] == "T"
+	assert result["links"] == ["http://example.onion/x"]
+	assert result["entities"]["emails"] == ["admin@example.com"]
+	assert result["keywords_found"]
+
+
+def test_extraction_timeout_only_replaces_its_own_worker(tmp_path):
+	import os
+	import pytest
+	from api_modules.dark_api.extraction import ExtractionExecutor, ExtractionTimeout
+
+	# Opening a FIFO nobody writes to blocks the worker until it is killed
+	hung = tmp_path / "hung.html"
+	os.mkfifo(hung)
+	ok_page = {"url": "http://ok.onion/", "html": "<title>ok</title>" + "<p>leak</p>" * 200,
+	           "text": "leak " * 200, "keyword": "leak"}
+
+	async def scenario():
+		executor = ExtractionExecutor(workers=2, timeout=30)
+		await executor.warm_up()
+		executor.timeout = 3
+		try:
+			hung_task = asyncio.create_task(executor.extract({"url": "http://hung.onion/", "html_path": str(hung), "text_path": str(hung)}))
+			await asyncio.sleep(0.2)
+			ok = await executor.extract(ok_page)
+			with pytest.raises(ExtractionTimeout):
+				await hung_task
+			after = await executor.extract(ok_page)
+			return ok, after, executor.stats()
+		finally:
+			executor.shutdown()
+
+	ok, after, stats = asyncio.run(scenario())
+	assert ok["title"] == "ok" and after["title"] == "ok"
+	assert stats["recycled"] == 1
+
+
+def test_streaming_entities_span_chunk_boundaries():
+	pgp = "-----BEGIN PGP PUBLIC KEY BLOCK-----\n" + "Q" * 3000 + "\n-----END PGP PUBLIC KEY BLOCK-----"
+	text = ("filler " * 300 + "mail admin@example.com btc 1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa " + pgp + " ") * 5
+	expected = scraper.extract_entities(text)
+	extractor = scraper.StreamingEntityExtractor(overlap=256)
+	for i in range(0, len(text), 1000):
+		extractor.feed(text[i:i + 1000])
+	extractor.feed("", final=True)
+	result = extractor.result()
+	for field in expected:
+		assert sorted(result[field]) == sorted(expected[field]), field
+	assert len(result["pgp_keys"]) == 5
+
+
+def test_process_page_streaming_reads_capped_files(tmp_path):
+	from api_modules.dark_api.extraction import process_page
+
+	html_path, text_path = tmp_path / "p.html", tmp_path / "p.txt"
+	html, info = scraper.cap_text("<html><title>Big</title><body>" + "é" * 5000 + "</body></html>", 4000)
+	assert info["truncated"] and info["bytes"] <= 4000
+	html_path.write_text(html, encoding="utf-8")
+	text_path.write_text("x " * 1000 + "the leak admin@example.com", encoding="utf-8")
+	result = process_page({"url": "http://a.onion/", "html_path": str(html_path),
+						   "text_path": str(text_path), "keyword": "leak"})
+	assert result["title"] == "Big"
+	assert result["entities"]["emails"] == ["admin@example.com"]
+	assert "**leak**" in result["keywords_found"][0]
+
+
+def test_streaming_links_match_the_parsed_ones(tmp_path, monkeypatch):
+	from api_modules.dark_api.extraction import process_page
+
+	body = "".join(f'<p>{"filler " * 40}<a class="x" href="/p{i}?a=1&amp;b=2">{i}</a> '
+				   f"<a href='http://other.onion/{i}'>o</a> <A HREF=q{i}>q</A></p>" for i in range(60))
+	html = f"<html><head><title>Links</title><meta name='description' content='d'></head><body>{body}</body></html>"
+	html_path, text_path = tmp_path / "p.html", tmp_path / "p.txt"
+	html_path.write_text(html, encoding="utf-8")
+	text_path.write_text("text", encoding="utf-8")
+	# Many small chunks, so links straddle chunk boundaries
+	monkeypatch.setattr(scraper, "STREAM_CHUNK_CHARS", 700)
+	result = process_page({"url": "http://a.onion/dir/", "html_path": str(html_path), "text_path": str(text_path)})
+	expected = scraper.extract_meta_from_html(html, base_url="http://a.onion/dir/")
+	assert result["links"] == expected["links"] and len(expected["links"]) == 180
+	assert (result["title"], result["meta_description"]) == ("Links", "d")
+
+
+def test_language_sample_is_bounded_and_cached():
+	from api_modules.dark_api import language
+
+	text = ("The quick brown fox jumps over the lazy dog near the river bank. " * 2000)
+	sample = language.sample_text(text, max_chars=400)
+	assert len(sample) <= 400 + language.LANG_SAMPLE_SEGMENTS
+	assert sample == language.sample_text(text, max_chars=400)
+	if not language.LANGDETECT_AVAILABLE:
+		return
+	assert language.detect_language(text) == "en"
+	assert language.detect_language(text) == "en"
+	assert language.detect_language("   ") is None
+
+
+def test_streaming_language_sample_spans_all_chunks():
+	from api_modules.dark_api import language
+
+	sampler = language.StreamingLanguageSample(max_chars=400, segments=4)
+	chunks = [f"chunk{i:03d} " + "x" * 500 for i in range(100)]
+	for chunk in chunks:
+		sampler.feed(chunk)
+	sample, key = sampler.result()
+	assert len(sample) <= 400 + 4 and len(sampler.slices) < 8
+	# The first chunk and one from the last stretch of the text are both sampled
+	assert "chunk000" in sample and any(f"chunk{i:03d}" in sample for i in range(64, 100))
+	assert key == language.content_key("".join(chunks))
+
+
+def test_bm25_ranks_session_results():
+	from api_modules.dark_api import ranking
+
+	terms = ranking.query_terms("Credit card")
+	pages = [
+		{"url": "a", "term_stats": ranking.term_stats("nothing relevant here " * 20, terms)},
+		{"url": "b", "term_stats": ranking.term_stats("credit card dumps, fresh card lists " * 5, terms)},
+		{"url": "c", "ok": False},
+		{"url": "d", "term_stats": ranking.term_stats("a credit union page " * 30, terms)},
+	]
+	ranked = ranking.rank_results(pages, "Credit card")
+	assert [r["url"] for r in ranked] == ["b", "d", "a", "c"]
+	assert ranked[0]["relevance_score"] > ranked[1]["relevance_score"] > 0
+	assert ranked[2]["relevance_score"] == 0.0 and "term_stats" not in ranked[0]
+
+
+def test_streaming_term_stats_match_full_text():
+	from api_modules.dark_api import ranking
+
+	text = "leak data " * 997 + "leaky leak"
+	expected = ranking.term_stats(text, ["leak", "data"])
+	stats = ranking.StreamingTermStats(["leak", "data"])
+	for i in range(0, len(text), 37):
+		stats.feed(text[i:i + 37])
+	stats.feed("", final=True)
+	assert stats.result() == expected
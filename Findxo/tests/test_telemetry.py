@@ -0,0 +1,56 @@
+import pytest
+
+from api_modules.dark_api.telemetry import FetchTelemetry
+
+
+def test_aggregates_by_host_and_tor_endpoint():
+	t = FetchTelemetry(max_samples=100)
+	for ms in (100, 200, 300, 400):
+		t.record("page", "fast.onion", "127.0.0.1:9050", connect_ms=ms / 2, ttfb_ms=ms, total_ms=ms * 2, nbytes=1000)
+	t.record("page", "slow.onion", "127.0.0.1:9052", ttfb_ms=5000, total_ms=9000, nbytes=50)
+	t.record("page", "slow.onion", "127.0.0.1:9052", ok=False, total_ms=60000)
+
+	by_host = t.aggregate("host")
+	assert [row["host"] for row in by_host] == ["slow.onion", "fast.onion"]
+	slow, fast = by_host
+	assert slow["count"] == 2 and slow["errors"] == 1 and slow["error_rate"] == 0.5
+	assert slow["connect_ms"] is None
+	assert fast["ttfb_ms"] == {"mean": 250.0, "p50": 300.0, "p95": 400.0}
+	assert fast["bytes_total"] == 4000 and fast["bytes_mean"] == 1000
+
+	by_tor = {row["tor"]: row for row in t.aggregate("tor")}
+	assert by_tor["127.0.0.1:9050"]["count"] == 4
+
+	with pytest.raises(ValueError):
+		t.aggregate("url")
+
+
+def test_store_is_bounded_and_windowed(monkeypatch):
+	t = FetchTelemetry(max_samples=10)
+	for i in range(25):
+		t.record("engine", "ahmia.fi", total_ms=i)
+	assert len(t.samples()) == 10
+	assert t.aggregate("kind")[0]["total_ms"]["p50"] == 20.0
+	monkeypatch.setattr("api_modules.dark_api.telemetry.time.time", lambda: 10 ** 12)
+	assert t.aggregate("kind", window=60) == []
+
+
+def test_endpoint_is_operator_only(client, monkeypatch):
+	from api_modules.dark_api import router
+
+	assert client.get("/v1/dark/telemetry", headers={"x-api-key": "customer-key"}).status_code == 403
+	monkeypatch.setattr(router, "OPERATOR_TOKEN", "op-secret")
+	assert client.get("/v1/dark/telemetry", headers={"x-operator-token": "wrong"}).status_code == 403
+	resp = client.get("/v1/dark/telemetry?group_by=kind", headers={"x-operator-token": "op-secret"})
+	assert resp.status_code == 200 and resp.json()["group_by"] == "kind"
+
+
+def test_status_shows_internals_to_operators_only(client, monkeypatch):
+	from api_modules.dark_api import router
+
+	monkeypatch.setattr(router, "OPERATOR_TOKEN", "op-secret")
+	public = {"status": "operational", "engine": "multi-hybrid-v2"}
+	assert client.get("/v1/dark/status").json() == public
+	assert client.get("/v1/dark/status", headers={"x-operator-token": "wrong"}).json() == public
+	internal = client.get("/v1/dark/status", headers={"x-operator-token": "op-secret"}).json()
+	assert {"tor", "jobs", "quota", "rate_limits", "scheduler"} <= internal.keys()
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from api_modules.dark_api import tor_control
+
+pytestmark = pytest.mark.skipif(not tor_control.STEM_AVAILABLE, reason="stem not installed")
+
+
+class FakeEvent:
+	status = "BUILT"
+	purpose = "GENERAL"
+
+
+class FakeController:
+	def __init__(self, build_delay=0.0):
+		self.alive = True
+		self.signals = []
+		self.listeners = []
+		self.build_delay = build_delay
+
+	def is_alive(self):
+		return self.alive
+
+	def signal(self, sig):
+		if not self.alive:
+			raise tor_control.SocketError("closed")
+		self.signals.append(sig)
+		for listener in list(self.listeners):
+			threading.Timer(self.build_delay, listener, (FakeEvent(),)).start()
+
+	def add_event_listener(self, listener, *events):
+		self.listeners.append(listener)
+
+	def remove_event_listener(self, listener):
+		self.listeners.remove(listener)
+
+	def get_version(self):
+		return "0.4.8.9"
+
+	def get_info(self, key, default=None):
+		return {"status/circuit-established": "1"}.get(key, default)
+
+	def close(self):
+		self.alive = False
+
+
+def test_rotation_reuses_connection_and_reconnects():
+	client = tor_control.TorControlClient(address="127.0.0.1:9051")
+	made = []
+
+	def connect():
+		made.append(FakeController())
+		return made[-1]
+
+	client._connect = connect
+
+	async def scenario():
+		assert (await client.rotate())[0]
+		assert (await client.rotate())[0]
+		# tor restarted: is_alive() still reports True until the socket is used
+		made[0].alive = False
+		made[0].is_alive = lambda: True
+		assert (await client.rotate())[0]
+		return await client.status()
+
+	status = asyncio.run(scenario())
+	assert len(made) == 2
+	assert len(made[0].signals) == 2 and len(made[1].signals) == 1
+	assert status["connected"] and status["circuit_established"] and status["rotations"] == 3
+
+
+def test_unconfigured_client_does_not_connect():
+	client = tor_control.TorControlClient(address="")
+	ok, msg = asyncio.run(client.rotate())
+	assert not ok and "not configured" in msg
+	assert asyncio.run(client.status())["connected"] is False
+
+
+def test_rotation_waits_for_circuit_and_respects_rate_limit(monkeypatch):
+	monkeypatch.setattr(tor_control, "TOR_NEWNYM_INTERVAL", 0.3)
+	client = tor_control.TorControlClient(address="127.0.0.1:9051")
+	fake = FakeController(build_delay=0.05)
+	client._connect = lambda: fake
+
+	async def scenario():
+		started = time.monotonic()
+		first = await client.rotate(timeout=2)
+		second = await client.rotate(timeout=2)
+		return first, second, time.monotonic() - started
+
+	first, second, elapsed = asyncio.run(scenario())
+	assert first[0] and "new circuit" in first[1]
+	assert second[0] and client.rate_limited == 1
+	# Two rotations: one spacing interval plus two circuit builds, far below fixed sleeps
+	assert 0.3 <= elapsed < 1.5
+	assert 0.04 <= client.last_rotation_wait < 1
+	assert fake.listeners == []
+
+
+def test_queued_rotations_share_the_next_newnym(monkeypatch):
+	monkeypatch.setattr(tor_control, "TOR_NEWNYM_INTERVAL", 0.2)
+	client = tor_control.TorControlClient(address="127.0.0.1:9051")
+	fake = FakeController()
+	client._connect = lambda: fake
+
+	async def scenario():
+		await client.rotate(timeout=1)
+		# Both arrive while the spacing delay holds back the next NEWNYM
+		return await asyncio.gather(client.rotate(timeout=1), client.rotate(timeout=1))
+
+	results = asyncio.run(scenario())
+	assert all(ok for ok, _ in results)
+	assert len(fake.signals) == 2 and client.coalesced == 1
+
+
+def test_rotation_times_out_without_circuit():
+	client = tor_control.TorControlClient(address="127.0.0.1:9051")
+	fake = FakeController()
+	fake.add_event_listener = lambda *a: None
+	fake.remove_event_listener = lambda *a: None
+	client._connect = lambda: fake
+	ok, msg = asyncio.run(client.rotate(timeout=0.1))
+	assert ok and "no new circuit" in msg and client.wait_timeouts == 1
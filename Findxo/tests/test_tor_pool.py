@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from api_modules.dark_api.tor_pool import NoTorInstance, TorInstance, TorPool
+
+
+def make_pool(strategy="least_loaded"):
+	return TorPool([TorInstance("127.0.0.1:9050"), TorInstance("127.0.0.1:9052"),
+					TorInstance("127.0.0.1:9054")], strategy=strategy)
+
+
+def test_least_loaded_spreads_concurrent_leases():
+	pool = make_pool()
+
+	async def scenario():
+		async with pool.lease() as a, pool.lease() as b, pool.lease() as c:
+			assert {a.socks, b.socks, c.socks} == {i.socks for i in pool.instances}
+			async with pool.lease() as d:
+				assert d.active == 2
+		return [i.active for i in pool.instances]
+
+	assert asyncio.run(scenario()) == [0, 0, 0]
+
+
+def test_latency_strategy_prefers_fast_instance():
+	pool = make_pool("latency")
+	pool.instances[0].record(10.0)
+	pool.instances[1].record(1.0)
+	pool.instances[2].record(4.0)
+	assert pool.select().socks == "127.0.0.1:9052"
+	pool.instances[1].active = 5
+	assert pool.select().socks == "127.0.0.1:9054"
+
+
+def test_unhealthy_and_draining_instances_are_skipped():
+	pool = make_pool()
+	for _ in range(3):
+		pool.instances[0].record(ok=False)
+	assert not pool.instances[0].healthy
+	pool.drain("127.0.0.1:9052")
+	assert pool.select().socks == "127.0.0.1:9054"
+	pool.drain("127.0.0.1:9054")
+	# No healthy instance left: fall back to the unhealthy but undrained one
+	assert pool.select().socks == "127.0.0.1:9050"
+	pool.drain("127.0.0.1:9050")
+	with pytest.raises(NoTorInstance):
+		pool.select()
+
+
+def test_health_check_marks_unreachable_instances():
+	async def scenario():
+		server = await asyncio.start_server(lambda r, w: w.close(), "127.0.0.1", 0)
+		live = "127.0.0.1:%d" % server.sockets[0].getsockname()[1]
+		pool = TorPool([TorInstance(live), TorInstance("127.0.0.1:1")])
+		await pool.check_health()
+		server.close()
+		return [i.healthy for i in pool.instances]
+
+	assert asyncio.run(scenario()) == [True, False]
+
+
+def test_stats_serve_the_last_health_check():
+	calls = []
+
+	class FakeControl:
+		configured = True
+		address = "127.0.0.1:9051"
+
+		async def status(self):
+			calls.append(1)
+			return {"connected": True, "circuit_established": True}
+
+	async def scenario():
+		server = await asyncio.start_server(lambda r, w: w.close(), "127.0.0.1", 0)
+		inst = TorInstance("127.0.0.1:%d" % server.sockets[0].getsockname()[1])
+		inst.control = FakeControl()
+		pool = TorPool([inst])
+		await pool.check_health()
+		server.close()
+		return pool
+
+	pool = asyncio.run(scenario())
+	for _ in range(5):
+		stats = pool.stats()
+	# Status requests never reach the control port; only the health check does
+	assert len(calls) == 1 and stats["instances"][0]["control_status"]["circuit_established"]
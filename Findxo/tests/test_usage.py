@@ -0,0 +1,103 @@
+import uuid
+
+import pytest
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+
+
+def total(APIUsage, **filters):
+	return APIUsage.objects.filter(**filters).aggregate(t=Sum("request_count"))["t"] or 0
+
+
+def create_daily_indexes():
+	# Same partial indexes as find/scripts/019_api_usage_daily_unique.sql
+	with connection.cursor() as cursor:
+		cursor.execute("CREATE UNIQUE INDEX api_usage_daily_key ON api_usage(user_id, api_key_id, endpoint, date) "
+					   "WHERE api_key_id IS NOT NULL")
+		cursor.execute("CREATE UNIQUE INDEX api_usage_daily_nokey ON api_usage(user_id, endpoint, date) "
+					   "WHERE api_key_id IS NULL")
+
+
+@pytest.mark.parametrize("upsert", [True, False])
+def test_buffer_flushes_increments_in_batches(subscription_tables, upsert):
+	from api_modules.dark_api.usage import UsageBuffer
+	from subscriptions.models import APIKey, APIUsage
+	if upsert:
+		create_daily_indexes()
+	user_id = uuid.uuid4()
+	key = APIKey.objects.create(user_id=user_id, name="k", key_hash=uuid.uuid4().hex)
+	today = timezone.now().date()
+	buffer = UsageBuffer(upsert=upsert)
+
+	for _ in range(5):
+		buffer.add(user_id, key.id, "/v1/dark/search", today)
+	buffer.add(user_id, key.id, "/v1/dark/jobs", today, 2)
+	used = timezone.now()
+	buffer.touch(key.id, used)
+	assert buffer.pending(user_id, today) == 7
+	assert buffer.flush() == 7 and buffer.pending(user_id, today) == 0
+	for _ in range(3):
+		buffer.add(user_id, key.id, "/v1/dark/search", today)
+	assert buffer.flush() == 3
+
+	assert total(APIUsage, endpoint="/v1/dark/search") == 8 and total(APIUsage, endpoint="/v1/dark/jobs") == 2
+	assert APIUsage.objects.count() == 2
+	assert APIKey.objects.get(id=key.id).last_used_at == used
+	assert buffer.upsert is upsert and buffer.stats()["errors"] == 0
+
+
+def test_failed_flush_keeps_pending_usage():
+	from api_modules.dark_api.usage import UsageBuffer
+	buffer = UsageBuffer(upsert=False)
+	user_id = uuid.uuid4()
+	today = timezone.now().date()
+	buffer.add(user_id, None, "/v1/dark/search", today, 4)
+	# No api_usage table here: the write fails and the increments stay queued
+	assert buffer.flush() == 0
+	assert buffer.pending(user_id, today) == 4 and buffer.stats()["errors"] == 1
+
+
+@pytest.mark.parametrize("upsert", [True, False])
+def test_usage_without_a_key_lands_on_one_row(subscription_tables, upsert):
+	from api_modules.dark_api.usage import UsageBuffer
+	from subscriptions.models import APIUsage
+	if upsert:
+		create_daily_indexes()
+	user_id = uuid.uuid4()
+	today = timezone.now().date()
+	buffer = UsageBuffer(upsert=upsert)
+	for n in (2, 3):
+		buffer.add(user_id, None, "/v1/dark/search", today, n)
+		assert buffer.flush() == n
+
+	assert APIUsage.objects.count() == 1 and total(APIUsage, api_key_id=None) == 5
+	assert buffer.upsert is upsert
+
+
+def test_transient_error_keeps_the_upsert():
+	from api_modules.dark_api.usage import UsageBuffer
+	buffer = UsageBuffer(upsert=True)
+	user_id = uuid.uuid4()
+	today = timezone.now().date()
+	buffer.add(user_id, None, "/v1/dark/search", today, 4)
+	# A missing table is not a missing unique index: retry later, still upserting
+	assert buffer.flush() == 0
+	assert buffer.upsert is True and buffer.pending(user_id, today) == 4
+
+
+def test_pending_counts_rows_until_committed(subscription_tables):
+	from api_modules.dark_api.usage import UsageBuffer
+	buffer = UsageBuffer(upsert=False)
+	user_id = uuid.uuid4()
+	today = timezone.now().date()
+	write, seen = buffer._write, []
+
+	def observed_write(counts, last_used):
+		seen.append(buffer.pending(user_id, today))
+		write(counts, last_used)
+
+	buffer._write = observed_write
+	buffer.add(user_id, None, "/v1/dark/search", today, 3)
+	assert buffer.flush() == 3
+	assert seen == [3] and buffer.pending(user_id, today) == 0
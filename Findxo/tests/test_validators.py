@@ -0,0 +1,39 @@
+from api_modules.dark_api import validators
+from api_modules.dark_api.scraper import extract_entities
+
+
+def test_keccak256_empty():
+	assert validators.keccak256(b"").hex() == "c5d2460186f7233c927e7db2dcc703c0e500b653ca82273b7bfad8045d85a470"
+
+
+def test_checksums():
+	assert validators.is_valid_btc("1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa")
+	assert not validators.is_valid_btc("1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNb")
+	assert validators.is_valid_btc("bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4")
+	assert not validators.is_valid_btc("bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t5")
+	assert validators.is_valid_eth("0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed")
+	assert not validators.is_valid_eth("0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAeD")
+	xmr = "44AFFq5kSiGBoZ4NMDwYtN18obc8AemS33DBLWs3H7otXft3XjrpDtQGv7SqSsaBYBb98uNbr2VBBEt7f2wfn3RVGQBEP3A"
+	assert validators.is_valid_xmr(xmr)
+	assert not validators.is_valid_xmr(xmr[:-1] + "B")
+	assert validators.luhn_ok("4111111111111111")
+	assert not validators.luhn_ok("4111111111111112")
+	assert validators.is_valid_iban("DE89370400440532013000")
+	assert not validators.is_valid_iban("DE89370400440532013001")
+
+
+def test_validate_session_flag_and_drop():
+	text = "pay 1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa or 1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNb iban DE89370400440532013000"
+	entities = extract_entities(text)
+	assert "DE89370400440532013000" in entities["ibans"]
+
+	flagged = [{"entities": dict(entities)}, {"entities": dict(entities)}]
+	summary = validators.validate_session_entities(flagged, mode="flag")
+	assert summary["invalid"] == 1
+	assert flagged[0]["invalid_entities"] == {"btc_addresses": ["1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNb"]}
+	assert len(flagged[0]["entities"]["btc_addresses"]) == 2
+
+	dropped = [{"entities": dict(entities)}]
+	validators.validate_session_entities(dropped, mode="drop")
+	assert dropped[0]["entities"]["btc_addresses"] == ["1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa"]
+	assert "invalid_entities" not in dropped[0]
@@ -0,0 +1,43 @@
+import asyncio
+
+from api_modules.dark_api import warmup
+
+
+def test_warmup_records_steps_and_becomes_ready(monkeypatch):
+	async def ok():
+		await asyncio.sleep(0.01)
+
+	async def broken():
+		raise RuntimeError("tor down")
+
+	class Stub:
+		def __init__(self, coro):
+			self.coro = coro
+
+		def warm_up(self):
+			return self.coro()
+
+		def get(self):
+			return self.coro()
+
+	monkeypatch.setattr(warmup, "get_extraction_executor", lambda: Stub(ok))
+	monkeypatch.setattr(warmup, "get_browser_manager", lambda: Stub(ok))
+	monkeypatch.setattr(warmup, "_warm_tor", broken)
+
+	state = warmup.WarmupState()
+	assert not state.ready
+	asyncio.run(warmup.warm_up(state))
+	snap = state.snapshot()
+	assert snap["ready"]
+	assert snap["steps"]["extraction"]["ok"] and snap["steps"]["browser"]["ok"]
+	assert snap["steps"]["tor"] == {"ok": False, "error": "tor down", "seconds": snap["steps"]["tor"]["seconds"]}
+
+
+def test_ready_endpoint_reports_warmup(client, monkeypatch):
+	state = warmup.WarmupState()
+	monkeypatch.setattr("api_modules.app.warmup_state", state)
+	r = client.get("/ready")
+	assert r.status_code == 503 and r.json()["status"] == "not ready"
+	state.finished_at = 1.0
+	r = client.get("/ready")
+	assert r.status_code == 200 and r.json()["status"] == "ready"
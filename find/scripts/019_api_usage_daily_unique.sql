@@ -0,0 +1,40 @@
+-- One usage row per user, API key, endpoint and day, so the API can write
+-- buffered usage as INSERT ... ON CONFLICT DO UPDATE increments.
+-- Concurrent get_or_create calls could insert duplicates: merge them first.
+
+BEGIN;
+
+WITH merged AS (
+  SELECT user_id, api_key_id, endpoint, date,
+         SUM(request_count) AS total,
+         MIN(id::text)::uuid AS keep_id
+  FROM public.api_usage
+  GROUP BY user_id, api_key_id, endpoint, date
+  HAVING COUNT(*) > 1
+)
+UPDATE public.api_usage u
+SET request_count = m.total
+FROM merged m
+WHERE u.id = m.keep_id;
+
+DELETE FROM public.api_usage u
+USING public.api_usage k
+WHERE u.user_id = k.user_id
+  AND u.api_key_id IS NOT DISTINCT FROM k.api_key_id
+  AND u.endpoint = k.endpoint
+  AND u.date = k.date
+  AND u.id::text > k.id::text;
+
+-- NULLs never conflict in a unique index, so usage recorded without an API
+-- key gets its own partial index on the remaining columns.
+DROP INDEX IF EXISTS public.idx_api_usage_daily_unique;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_api_usage_daily_key_unique
+  ON public.api_usage(user_id, api_key_id, endpoint, date)
+  WHERE api_key_id IS NOT NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_api_usage_daily_nokey_unique
+  ON public.api_usage(user_id, endpoint, date)
+  WHERE api_key_id IS NULL;
+
+COMMIT;